@@ -10,11 +10,60 @@ def create_app():
 
     # Crée le dossier uploads si absent
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    os.makedirs(app.config["DATA_FOLDER"], exist_ok=True)
 
     # Enregistre les routes
     from routes.main import bp as main_bp
+    from routes.api import bp as api_bp
+    from routes.assets import bp as assets_bp
 
     app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(assets_bp)
+
+    # Mesures des requêtes et endpoint /metrics
+    if app.config["METRICS_ENABLED"]:
+        from services import metrics
+        from routes.metrics import bp as metrics_bp
+
+        metrics.init_app(app)
+        app.register_blueprint(metrics_bp)
+
+    # Purge des liens partagés expirés en arrière-plan
+    if app.config["LINK_EXPIRY_SCHEDULER"]:
+        from services.expiry import expiry_scheduler
+
+        expiry_scheduler.start()
+
+    # Écriture périodique des statistiques des liens partagés
+    if app.config["ANALYTICS_ENABLED"] and app.config["ANALYTICS_FLUSH_ON_TIMER"]:
+        from services.analytics import get_share_analytics
+
+        get_share_analytics().start()
+
+    # Threads d'exécution des tâches longues (suppressions, déplacements)
+    if app.config["JOB_WORKERS_ON_STARTUP"]:
+        from services.jobs import get_job_queue
+
+        get_job_queue().start()
+
+    # Lance l'extraction des métadonnées des morceaux en arrière-plan
+    if app.config["CATALOG_SCAN_ON_STARTUP"]:
+        from services.catalog import get_catalog
+
+        get_catalog().scan_async()
+
+    # Recalcule l'espace occupé par dossier en arrière-plan
+    if app.config["USAGE_SCAN_ON_STARTUP"]:
+        from services.usage import get_usage_index
+
+        get_usage_index().scan_async()
+
+    # Construit l'index de recherche de la bibliothèque en arrière-plan
+    if app.config["SEARCH_INDEX_ON_STARTUP"]:
+        from services.search_index import get_search_index, catalog_tags
+
+        get_search_index().build_async(catalog_tags)
 
     return app
 
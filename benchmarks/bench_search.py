@@ -0,0 +1,99 @@
+# benchmarks/bench_search.py
+# Mesure le temps de recherche et la mémoire de l'index sur une bibliothèque fictive.
+#
+#   python benchmarks/bench_search.py [--files 100000] [--budget-ms 1]
+#
+# L'index est rempli directement (sans fichiers sur le disque) avec des
+# chemins « Artiste/Album/NN Titre.ext » et leurs tags, tirés d'un vocabulaire
+# aléatoire. Le temps médian des
+# requêtes sélectives doit rester sous le budget.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.search_index import SearchIndex  # noqa: E402
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyzéèàç'
+EXTENSIONS = ['.mp3', '.flac', '.wav', '.ogg', '.m4a']
+
+
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(LETTERS) for _ in range(rng.randint(3, 10))).capitalize())
+    return sorted(words)
+
+
+def fill(index, files, rng, vocabulary):
+    # Mots des titres tirés selon une loi de Zipf (quelques mots très fréquents)
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    artists = [' '.join(rng.sample(vocabulary, 2)) for _ in range(max(files // 200, 1))]
+    added = 0
+    while added < files:
+        artist = rng.choice(artists)
+        album = ' '.join(rng.choices(vocabulary, cum_weights=weights, k=2))
+        index.add(f'{artist}/{album}', is_dir=True)
+        for track in range(1, rng.randint(8, 14)):
+            title = ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4)))
+            path = f'{artist}/{album}/{track:02d} {title}{rng.choice(EXTENSIONS)}'
+            index.add(path, tags_text=f'{title} {artist} {album}')
+            added += 1
+    return artists
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de recherche et mémoire de l'index de recherche.")
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    index = SearchIndex('.')
+    started = time.perf_counter()
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    artists = fill(index, args.files, rng, vocabulary)
+    build_seconds = time.perf_counter() - started
+
+    # Requêtes réalistes : début d'un nom d'artiste tapé sans accents,
+    # éventuellement suivi d'un mot de titre
+    queries = []
+    for _ in range(args.queries):
+        artist = rng.choice(artists).split()[0]
+        query = artist[:rng.randint(4, len(artist))] if len(artist) > 4 else artist
+        if rng.random() < 0.5:
+            query += ' ' + rng.choice(vocabulary)
+        queries.append(query.translate(str.maketrans('éèàç', 'eeac')))
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    stats = index.stats()
+    result = {
+        'benchmark': 'search_index',
+        'files': args.files,
+        'words': stats['words'],
+        'build_seconds': round(build_seconds, 3),
+        'memory_bytes': stats['memory_bytes'],
+        'query_median_ms': round(statistics.median(timings), 4),
+        'query_p95_ms': round(timings[int(len(timings) * 0.95)], 4),
+        'budget_ms': args.budget_ms,
+    }
+    print(json.dumps(result, indent=2))
+    if result['query_median_ms'] > args.budget_ms:
+        sys.exit("Budget de temps dépassé.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_waveform.py
+# Mesure la mémoire utilisée par le calcul des pics sur un WAV d'une heure.
+#
+#   python benchmarks/bench_waveform.py [--minutes 60] [--budget-mb 32]
+#
+# Le fichier est creux (sparse) : il occupe peu de place sur le disque mais
+# est lu en entier par le calcul. Le pic de mémoire résidente du processus
+# (ru_maxrss, qui compte aussi les pages du fichier projeté en mémoire) doit
+# augmenter de moins que le budget, quelle que soit la durée. Le pic
+# d'allocation Python/NumPy (tracemalloc) est donné à titre indicatif.
+import os
+import sys
+import json
+import time
+import struct
+import resource
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.waveform import compute_wav_peaks  # noqa: E402
+
+
+def write_sparse_wav(path, minutes, rate=44100, channels=2, bits=16):
+    block_align = channels * bits // 8
+    data_size = rate * 60 * minutes * block_align
+    fmt = struct.pack('<HHIIHH', 1, channels, rate, rate * block_align, block_align, bits)
+    header = (b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + data_size) + b'WAVE'
+              + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', data_size))
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + data_size)
+    return data_size
+
+
+# Pic de mémoire résidente du processus, en octets (ko sous Linux)
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mémoire du calcul des pics sur un long WAV.")
+    parser.add_argument('--minutes', type=int, default=60)
+    parser.add_argument('--budget-mb', type=float, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'long.wav')
+        data_size = write_sparse_wav(path, args.minutes)
+        rss_before = peak_rss()
+        tracemalloc.start()
+        started = time.perf_counter()
+        peaks = compute_wav_peaks(path)
+        elapsed = time.perf_counter() - started
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_peak = peak_rss()
+
+    result = {
+        'benchmark': 'waveform_peaks',
+        'minutes': args.minutes,
+        'data_bytes': data_size,
+        'buckets': len(peaks) // 2,
+        'seconds': round(elapsed, 3),
+        'peak_rss_bytes': rss_peak,
+        'peak_rss_increase_bytes': rss_peak - rss_before,
+        'peak_traced_bytes': peak_bytes,
+        'budget_bytes': int(args.budget_mb * 1024 * 1024),
+    }
+    print(json.dumps(result, indent=2))
+    if result['peak_rss_increase_bytes'] > result['budget_bytes']:
+        sys.exit("Budget mémoire dépassé.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+# benchmarks/run.py
+# Suite de benchmarks reproductible : listing, rendu de l'index, liens
+# partagés, envois et lectures partielles (Range).
+#
+#   python benchmarks/run.py [--sizes 1000,10000,100000] [--layouts flat,deep]
+#                            [--links 10,1000,100000] [--output results.json]
+#   python benchmarks/run.py --quick                       # petites tailles
+#   python benchmarks/run.py --compare before.json after.json
+#
+# Chaque bibliothèque est générée dans un dossier temporaire (graine fixe) :
+# « flat » met tous les fichiers dans un seul dossier, « deep » les répartit
+# en Artiste/Album/morceau. Les fichiers de liens partagés sont au format
+# JSON historique (shared_links.json), importés par le store au démarrage.
+# Les résultats (médiane, p95, min en millisecondes, débits) sont écrits en
+# JSON avec le commit mesuré, pour comparer deux commits entre eux.
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from config import Config  # noqa: E402
+
+FILE_BYTES = 256
+FILES_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 8
+RANGE_FILE_BYTES = 32 * 1024 * 1024
+UPLOAD_BYTES = 8 * 1024 * 1024
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(percentile(timings, 0.95), 4),
+        'min_ms': round(min(timings), 4),
+    }
+
+
+# --- Données synthétiques --------------------------------------------------
+
+def generate_library(upload_folder, files, layout, rng):
+    busiest = _write_library(upload_folder, files, layout, rng)
+    # Dossiers datés dans le passé : sinon l'index des dossiers les considère
+    # comme en cours de modification et ne garde pas leur liste en cache
+    past = time.time() - 60
+    for root, _, _ in os.walk(upload_folder):
+        os.utime(root, (past, past))
+    return busiest
+
+
+def _write_library(upload_folder, files, layout, rng):
+    # Retourne le dossier le plus peuplé (celui qui est mesuré)
+    payload = bytes(FILE_BYTES)
+    if layout == 'flat':
+        for i in range(files):
+            with open(os.path.join(upload_folder, f'track_{i:06d}_{rng.randrange(10**6)}.mp3'), 'wb') as f:
+                f.write(payload)
+        return ''
+    created = 0
+    busiest = None
+    artist = 0
+    while created < files:
+        for album in range(ALBUMS_PER_ARTIST):
+            album_dir = os.path.join(upload_folder, f'Artist {artist:04d}', f'Album {album:02d}')
+            os.makedirs(album_dir, exist_ok=True)
+            busiest = busiest or f'Artist {artist:04d}/Album {album:02d}'
+            for track in range(FILES_PER_ALBUM):
+                if created >= files:
+                    break
+                with open(os.path.join(album_dir, f'{track + 1:02d} Song {rng.randrange(10**6)}.flac'), 'wb') as f:
+                    f.write(payload)
+                created += 1
+        artist += 1
+    return busiest
+
+
+def generate_links(path, count, targets, rng):
+    now = datetime.now(timezone.utc)
+    links = {}
+    for i in range(count):
+        token = f'{rng.getrandbits(128):032x}'
+        item = rng.choice(targets)
+        links[token] = {
+            'link_name': f'Partage {i}',
+            'item_name': item,
+            'is_directory': False,
+            'creation_date': now.isoformat(),
+            'expiry_date': (now + timedelta(hours=48)).isoformat(),
+        }
+    with open(path, 'w') as f:
+        json.dump(links, f)
+    return list(links)
+
+
+# --- Environnement de l'application ----------------------------------------
+
+BACKGROUND_FLAGS = ('LINK_EXPIRY_SCHEDULER', 'ANALYTICS_FLUSH_ON_TIMER')
+
+def configure(workdir):
+    Config.UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+    Config.DATA_FOLDER = os.path.join(workdir, 'data')
+    Config.SHARED_LINKS_FILE = os.path.join(workdir, 'shared_links.json')
+    Config.SECRET_KEY = 'benchmark'
+    Config.VIEW_PASSWORD = 'view'
+    Config.EDIT_PASSWORD = 'edit'
+    # Aucune tâche de fond de create_app() pendant les mesures : toutes les
+    # options *_ON_STARTUP, plus les deux qui ne suivent pas ce nom
+    for name in dir(Config):
+        if name.endswith('_ON_STARTUP') or name in BACKGROUND_FLAGS:
+            setattr(Config, name, False)
+    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+
+
+def make_client():
+    from app import create_app
+
+    app = create_app()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/', data={'password': Config.EDIT_PASSWORD})
+    return app, client
+
+
+# Laisse le catalogue terminer les lectures d'en-têtes lancées par un rendu
+def wait_for_catalog():
+    from services.catalog import get_catalog
+
+    catalog = get_catalog()
+    deadline = time.time() + 60
+    while catalog._pending and time.time() < deadline:
+        time.sleep(0.01)
+
+
+# --- Benchmarks ------------------------------------------------------------
+
+def bench_listing(files, layout, repeat, rng):
+    from services.dir_index import directory_index
+    from routes.main import get_files_and_folders
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        started = time.perf_counter()
+        busiest = generate_library(Config.UPLOAD_FOLDER, files, layout, rng)
+        generate_seconds = time.perf_counter() - started
+        app, client = make_client()
+        params = {'files': files, 'layout': layout}
+
+        for path in dict.fromkeys(['', busiest]):
+            def cold():
+                directory_index.clear()
+                get_files_and_folders(path)
+            with app.test_request_context():
+                results.append({'benchmark': 'get_files_and_folders', 'cache': 'cold', 'path_depth': path.count('/') + bool(path),
+                                **params, **measure(cold, repeat)})
+                results.append({'benchmark': 'get_files_and_folders', 'cache': 'warm', 'path_depth': path.count('/') + bool(path),
+                                **params, **measure(lambda: get_files_and_folders(path), repeat)})
+
+            url = '/' + path
+            client.get(url)
+            wait_for_catalog()
+
+            def render():
+                response = client.get(url)
+                assert response.status_code == 200, response.status_code
+            results.append({'benchmark': 'index_render', 'path_depth': path.count('/') + bool(path),
+                            **params, **measure(render, repeat)})
+        directory_index.clear()
+    for result in results:
+        result['generate_seconds'] = round(generate_seconds, 3)
+    return results
+
+
+def bench_shared_links(count, repeat, rng):
+    from services.link_store import get_link_store
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        targets = []
+        for i in range(20):
+            name = f'shared_{i}.mp3'
+            with open(os.path.join(Config.UPLOAD_FOLDER, name), 'wb') as f:
+                f.write(bytes(FILE_BYTES))
+            targets.append(name)
+        tokens = generate_links(Config.SHARED_LINKS_FILE, count, targets, rng)
+
+        # Premier accès : import du JSON historique par le store SQLite
+        started = time.perf_counter()
+        store = get_link_store()
+        store.get(tokens[0])
+        migrate_ms = (time.perf_counter() - started) * 1000
+
+        app, client = make_client()
+        lookups = iter(rng.choice(tokens) for _ in range(repeat + 1))
+
+        def lookup():
+            response = client.get(f'/share/{next(lookups)}')
+            assert response.status_code == 200, response.status_code
+        result = {'benchmark': 'shared_link', 'links': count, 'link_store': Config.LINK_STORE,
+                  'migrate_ms': round(migrate_ms, 3), **measure(lookup, repeat)}
+        lookups = iter(rng.choice(tokens) for _ in range(repeat + 1))
+        direct = {'benchmark': 'link_store_get', 'links': count, 'link_store': Config.LINK_STORE,
+                  **measure(lambda: store.get(next(lookups)), repeat)}
+    return [result, direct]
+
+
+def bench_uploads(repeat, rng):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        app, client = make_client()
+        # Contenus tous différents : la déduplication ne court-circuite pas l'écriture
+        payloads = iter([rng.randbytes(UPLOAD_BYTES) for _ in range(2 * (repeat + 1))])
+        counter = iter(range(10**6))
+
+        def form_upload():
+            data = next(payloads)
+            response = client.post('/', data={'file': (io.BytesIO(data), f'upload_{next(counter)}.mp3')},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 302, response.status_code
+        stats = measure(form_upload, repeat)
+        stats['mb_per_s'] = round(UPLOAD_BYTES / 1024 / 1024 / (stats['median_ms'] / 1000), 2)
+        results.append({'benchmark': 'upload_form', 'bytes': UPLOAD_BYTES, **stats})
+
+        def chunked_upload():
+            data = next(payloads)
+            response = client.post('/api/uploads', json={'path': '', 'filename': f'chunked_{next(counter)}.mp3',
+                                                         'size': len(data)})
+            upload_id = response.get_json()['upload_id']
+            chunk = Config.UPLOAD_CHUNK_SIZE
+            for offset in range(0, len(data), chunk):
+                response = client.put(f'/api/uploads/{upload_id}?offset={offset}', data=data[offset:offset + chunk])
+                assert response.status_code in (200, 201), response.status_code
+        stats = measure(chunked_upload, repeat)
+        stats['mb_per_s'] = round(UPLOAD_BYTES / 1024 / 1024 / (stats['median_ms'] / 1000), 2)
+        results.append({'benchmark': 'upload_chunked', 'bytes': UPLOAD_BYTES,
+                        'chunk_size': Config.UPLOAD_CHUNK_SIZE, **stats})
+    return results
+
+
+def bench_range_reads(repeat, rng):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        configure(workdir)
+        with open(os.path.join(Config.UPLOAD_FOLDER, 'long.wav'), 'wb') as f:
+            f.write(rng.randbytes(RANGE_FILE_BYTES))
+        app, client = make_client()
+
+        for length in (64 * 1024, 1024 * 1024):
+            def read_range():
+                start = rng.randrange(RANGE_FILE_BYTES - length)
+                response = client.get('/uploads/long.wav', headers={'Range': f'bytes={start}-{start + length - 1}'})
+                assert response.status_code == 206 and len(response.get_data()) == length
+            stats = measure(read_range, repeat)
+            stats['mb_per_s'] = round(length / 1024 / 1024 / (stats['median_ms'] / 1000), 2)
+            results.append({'benchmark': 'range_read', 'range_bytes': length,
+                            'file_delivery': Config.FILE_DELIVERY, **stats})
+
+        def full_read():
+            response = client.get('/uploads/long.wav')
+            assert len(response.get_data()) == RANGE_FILE_BYTES
+        stats = measure(full_read, max(repeat // 10, 3))
+        stats['mb_per_s'] = round(RANGE_FILE_BYTES / 1024 / 1024 / (stats['median_ms'] / 1000), 2)
+        results.append({'benchmark': 'full_read', 'bytes': RANGE_FILE_BYTES,
+                        'file_delivery': Config.FILE_DELIVERY, **stats})
+    return results
+
+
+# --- Comparaison -----------------------------------------------------------
+
+def result_key(result):
+    return tuple(sorted((k, v) for k, v in result.items()
+                        if k not in ('runs', 'median_ms', 'p95_ms', 'min_ms', 'mb_per_s',
+                                     'migrate_ms', 'generate_seconds')))
+
+
+def compare(before_path, after_path, threshold):
+    with open(before_path) as f:
+        before = {result_key(r): r for r in json.load(f)['results']}
+    with open(after_path) as f:
+        after = json.load(f)['results']
+    regressions = 0
+    for result in after:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        change = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0
+        label = ' '.join(f'{k}={v}' for k, v in result_key(result) if k != 'benchmark')
+        flag = ''
+        if change > threshold:
+            flag = '  <-- régression'
+            regressions += 1
+        print(f"{result['benchmark']:<24} {label:<48} {old['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms"
+              f" ({change:+.1f} %){flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks : listing, index, liens partagés, envois, Range.")
+    parser.add_argument('--sizes', type=int_list, default=[1000, 10000, 100000])
+    parser.add_argument('--layouts', type=lambda v: v.split(','), default=['flat', 'deep'])
+    parser.add_argument('--links', type=int_list, default=[10, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--only', type=lambda v: v.split(','),
+                        default=['listing', 'links', 'uploads', 'range'])
+    parser.add_argument('--quick', action='store_true', help="petites tailles, pour vérifier la suite")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="fichier JSON (sinon sortie standard)")
+    parser.add_argument('--compare', nargs=2, metavar=('AVANT', 'APRES'))
+    parser.add_argument('--threshold', type=float, default=10, help="régression signalée au-delà (en %%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    if args.quick:
+        args.sizes, args.links, args.repeat = [200], [10, 200], 5
+
+    rng = random.Random(args.seed)
+    results = []
+    if 'listing' in args.only:
+        for files in args.sizes:
+            for layout in args.layouts:
+                results += bench_listing(files, layout, args.repeat, rng)
+    if 'links' in args.only:
+        for count in args.links:
+            results += bench_shared_links(count, args.repeat, rng)
+    if 'uploads' in args.only:
+        results += bench_uploads(max(args.repeat // 5, 3), rng)
+    if 'range' in args.only:
+        results += bench_range_reads(args.repeat, rng)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 # config.py
 import os
+import json
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -11,4 +12,85 @@ class Config:
     EDIT_PASSWORD = os.environ.get('EDIT_PASSWORD')
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 500 * 1024 * 1024))
-    ALLOWED_EXTENSIONS = {'.mp3', '.ogg', '.wav', '.flac', '.m4a'}
\ No newline at end of file
+    ALLOWED_EXTENSIONS = {'.mp3', '.ogg', '.wav', '.flac', '.m4a'}
+    # Données internes de l'application (base des liens partagés, caches...)
+    DATA_FOLDER = os.environ.get('DATA_FOLDER', os.path.join(basedir, 'data'))
+    # Feuille de style construite (python -m services.assets), servie sous /assets/
+    ASSETS_FOLDER = os.environ.get('ASSETS_FOLDER', os.path.join(basedir, 'static', 'dist'))
+    # Stockage des liens partagés : 'sqlite' (recommandé) ou 'json'
+    LINK_STORE = os.environ.get('LINK_STORE', 'sqlite')
+    # Taille des morceaux pour les envois reprenables (doit rester < MAX_CONTENT_LENGTH)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    # Nombre de fichiers par page de liste (la suite est chargée à la demande)
+    LISTING_PAGE_SIZE = int(os.environ.get('LISTING_PAGE_SIZE', 50))
+    LISTING_MAX_PAGE_SIZE = 500
+    # Nombre maximal d'entrées (fichiers + dossiers) gardées dans le cache des dossiers
+    DIR_INDEX_MAX_ENTRIES = int(os.environ.get('DIR_INDEX_MAX_ENTRIES', 200000))
+    # Nombre de contenus de dossiers gardés déjà rendus (pages de dossiers)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 256))
+    # Envoi des fichiers : 'python' (Flask lit le fichier), 'x-sendfile'
+    # (Apache/lighttpd) ou 'x-accel' (nginx) qui délèguent la lecture au proxy
+    FILE_DELIVERY = os.environ.get('FILE_DELIVERY', 'python')
+    # Préfixe de la location interne nginx qui pointe vers UPLOAD_FOLDER
+    X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
+    # Limites de débit des lectures de fichiers (octets/s, 0 = illimité) :
+    # pour tout le processus, par session et par lien partagé, avec une
+    # réserve de BANDWIDTH_BURST_SECONDS secondes de débit au démarrage
+    BANDWIDTH_GLOBAL_LIMIT = int(os.environ.get('BANDWIDTH_GLOBAL_LIMIT', 0))
+    BANDWIDTH_SESSION_LIMIT = int(os.environ.get('BANDWIDTH_SESSION_LIMIT', 0))
+    BANDWIDTH_SHARE_LIMIT = int(os.environ.get('BANDWIDTH_SHARE_LIMIT', 0))
+    BANDWIDTH_BURST_SECONDS = float(os.environ.get('BANDWIDTH_BURST_SECONDS', 1))
+    # Nombre maximal de lectures simultanées par lien partagé (0 = illimité)
+    SHARE_MAX_STREAMS = int(os.environ.get('SHARE_MAX_STREAMS', 0))
+    # Extraction des métadonnées audio : threads dédiés et scan au démarrage
+    CATALOG_WORKERS = int(os.environ.get('CATALOG_WORKERS', 2))
+    CATALOG_SCAN_ON_STARTUP = os.environ.get('CATALOG_SCAN_ON_STARTUP', '1') != '0'
+    # Formes d'onde : nombre de paires (min, max) par fichier et threads de calcul
+    WAVEFORM_BUCKETS = int(os.environ.get('WAVEFORM_BUCKETS', 1000))
+    WAVEFORM_WORKERS = int(os.environ.get('WAVEFORM_WORKERS', 1))
+    # Durée de validité des liens partagés (choisie à la création, en heures)
+    SHARE_DEFAULT_TTL_HOURS = int(os.environ.get('SHARE_DEFAULT_TTL_HOURS', 48))
+    SHARE_TTL_CHOICES_HOURS = [1, 24, 48, 168, 720]
+    SHARE_MAX_TTL_HOURS = int(os.environ.get('SHARE_MAX_TTL_HOURS', 720))
+    # Purge des liens expirés : délai maximal entre deux passes (secondes) et taille des lots
+    LINK_PURGE_INTERVAL = int(os.environ.get('LINK_PURGE_INTERVAL', 300))
+    LINK_PURGE_BATCH_SIZE = 500
+    LINK_EXPIRY_SCHEDULER = os.environ.get('LINK_EXPIRY_SCHEDULER', '1') != '0'
+    # Index de recherche : construit au démarrage, nombre maximal de résultats.
+    # L'index est en mémoire et construit par chaque worker : environ 1 Ko par
+    # fichier de la bibliothèque (96 Mo pour 100 000 fichiers, voir
+    # benchmarks/bench_search.py), à multiplier par le nombre de workers. Sans
+    # construction au démarrage, chaque worker le construit à sa première
+    # recherche.
+    SEARCH_INDEX_ON_STARTUP = os.environ.get('SEARCH_INDEX_ON_STARTUP', '1') != '0'
+    SEARCH_RESULTS_LIMIT = 50
+    # Envois identiques stockés une seule fois (liens physiques)
+    DEDUP_UPLOADS = os.environ.get('DEDUP_UPLOADS', '1') != '0'
+    # Mesures exposées sur /metrics (format Prometheus) : jeton du collecteur
+    # (sinon accès réservé à la session éditeur) et période du profileur
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.01))
+    # File de tâches (suppressions récursives, déplacements) : threads par
+    # processus, délai entre deux vérifications de la file et délai après
+    # lequel une tâche sans nouvelles (processus arrêté) est reprise (secondes)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_WORKERS_ON_STARTUP = os.environ.get('JOB_WORKERS_ON_STARTUP', '1') != '0'
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 60))
+    # Statistiques des liens partagés : écrites par lots toutes les
+    # ANALYTICS_FLUSH_INTERVAL secondes ou après ANALYTICS_FLUSH_EVENTS événements
+    ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', '1') != '0'
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 10))
+    ANALYTICS_FLUSH_EVENTS = int(os.environ.get('ANALYTICS_FLUSH_EVENTS', 1000))
+    ANALYTICS_FLUSH_ON_TIMER = os.environ.get('ANALYTICS_FLUSH_ON_TIMER', '1') != '0'
+    # Quotas d'espace (octets, 0 = aucun) : bibliothèque entière et dossiers
+    # particuliers, par exemple FOLDER_QUOTAS='{"Podcasts": 10737418240}'
+    QUOTA_TOTAL_BYTES = int(os.environ.get('QUOTA_TOTAL_BYTES', 0))
+    FOLDER_QUOTAS = json.loads(os.environ.get('FOLDER_QUOTAS', '{}'))
+    # Durée (secondes) pendant laquelle un envoi en cours garde sa place
+    UPLOAD_RESERVATION_TTL = int(os.environ.get('UPLOAD_RESERVATION_TTL', 24 * 3600))
+    # Calcul de l'espace occupé par dossier au démarrage
+    USAGE_SCAN_ON_STARTUP = os.environ.get('USAGE_SCAN_ON_STARTUP', '1') != '0'
+    # Ancien fichier JSON, importé une seule fois dans la base SQLite
+    SHARED_LINKS_FILE = os.environ.get('SHARED_LINKS_FILE', os.path.join(basedir, 'shared_links.json'))
\ No newline at end of file
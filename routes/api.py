@@ -0,0 +1,240 @@
+# routes/api.py
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Blueprint, request, session, jsonify, url_for
+from config import Config
+from routes.main import get_full_path, get_directory_listing, after_file_upload, search_library, library_path
+from services import uploads
+from services.catalog import get_catalog, describe_track
+from services.file_delivery import guess_mimetype
+from services.waveform import supports as waveform_supported
+from services.search_index import get_search_index
+from services.dedup import get_dedup_index
+from services.jobs import get_job_queue
+from services.usage import get_usage_index, QuotaError
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not session.get('authenticated'):
+            return jsonify({'error': "Authentification requise."}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def editor_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not session.get('editor_mode'):
+            return jsonify({'error': "Accès réservé au mode éditeur."}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.errorhandler(uploads.UploadError)
+def handle_upload_error(e):
+    body = {'error': e.message}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+
+def _upload_target(state):
+    return get_full_path(state['target_dir'])
+
+
+# Démarre un envoi par morceaux : {"path", "filename", "size"}
+@bp.route('/uploads', methods=['POST'])
+@editor_required
+def start_upload():
+    params = request.get_json(silent=True) or {}
+    relative_dir = params.get('path') or ''
+    state = uploads.start_upload(get_full_path(relative_dir), relative_dir,
+                                 params.get('filename'), params.get('size'))
+    # Quotas vérifiés avec la taille annoncée, avant le premier morceau ; la
+    # place est réservée jusqu'à la fin ou l'annulation de l'envoi
+    try:
+        get_usage_index().reserve(state['upload_id'], library_path(get_full_path(relative_dir)), state['total_size'])
+    except QuotaError as e:
+        uploads.abort_upload(_upload_target(state), state)
+        raise uploads.UploadError(str(e), 507)
+    return jsonify({'upload_id': state['upload_id'], 'offset': 0,
+                    'chunk_size': state['chunk_size']}), 201
+
+
+# Position atteinte, pour reprendre un envoi interrompu
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@editor_required
+def upload_status(upload_id):
+    state = uploads.load_upload(upload_id)
+    return jsonify({'upload_id': upload_id, 'offset': uploads.upload_offset(_upload_target(state), state),
+                    'size': state['total_size'], 'chunk_size': state['chunk_size']})
+
+
+# Envoie un morceau : corps brut, position dans ?offset=
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+@editor_required
+def upload_chunk(upload_id):
+    state = uploads.load_upload(upload_id)
+    target_dir = _upload_target(state)
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        raise uploads.UploadError("Paramètre offset requis.")
+
+    offset, final_path = uploads.write_chunk(target_dir, state, offset, request.content_length, request.stream)
+    if final_path is None:
+        return jsonify({'offset': offset, 'complete': False})
+
+    after_file_upload(final_path)
+    get_usage_index().release(upload_id)
+    return jsonify({'offset': offset, 'complete': True, 'filename': os.path.basename(final_path)})
+
+
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@editor_required
+def cancel_upload(upload_id):
+    state = uploads.load_upload(upload_id)
+    uploads.abort_upload(_upload_target(state), state)
+    get_usage_index().release(upload_id)
+    return '', 204
+
+
+# Liste paginée d'un dossier : les dossiers (première page seulement) puis
+# les fichiers du plus récent au plus ancien, par pages de ?limit= après
+# le curseur ?cursor= renvoyé par la page précédente
+@bp.route('/list/', defaults={'current_path': ''})
+@bp.route('/list/<path:current_path>')
+@login_required
+def list_directory(current_path):
+    listing = get_directory_listing(current_path)
+    if listing is None:
+        return jsonify({'error': "Dossier introuvable."}), 404
+    limit = min(max(request.args.get('limit', Config.LISTING_PAGE_SIZE, type=int), 1), Config.LISTING_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    try:
+        entries, next_cursor = listing.page(cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    known = get_catalog().lookup(current_path, entries)
+    files = []
+    for entry in entries:
+        path = f'{current_path}/{entry.name}' if current_path else entry.name
+        files.append({
+            'name': entry.name,
+            'path': path,
+            'url': url_for('main.uploaded_file', filename_or_path=path, _external=True),
+            'mimetype': guess_mimetype(entry.name),
+            'size': entry.stat.st_size,
+            'modified': datetime.fromtimestamp(entry.stat.st_mtime, timezone.utc).isoformat(),
+            'info': describe_track(known[entry.name]) if entry.name in known else None,
+            'peaks_url': url_for('main.waveform_peaks', filename_or_path=path) if waveform_supported(entry.name) else None,
+        })
+    return jsonify({
+        'path': current_path,
+        'folders': None if cursor else listing.folders,
+        'files': files,
+        'total_files': len(listing.files),
+        'next_cursor': next_cursor,
+    })
+
+
+@bp.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', Config.SEARCH_RESULTS_LIMIT, type=int), 1), Config.LISTING_MAX_PAGE_SIZE)
+    return jsonify({
+        'query': query,
+        'results': search_library(query, limit) if query else [],
+    })
+
+
+# Taille de l'index de recherche (chemins, mots, mémoire occupée)
+@bp.route('/search/stats')
+@login_required
+def search_stats():
+    return jsonify(get_search_index().stats())
+
+
+# Espace économisé par la déduplication des envois
+@bp.route('/dedup/report')
+@editor_required
+def dedup_report():
+    return jsonify(get_dedup_index().report())
+
+
+# Chemin relatif normalisé d'un élément de la bibliothèque (None pour la racine)
+def _library_path(relative_path):
+    full_path = get_full_path(relative_path or '')
+    relative_path = get_catalog().relative_path(full_path)
+    return None if relative_path == '.' else relative_path
+
+
+def _job_response(job_id):
+    return jsonify({'job_id': job_id, 'status_url': url_for('api.job_status', job_id=job_id)}), 202
+
+
+# Suppression (récursive) de plusieurs éléments d'un dossier : {"path", "items": [...]}
+@bp.route('/jobs/delete', methods=['POST'])
+@editor_required
+def delete_items():
+    params = request.get_json(silent=True) or {}
+    items = params.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': "Aucun élément sélectionné."}), 400
+    paths = []
+    for name in items:
+        if not isinstance(name, str) or not name or '/' in name or name.startswith('.'):
+            return jsonify({'error': "Nom d'élément invalide."}), 400
+        relative_path = _library_path(os.path.join(params.get('path') or '', name))
+        if relative_path is None or not os.path.lexists(get_full_path(relative_path)):
+            return jsonify({'error': f"Élément introuvable : {name}"}), 404
+        if relative_path not in paths:
+            paths.append(relative_path)
+    return _job_response(get_job_queue().submit('delete', {'paths': paths}))
+
+
+# Déplacement ou renommage d'un élément : {"source", "destination"} (chemins relatifs)
+@bp.route('/jobs/move', methods=['POST'])
+@editor_required
+def move_item():
+    params = request.get_json(silent=True) or {}
+    source = _library_path(params.get('source'))
+    destination = _library_path(params.get('destination'))
+    if source is None or destination is None:
+        return jsonify({'error': "Chemins source et destination requis."}), 400
+    source_path, destination_path = get_full_path(source), get_full_path(destination)
+    if not os.path.lexists(source_path):
+        return jsonify({'error': "Élément introuvable."}), 404
+    if destination == source or destination.startswith(source + '/'):
+        return jsonify({'error': "Impossible de déplacer un dossier dans lui-même."}), 400
+    if any(part.startswith('.') for part in (source + '/' + destination).split('/')):
+        return jsonify({'error': "Nom invalide."}), 400
+    if os.path.isfile(source_path) and os.path.splitext(destination.lower())[1] not in Config.ALLOWED_EXTENSIONS:
+        return jsonify({'error': "Extension de fichier non autorisée."}), 400
+    if os.path.lexists(destination_path):
+        return jsonify({'error': "Un élément existe déjà à cet emplacement."}), 409
+    if not os.path.isdir(os.path.dirname(destination_path)):
+        return jsonify({'error': "Dossier de destination introuvable."}), 404
+    return _job_response(get_job_queue().submit('move', {'source': source, 'destination': destination}))
+
+
+# Avancement d'une tâche (interrogé régulièrement par la page)
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return jsonify({'error': "Tâche introuvable."}), 404
+    return jsonify(status)
+
+
+@bp.route('/jobs')
+@editor_required
+def list_jobs():
+    return jsonify({'jobs': get_job_queue().recent()})
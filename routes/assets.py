@@ -0,0 +1,44 @@
+# routes/assets.py
+import os
+from flask import Blueprint, request, send_file, url_for, abort
+from werkzeug.utils import safe_join
+
+from config import Config
+from services.assets import get_manifest
+from services.file_delivery import guess_mimetype
+
+bp = Blueprint('assets', __name__)
+
+# Un an : le nom du fichier change avec son contenu
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Variantes précompressées, par ordre de préférence
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# Dans les templates : <link href="{{ asset_url('app.css') }}">
+@bp.app_template_global()
+def asset_url(name):
+    return url_for('assets.asset', filename=get_manifest()['assets'][name])
+
+
+# Fichiers construits (nom avec empreinte), servis avec la variante
+# compressée acceptée par le client
+@bp.route('/assets/<filename>')
+def asset(filename):
+    path = safe_join(Config.ASSETS_FOLDER, filename)
+    if path is None or filename.endswith(('.gz', '.br', '.json')) or not os.path.isfile(path):
+        abort(404, "Fichier non trouvé.")
+
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+
+    response = send_file(path, mimetype=guess_mimetype(filename), conditional=True, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -1,29 +1,35 @@
 # routes/main.py
 import os
-import json
+import time
 import secrets
-from flask import Blueprint, request, render_template, redirect, send_from_directory, session, abort, url_for
+from flask import Blueprint, Response, request, render_template, redirect, session, abort, url_for, current_app, make_response, g
+from markupsafe import Markup
 from datetime import datetime, timedelta, timezone
 from config import Config
+from services.link_store import get_link_store, link_list_cache
+from services.expiry import expiry_scheduler
+from services.zipstream import zip_directory, content_disposition
+from services.dir_index import directory_index
+from services.file_delivery import deliver_file, file_etag, guess_mimetype
+from services.uploads import save_upload
+from services.dedup import get_dedup_index
+from services.catalog import get_catalog, describe_track
+from services.waveform import get_waveform_store, supports as waveform_supported
+from services.search_index import get_search_index, catalog_tags
+from services.metrics import timed
+from services.page_cache import listing_etag, fragment_cache, templates_stamp
+from services.bandwidth import bandwidth_scheduler
+from services.analytics import get_share_analytics
+from services.usage import get_usage_index, format_size, QuotaError
+from services.assets import get_manifest
+from services import jobs
+from services.jobs import get_job_queue
 
 bp = Blueprint('main', __name__)
 
-SHARED_LINKS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared_links.json'))
-
-# Fonctions pour gérer le fichier JSON des liens partagés
-def read_shared_links():
-    try:
-        with open(SHARED_LINKS_FILE, 'r') as f:
-            links = json.load(f)
-            if not isinstance(links, dict):
-                return {}
-            return links
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
-def write_shared_links(links):
-    with open(SHARED_LINKS_FILE, 'w') as f:
-        json.dump(links, f, indent=4)
+# Type MIME des lecteurs audio dans les templates
+bp.add_app_template_global(guess_mimetype, 'audio_mimetype')
+bp.add_app_template_filter(format_size, 'format_size')
 
 # Fonction utilitaire pour obtenir le chemin complet sécurisé
 def get_full_path(relative_path):
@@ -33,27 +39,152 @@ def get_full_path(relative_path):
         abort(400, "Accès non autorisé au chemin.")
     return full_path
 
+# Chemin relatif à UPLOAD_FOLDER ('' pour la racine)
+def library_path(full_path):
+    relative_path = get_catalog().relative_path(full_path)
+    return '' if relative_path == '.' else relative_path
+
+# Retourne l'index (mis en cache) d'un dossier, ou None s'il n'existe pas
+@timed('get_directory_listing')
+def get_directory_listing(current_path=''):
+    return directory_index.get(get_full_path(current_path))
+
 # Liste les fichiers et dossiers dans un chemin donné
+@timed('get_files_and_folders')
 def get_files_and_folders(current_path=''):
-    base_dir = get_full_path(current_path)
-    files = []
-    folders = []
-    if not os.path.exists(base_dir):
+    listing = get_directory_listing(current_path)
+    if listing is None:
         return [], []
-    
-    for item in os.listdir(base_dir):
-        item_path = os.path.join(base_dir, item)
-        if os.path.isfile(item_path):
-            if os.path.splitext(item.lower())[1] in Config.ALLOWED_EXTENSIONS:
-                files.append(item)
-        elif os.path.isdir(item_path):
-            folders.append(item)
-            
-    # Tri par ordre alphabétique, dossiers en premier
-    folders.sort()
-    files.sort(key=lambda x: os.path.getmtime(os.path.join(base_dir, x)), reverse=True)
-    
-    return files, folders
+    # Dossiers par ordre alphabétique, fichiers du plus récent au plus ancien
+    return [f.name for f in listing.files], list(listing.folders)
+
+# Résumé des métadonnées (durée, qualité, tags) des morceaux d'un dossier
+# (ou seulement des entrées données)
+def get_track_info(current_path='', entries=None):
+    if entries is None:
+        listing = get_directory_listing(current_path)
+        entries = listing.files if listing else []
+    known = get_catalog().lookup(current_path, entries)
+    return {name: describe_track(metadata) for name, metadata in known.items()}
+
+# Ce qui détermine le contenu rendu d'un dossier, ou None si le dossier
+# vient d'être modifié (son mtime n'est pas encore fiable, voir dir_index).
+# Seul l'état de ce dossier compte : les entrées du catalogue des fichiers
+# rendus (entries) et la taille des sous-dossiers affichés (folder_sizes).
+def folder_contents_key(relative_path, listing, editor_mode, entries, folder_sizes=None):
+    if listing is None or listing.racy:
+        return None
+    template_folder = os.path.join(current_app.root_path, current_app.template_folder)
+    return (relative_path, listing.mtime_ns, len(listing), bool(editor_mode),
+            get_catalog().stamp(relative_path, entries), tuple(sorted((folder_sizes or {}).items())),
+            request.url_root, Config.LISTING_PAGE_SIZE, templates_stamp(template_folder), get_manifest()['stamp'])
+
+# Rendu (mis en cache si la clé le permet) du contenu d'un dossier
+def cached_fragment(key, render):
+    if key is None:
+        return Markup(render())
+    return fragment_cache.get(key, lambda: Markup(render()))
+
+# Page de dossier avec ETag faible : 304 sans rendu si le client l'a déjà
+def conditional_page(etag, render):
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        # Page propre à la session : le navigateur la revalide à chaque visite
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Met à jour les index après l'ajout d'un fichier dans UPLOAD_FOLDER
+def after_file_upload(filepath):
+    relative_path = get_catalog().relative_path(filepath)
+    directory_index.invalidate(os.path.dirname(filepath))
+    get_search_index().add(relative_path)
+    get_usage_index().add_file(relative_path, os.path.getsize(filepath))
+    get_catalog().schedule(relative_path)
+    get_waveform_store().schedule(filepath, relative_path)
+
+# Libère la place réservée par un envoi du formulaire, même en cas d'erreur
+@bp.teardown_request
+def release_upload_reservation(exc):
+    reservation_id = g.pop('upload_reservation', None)
+    if reservation_id:
+        get_usage_index().release(reservation_id)
+
+# Met à jour les index après la suppression d'un fichier ou d'un dossier
+# (size : taille du fichier supprimé, None pour un dossier)
+def after_item_delete(item_path, size=None):
+    after_items_delete([(item_path, size)])
+
+# Même chose pour plusieurs éléments : (chemin complet, taille)
+def after_items_delete(items):
+    removed = []
+    for item_path, size in items:
+        directory_index.invalidate(item_path, recursive=True)
+        directory_index.invalidate(os.path.dirname(item_path))
+        if not os.path.exists(item_path):
+            relative_path = get_catalog().relative_path(item_path)
+            get_catalog().forget(relative_path)
+            get_search_index().remove(relative_path)
+            get_dedup_index().forget(relative_path)
+            get_waveform_store().forget(relative_path)
+            get_usage_index().remove(relative_path, size)
+            removed.append(relative_path)
+    # Les liens vers ces éléments (ou leur contenu) ne mènent plus nulle
+    # part : une seule écriture du store pour tous
+    if removed:
+        get_link_store().delete_paths(*removed)
+
+# Met à jour les index après le déplacement d'un élément (chemins relatifs)
+def after_item_move(source, destination):
+    source_path, destination_path = get_full_path(source), get_full_path(destination)
+    directory_index.invalidate(source_path, recursive=True)
+    for path in (os.path.dirname(source_path), os.path.dirname(destination_path)):
+        directory_index.invalidate(path)
+    get_catalog().rename_prefix(source, destination)
+    get_dedup_index().rename_prefix(source, destination)
+    get_search_index().move(source, destination)
+    waveforms = get_waveform_store()
+    if os.path.isdir(destination_path):
+        for root, _, files in os.walk(destination_path):
+            for name in files:
+                relative_path = get_catalog().relative_path(os.path.join(root, name))
+                waveforms.move(source + relative_path[len(destination):], relative_path)
+    else:
+        waveforms.move(source, destination)
+    get_usage_index().move(source, destination,
+                           None if os.path.isdir(destination_path) else os.path.getsize(destination_path))
+    # Tous les liens concernés sont réécrits en une seule fois
+    get_link_store().rewrite_paths(source, destination)
+
+# Mises à jour déclenchées par les tâches de la file (services/jobs.py)
+def after_job_delete(items):
+    after_items_delete([(get_full_path(relative_path), size) for relative_path, size in items])
+
+def after_job_file_delete(relative_path):
+    get_waveform_store().forget(relative_path)
+
+jobs.on('deleted', after_job_delete)
+jobs.on('file_deleted', after_job_file_delete)
+jobs.on('moved', after_item_move)
+
+# Recherche dans toute la bibliothèque (noms de fichiers, dossiers et tags)
+def search_library(query, limit=None):
+    index = get_search_index()
+    index.ensure_built(catalog_tags)
+    results = []
+    for match in index.search(query, limit or Config.SEARCH_RESULTS_LIMIT):
+        path = match['path']
+        folder, name = os.path.split(path)
+        result = {'name': name, 'path': path, 'folder': folder, 'is_directory': match['is_directory'],
+                  'folder_url': url_for('main.index', current_path=path if match['is_directory'] else folder)}
+        if not match['is_directory']:
+            result['url'] = url_for('main.uploaded_file', filename_or_path=path, _external=True)
+            result['mimetype'] = guess_mimetype(name)
+        results.append(result)
+    return results
 
 # Routes principales
 @bp.route('/', defaults={'current_path': ''}, methods=['GET', 'POST'])
@@ -77,6 +208,20 @@ def index(current_path):
         if not editor_mode:
             return redirect(url_for('main.index', current_path=current_path))
 
+        # Envoi de fichier : quotas vérifiés avec la taille annoncée, avant
+        # que le corps de la requête ne soit lu. Cette taille reste réservée
+        # jusqu'à la fin de la requête (voir release_upload_reservation)
+        if request.mimetype == 'multipart/form-data':
+            if request.content_length is None:
+                return "Content-Length requis.", 411
+            reservation_id = 'form-' + secrets.token_hex(16)
+            try:
+                get_usage_index().reserve(reservation_id, library_path(get_full_path(current_path)),
+                                          request.content_length)
+            except QuotaError as e:
+                return str(e), 507
+            g.upload_reservation = reservation_id
+
         # Logique de création de dossier
         if 'create_folder' in request.form:
             folder_name = request.form['create_folder']
@@ -86,6 +231,9 @@ def index(current_path):
                     os.makedirs(new_folder_path, exist_ok=True)
                 except OSError as e:
                     print(f"Erreur lors de la création du dossier: {e}") # Log pour debug
+                directory_index.invalidate(os.path.dirname(new_folder_path))
+                if os.path.isdir(new_folder_path):
+                    get_search_index().add(get_catalog().relative_path(new_folder_path), is_dir=True)
             return redirect(url_for('main.index', current_path=current_path))
 
         # Logique de suppression de fichier/dossier
@@ -93,18 +241,26 @@ def index(current_path):
             item_to_delete = request.form['delete_item']
             item_path = get_full_path(os.path.join(current_path, item_to_delete))
             if os.path.exists(item_path):
+                size = None
                 try:
                     if os.path.isfile(item_path):
+                        size = os.path.getsize(item_path)
                         os.remove(item_path)
                     elif os.path.isdir(item_path):
                         # Ne supprime que si le dossier est vide
                         if not os.listdir(item_path):
                             os.rmdir(item_path)
+                        elif request.form.get('recursive'):
+                            # Suppression du contenu confiée à la file de tâches
+                            relative_path = get_catalog().relative_path(item_path)
+                            job_id = get_job_queue().submit('delete', {'paths': [relative_path]})
+                            return redirect(url_for('main.index', current_path=current_path, job=job_id))
                         else:
                             # Gérer l'erreur si le dossier n'est pas vide
                             print(f"Impossible de supprimer le dossier non vide: {item_path}")
                 except OSError as e:
                     print(f"Erreur lors de la suppression: {e}") # Log pour debug
+                after_item_delete(item_path, size)
             return redirect(url_for('main.index', current_path=current_path))
 
         # Logique d'upload de fichier
@@ -114,13 +270,9 @@ def index(current_path):
                 # Vérifie l'extension si c'est un fichier audio
                 if os.path.splitext(f.filename.lower())[1] in Config.ALLOWED_EXTENSIONS:
                     target_dir = get_full_path(current_path)
-                    filepath = os.path.join(target_dir, f.filename)
-                    counter = 1
-                    name, ext = os.path.splitext(f.filename)
-                    while os.path.exists(filepath):
-                        filepath = os.path.join(target_dir, f"{name}_{counter}{ext}")
-                        counter += 1
-                    f.save(filepath)
+                    # Écrit sous un nom libre en calculant l'empreinte (déduplication)
+                    filepath = save_upload(f.stream, target_dir, os.path.basename(f.filename))
+                    after_file_upload(filepath)
                 else:
                     print(f"Extension non autorisée pour le fichier: {f.filename}") # Log pour debug
             return redirect(url_for('main.index', current_path=current_path))
@@ -128,55 +280,140 @@ def index(current_path):
         # Logique de suppression de lien partagé
         if 'delete_link' in request.form:
             token_to_delete = request.form['delete_link']
-            links = read_shared_links()
-            if token_to_delete in links:
-                links.pop(token_to_delete)
-                write_shared_links(links)
+            get_link_store().delete(token_to_delete)
+            if Config.ANALYTICS_ENABLED:
+                get_share_analytics().forget([token_to_delete])
             return redirect(url_for('main.index', current_path=current_path))
 
     if not authenticated:
         return render_template('index.html', authenticated=False, editor_mode=False, files=[], folders=[], current_path=current_path, shared_links=[])
 
-    files, folders = get_files_and_folders(current_path)
-    
-    # Charger et préparer les liens partagés pour l'affichage
-    raw_links = read_shared_links()
-    shared_links_list = []
-    for token, data in raw_links.items():
-        # Assurez-vous que 'expiry_date' est toujours une chaîne ISO formatée
-        expiry = datetime.fromisoformat(data['expiry_date'])
-        is_expired = datetime.now(timezone.utc) > expiry
-        shared_links_list.append({
-            'token': token,
-            'link_name': data.get('link_name', 'Lien sans nom'),
-            'item_name': data.get('item_name', data.get('filename')), # Peut être un fichier ou un dossier
-            'is_directory': data.get('is_directory', False),
-            'expiry_date_str': expiry.strftime('%d/%m/%Y %H:%M'),
-            'is_expired': is_expired,
-            'url': request.url_root.rstrip('/') + f'/share/{token}'
-        })
+    listing = get_directory_listing(current_path)
+    # Liens partagés (panneau de l'éditeur) : vue préformatée mise en cache
+    shared_links_list = link_list_cache.get(get_link_store(), time.time()) if editor_mode else []
 
-    return render_template('index.html', 
+    # Seule la première page de fichiers est rendue, la suite passe par /api/list
+    if listing is not None:
+        entries, next_cursor = listing.page(None, Config.LISTING_PAGE_SIZE)
+        folders = listing.folders
+    else:
+        entries, next_cursor, folders = [], None, []
+    usage_path = library_path(get_full_path(current_path))
+    folder_sizes = get_usage_index().children(usage_path)
+    folder_usage = get_usage_index().get(usage_path)
+
+    contents_key = folder_contents_key(current_path, listing, editor_mode, entries, folder_sizes)
+    etag = None
+    if contents_key is not None:
+        links_state = None
+        if editor_mode:
+            # Le panneau des liens (et leurs statistiques) figure sur toutes
+            # les pages de l'éditeur, pas dans le contenu du dossier
+            links_state = (get_link_store().version(), sum(link['is_expired'] for link in shared_links_list),
+                           get_share_analytics().version() if Config.ANALYTICS_ENABLED else None)
+        etag = listing_etag('index', contents_key, folder_usage, links_state)
+
+    def render_contents():
+        return render_template('folder_contents.html',
+                               editor_mode=editor_mode,
+                               files=[entry.name for entry in entries],
+                               folders=folders,
+                               track_info=get_track_info(current_path, entries),
+                               folder_sizes=folder_sizes,
+                               waveform_supported=waveform_supported,
+                               next_cursor=next_cursor,
+                               current_path=current_path)
+
+    return conditional_page(etag, lambda: render_template('index.html',
                            authenticated=True, 
                            editor_mode=editor_mode, 
-                           files=files, 
-                           folders=folders, 
+                           folder_contents=cached_fragment(contents_key, render_contents),
+                           entry_count=len(listing) if listing is not None else 0,
+                           folder_usage=folder_usage,
                            current_path=current_path, 
-                           shared_links=shared_links_list)
+                           shared_links=shared_links_list,
+                           share_stats=get_share_analytics().stats() if editor_mode and Config.ANALYTICS_ENABLED else {},
+                           share_url_root=request.url_root.rstrip('/') + '/share/',
+                           share_ttl_choices=Config.SHARE_TTL_CHOICES_HOURS,
+                           share_default_ttl=Config.SHARE_DEFAULT_TTL_HOURS))
+
+@bp.route('/search')
+def search():
+    if not session.get('authenticated'):
+        return redirect(url_for('main.index'))
+    query = request.args.get('q', '').strip()
+    results = search_library(query) if query else []
+    return render_template('search.html', query=query, results=results,
+                           limit=Config.SEARCH_RESULTS_LIMIT)
 
 @bp.route('/uploads/<path:filename_or_path>')
 def uploaded_file(filename_or_path):
+    # Accès direct réservé aux sessions connectées : les destinataires d'un
+    # lien passent par /share/<token>/file (limites de débit du lien)
+    if not session.get('authenticated'):
+        abort(403, "Accès refusé.")
     # S'assure que le chemin est bien à l'intérieur de UPLOAD_FOLDER
     full_path = get_full_path(filename_or_path)
     
     if os.path.isfile(full_path):
-        # Extrait le répertoire et le nom de fichier pour send_from_directory
-        directory = os.path.dirname(full_path)
-        filename = os.path.basename(full_path)
-        return send_from_directory(directory, filename)
+        # Envoi direct (Range, ETag...) ou délégué au proxy selon FILE_DELIVERY
+        return send_limited_file(full_path)
     else:
         abort(404, "Fichier non trouvé.")
 
+# Envoie un fichier en partageant le débit entre les lectures
+def send_limited_file(full_path, share_token=None):
+    if Config.FILE_DELIVERY != 'python':
+        # Le proxy envoie le fichier : c'est à lui de limiter le débit
+        return deliver_file(full_path)
+    return limit_bandwidth(lambda: deliver_file(full_path), share_token)
+
+# Applique les limites de débit globale, par session et par lien partagé
+# (services/bandwidth.py) au corps de la réponse construite par build()
+def limit_bandwidth(build, share_token=None):
+    if 'stream_id' not in session:
+        session['stream_id'] = secrets.token_hex(8)
+    buckets = bandwidth_scheduler.acquire(session['stream_id'], share_token)
+    if buckets is None:
+        return Response("Trop de lectures simultanées pour ce lien.", status=429,
+                        headers={'Retry-After': '10'}, mimetype='text/plain')
+    try:
+        response = build()
+    except BaseException:
+        bandwidth_scheduler.release(share_token)
+        raise
+    if response.status_code in (200, 206):
+        response.response = bandwidth_scheduler.wrap(response.response, buckets, share_token)
+    else:
+        bandwidth_scheduler.release(share_token)
+    return response
+
+@bp.route('/peaks/<path:filename_or_path>')
+def waveform_peaks(filename_or_path):
+    if not session.get('authenticated'):
+        abort(403, "Accès refusé.")
+    return send_peaks(get_full_path(filename_or_path))
+
+# Forme d'onde précalculée d'un fichier (202 tant qu'elle est en calcul)
+def send_peaks(full_path):
+    if not os.path.isfile(full_path) or not waveform_supported(full_path):
+        abort(404, "Forme d'onde indisponible.")
+
+    st = os.stat(full_path)
+    etag = f'{file_etag(st)}-peaks'
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    store = get_waveform_store()
+    relative_path = get_catalog().relative_path(full_path)
+    peaks = store.load(relative_path, st)
+    if peaks is None:
+        # Calcul lancé en arrière-plan : le client réessaiera
+        store.schedule(full_path, relative_path)
+        return Response(status=202, headers={'Retry-After': '2', 'Cache-Control': 'no-store'})
+    return Response(peaks, mimetype='application/octet-stream',
+                    headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
 @bp.route('/create-share/<path:item_path>', methods=['GET', 'POST'])
 def create_share_link(item_path):
     if not session.get('editor_mode'):
@@ -190,20 +427,23 @@ def create_share_link(item_path):
     item_name = os.path.basename(item_path)
 
     if request.method == 'POST':
-        links = read_shared_links()
         token = secrets.token_urlsafe(8)
         
-        creation_time = datetime.now(timezone.utc)
-        expiry_time = creation_time + timedelta(hours=48)
+        # Durée de validité choisie (en heures), bornée par la configuration
+        ttl_hours = request.form.get('ttl_hours', type=int)
+        if not ttl_hours or not 0 < ttl_hours <= Config.SHARE_MAX_TTL_HOURS:
+            ttl_hours = Config.SHARE_DEFAULT_TTL_HOURS
+        creation_time = datetime.fromtimestamp(time.time(), timezone.utc)
+        expiry_time = creation_time + timedelta(hours=ttl_hours)
 
-        links[token] = {
+        get_link_store().add(token, {
             'link_name': request.form.get('link_name', f'Partage de {item_name}'),
             'item_name': item_path, # Stocke le chemin relatif complet
             'is_directory': is_directory,
             'creation_date': creation_time.isoformat(),
             'expiry_date': expiry_time.isoformat()
-        }
-        write_shared_links(links)
+        })
+        expiry_scheduler.notify()
 
         share_url = request.url_root.rstrip('/') + f'/share/{token}'
         
@@ -225,47 +465,138 @@ def create_share_link(item_path):
                            show_share_modal=True)
 
 
-@bp.route('/share/<token>')
-def shared_link(token):
-    links = read_shared_links()
-    link_data = links.get(token)
+# Retourne les données d'un lien partagé valide, ou 404
+def get_valid_link(token):
+    store = get_link_store()
+    link_data = store.get(token)
 
     if not link_data:
         abort(404, "Lien invalide.")
 
     expiry_date = datetime.fromisoformat(link_data['expiry_date'])
 
-    if datetime.now(timezone.utc) > expiry_date:
-        links.pop(token)
-        write_shared_links(links)
+    # Le lien a pu expirer avant le passage de la purge
+    if time.time() > expiry_date.timestamp():
+        store.delete(token)
         abort(404, "Lien expiré.")
+    return link_data
+
+# Archive ZIP d'un dossier, envoyée au fil de sa génération
+def send_directory_zip(relative_path):
+    full_path = get_full_path(relative_path)
+    if not os.path.isdir(full_path):
+        abort(404, "Dossier non trouvé.")
+    archive = zip_directory(full_path)
+    name = os.path.basename(full_path.rstrip(os.sep)) or 'hush_music'
+    response = Response(iter(archive), mimetype='application/zip')
+    response.headers['Content-Length'] = str(archive.size)
+    response.headers['Content-Disposition'] = content_disposition(name + '.zip')
+    return response
+
+@bp.route('/zip/', defaults={'current_path': ''})
+@bp.route('/zip/<path:current_path>')
+def folder_zip(current_path):
+    if not session.get('authenticated'):
+        abort(403, "Accès refusé.")
+    return limit_bandwidth(lambda: send_directory_zip(current_path))
+
+@bp.route('/share/<token>')
+def shared_link(token):
+    link_data = get_valid_link(token)
+    if Config.ANALYTICS_ENABLED:
+        get_share_analytics().record(token, views=1)
 
     item_path = link_data['item_name']
     full_item_path = get_full_path(item_path)
 
     if link_data.get('is_directory', False):
-        # Si c'est un dossier, lister son contenu
-        files, folders = get_files_and_folders(item_path)
-        # Préparer les URLs pour les fichiers dans le dossier partagé
-        shared_files_info = []
-        for f in files:
-            shared_files_info.append({
-                'name': f,
-                'url': url_for('main.uploaded_file', filename_or_path=os.path.join(item_path, f), _external=True)
-            })
-        return render_template('shared.html', 
+        listing = get_directory_listing(item_path)
+        contents_key = folder_contents_key(item_path, listing, False, listing.files if listing else [])
+        etag = listing_etag('shared', token, link_data, contents_key) if contents_key is not None else None
+
+        def render_contents():
+            # Si c'est un dossier, lister son contenu
+            files, folders = get_files_and_folders(item_path)
+            track_info = get_track_info(item_path)
+            # Préparer les URLs pour les fichiers dans le dossier partagé
+            shared_files_info = []
+            for f in files:
+                shared_files_info.append({
+                    'name': f,
+                    'info': track_info.get(f),
+                    'peaks_url': url_for('main.shared_peaks', token=token, filename=f) if waveform_supported(f) else None,
+                    'url': url_for('main.shared_file', token=token, filename=f, _external=True)
+                })
+            return render_template('shared_files.html',
+                                   zip_url=url_for('main.shared_zip', token=token),
+                                   files=shared_files_info)
+
+        # Le contenu rendu dépend aussi du lien (URL de l'archive ZIP)
+        fragment_key = ('shared', token, contents_key) if contents_key is not None else None
+        return conditional_page(etag, lambda: render_template('shared.html',
                                link_name=link_data['link_name'], 
                                is_directory=True, 
                                item_name=os.path.basename(item_path), 
-                               files=shared_files_info, 
-                               folders=folders) # Les sous-dossiers ne sont pas cliquables pour l'instant
+                               folder_contents=cached_fragment(fragment_key, render_contents)))
     else:
         # Si c'est un fichier, le servir directement
         return render_template('shared.html', 
                                link_name=link_data['link_name'], 
                                is_directory=False, 
                                filename=os.path.basename(item_path), 
-                               file_url=url_for('main.uploaded_file', filename_or_path=item_path, _external=True))
+                               file_url=url_for('main.shared_file', token=token, _external=True),
+                               peaks_url=url_for('main.shared_peaks', token=token) if waveform_supported(item_path) else None)
+
+# Fichier d'un lien partagé : le lien lui-même (fichier) ou un fichier du
+# dossier partagé, envoyé avec les limites de débit du lien
+@bp.route('/share/<token>/file', defaults={'filename': ''})
+@bp.route('/share/<token>/file/<path:filename>')
+def shared_file(token, filename):
+    link_data = get_valid_link(token)
+    full_path = shared_item_path(link_data, filename)
+    if not os.path.isfile(full_path):
+        abort(404, "Fichier non trouvé.")
+    response = send_limited_file(full_path, share_token=token)
+    # Une lecture est comptée quand le fichier est demandé depuis son début
+    # (les sauts dans le morceau ne sont que des octets supplémentaires)
+    from_start = response.status_code == 200 or response.headers.get('Content-Range', '').startswith('bytes 0-')
+    return record_share_response(response, token, filename or os.path.basename(full_path), plays=int(from_start))
+
+# Forme d'onde d'un fichier partagé, sans exposer son chemin dans la bibliothèque
+@bp.route('/share/<token>/peaks', defaults={'filename': ''})
+@bp.route('/share/<token>/peaks/<path:filename>')
+def shared_peaks(token, filename):
+    return send_peaks(shared_item_path(get_valid_link(token), filename))
+
+# Chemin complet du fichier filename d'un lien : le lien lui-même (fichier)
+# ou un fichier à l'intérieur du dossier partagé
+def shared_item_path(link_data, filename):
+    item_path = get_full_path(link_data['item_name'])
+    if link_data['is_directory']:
+        full_path = os.path.abspath(os.path.join(item_path, filename))
+        if not full_path.startswith(item_path + os.sep):
+            abort(404, "Fichier non trouvé.")
+        return full_path
+    if filename:
+        abort(404, "Fichier non trouvé.")
+    return item_path
+
+@bp.route('/share/<token>/zip')
+def shared_zip(token):
+    link_data = get_valid_link(token)
+    if not link_data.get('is_directory', False):
+        abort(404, "Ce lien ne partage pas un dossier.")
+    response = limit_bandwidth(lambda: send_directory_zip(link_data['item_name']), share_token=token)
+    return record_share_response(response, token, '', downloads=1)
+
+# Statistiques du lien (services/analytics.py) : compte la réponse et les
+# octets réellement envoyés
+def record_share_response(response, token, item, **counts):
+    if Config.ANALYTICS_ENABLED and response.status_code in (200, 206):
+        analytics = get_share_analytics()
+        analytics.record(token, item, **counts)
+        response.response = analytics.track(response.response, token, item)
+    return response
 
 @bp.route('/logout')
 def logout():
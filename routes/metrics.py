@@ -0,0 +1,36 @@
+# routes/metrics.py
+from flask import Blueprint, Response, request, session, abort, jsonify
+from config import Config
+from services.metrics import registry, profiler, authorized
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.before_request
+def require_access():
+    if not authorized(session):
+        abort(403, "Accès refusé.")
+
+
+@bp.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
+
+# Profileur par échantillonnage : démarrage/arrêt à chaud, piles au format
+# « collapsed » (flamegraph.pl, speedscope...)
+@bp.route('/metrics/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    if request.method == 'POST':
+        action = request.values.get('action')
+        if action == 'start':
+            interval = request.values.get('interval', Config.PROFILER_INTERVAL, type=float)
+            profiler.start(min(max(interval, 0.001), 1.0))
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            abort(400, "Action inconnue (start ou stop).")
+        return jsonify({'running': profiler.running, 'interval': profiler.interval})
+    return Response(profiler.collapsed(), mimetype='text/plain; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
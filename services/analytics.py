@@ -0,0 +1,212 @@
+# services/analytics.py
+import os
+import time
+import atexit
+import threading
+
+from config import Config
+from services.db import SqliteDatabase
+
+# Statistiques des liens partagés : visites de la page du lien, lectures,
+# téléchargements (ZIP) et octets envoyés, par lien et par morceau.
+#
+# Les événements sont comptés en mémoire puis écrits par lots dans
+# DATA_FOLDER/analytics.db : toutes les ANALYTICS_FLUSH_INTERVAL secondes
+# par un thread dédié, ou dès que ANALYTICS_FLUSH_EVENTS événements sont en
+# attente. Chaque worker n'écrit que ses propres compteurs, ajoutés à ceux
+# de la base (INSERT ... ON CONFLICT DO UPDATE) : les écritures de plusieurs
+# workers s'additionnent sans se perdre.
+#
+# Le panneau de l'éditeur affiche les valeurs écrites en base : elles ont au
+# plus ANALYTICS_FLUSH_INTERVAL secondes de retard.
+#
+# Les statistiques d'un lien supprimé ou expiré sont effacées et son jeton
+# noté dans la table forgotten. Un lot écrit ensuite (compteurs encore en
+# mémoire dans un autre worker, ou lot en cours d'écriture dans celui-ci)
+# ignore ces jetons : la vérification a lieu dans la transaction d'écriture.
+# Les jetons n'étant jamais réutilisés, la table ne fait que grandir, d'une
+# ligne par lien supprimé.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS share_stats (
+        token TEXT NOT NULL,
+        item TEXT NOT NULL,
+        views INTEGER NOT NULL DEFAULT 0,
+        plays INTEGER NOT NULL DEFAULT 0,
+        downloads INTEGER NOT NULL DEFAULT 0,
+        bytes_sent INTEGER NOT NULL DEFAULT 0,
+        last_access REAL NOT NULL,
+        PRIMARY KEY (token, item)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS forgotten (
+        token TEXT PRIMARY KEY
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+# Position des compteurs dans les agrégats en mémoire
+FIELDS = ('views', 'plays', 'downloads', 'bytes_sent')
+# Nombre de morceaux les plus écoutés affichés par lien
+TOP_TRACKS = 3
+
+
+class RecordingStream:
+    # Corps de réponse qui compte les octets réellement envoyés et les
+    # enregistre à la fermeture (fin de l'envoi ou client parti)
+    def __init__(self, analytics, iterable, token, item):
+        self._analytics = analytics
+        self._iterable = iterable
+        self._token = token
+        self._item = item
+        self._sent = 0
+        self._closed = False
+
+    def __iter__(self):
+        for data in self._iterable:
+            self._sent += len(data)
+            yield data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._analytics.record(self._token, self._item, bytes_sent=self._sent)
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+class ShareAnalytics:
+    def __init__(self, db_path):
+        self.db = SqliteDatabase(db_path, SCHEMA)
+        # (token, élément) -> [views, plays, downloads, bytes_sent, dernier accès]
+        self._pending = {}
+        self._events = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def record(self, token, item='', views=0, plays=0, downloads=0, bytes_sent=0):
+        with self._lock:
+            counts = self._pending.get((token, item))
+            if counts is None:
+                counts = self._pending[(token, item)] = [0, 0, 0, 0, 0.0]
+            counts[0] += views
+            counts[1] += plays
+            counts[2] += downloads
+            counts[3] += bytes_sent
+            counts[4] = time.time()
+            self._events += 1
+            full = self._events >= Config.ANALYTICS_FLUSH_EVENTS
+        if full:
+            if self.running:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def track(self, iterable, token, item):
+        return RecordingStream(self, iterable, token, item)
+
+    # Écrit les compteurs en attente en une transaction ; retourne le nombre
+    # de lignes mises à jour
+    def flush(self):
+        with self._lock:
+            pending, self._pending, self._events = self._pending, {}, 0
+        if not pending:
+            return 0
+        rows = [(token, item, *counts) for (token, item), counts in pending.items()]
+        try:
+            with self.db.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO share_stats (token, item, views, plays, downloads, bytes_sent, last_access)'
+                    ' SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7 WHERE NOT EXISTS (SELECT 1 FROM forgotten WHERE token = ?1)'
+                    ' ON CONFLICT (token, item) DO UPDATE SET'
+                    ' views = views + excluded.views, plays = plays + excluded.plays,'
+                    ' downloads = downloads + excluded.downloads, bytes_sent = bytes_sent + excluded.bytes_sent,'
+                    ' last_access = MAX(last_access, excluded.last_access)', rows)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') ON CONFLICT (key)"
+                             " DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        except Exception:
+            # Les compteurs sont remis en attente pour le prochain essai
+            with self._lock:
+                for key, counts in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0, 0.0])
+                    for i in range(4):
+                        current[i] += counts[i]
+                    current[4] = max(current[4], counts[4])
+            raise
+        return len(rows)
+
+    # Change à chaque écriture en base (clé des pages mises en cache)
+    def version(self):
+        row = self.db.connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row['value']) if row else 0
+
+    # Totaux par lien, avec ses morceaux les plus écoutés
+    def stats(self):
+        stats = {}
+        rows = self.db.connect().execute(
+            'SELECT token, item, views, plays, downloads, bytes_sent, last_access FROM share_stats'
+            ' ORDER BY token, plays DESC, item').fetchall()
+        for row in rows:
+            entry = stats.get(row['token'])
+            if entry is None:
+                entry = stats[row['token']] = dict.fromkeys(FIELDS, 0)
+                entry['last_access'] = 0
+                entry['tracks'] = []
+            for field in FIELDS:
+                entry[field] += row[field]
+            entry['last_access'] = max(entry['last_access'], row['last_access'])
+            if row['item'] and row['plays'] and len(entry['tracks']) < TOP_TRACKS:
+                entry['tracks'].append((row['item'], row['plays']))
+        return stats
+
+    # Supprime les statistiques des liens, y compris celles pas encore écrites
+    def forget(self, tokens):
+        tokens = set(tokens)
+        with self._lock:
+            for key in [key for key in self._pending if key[0] in tokens]:
+                del self._pending[key]
+        with self.db.transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO forgotten (token) VALUES (?)', [(token,) for token in tokens])
+            conn.executemany('DELETE FROM share_stats WHERE token = ?', [(token,) for token in tokens])
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='share-analytics', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(Config.ANALYTICS_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des statistiques: {e}") # Log pour debug
+
+
+_analytics = None
+_analytics_key = None
+_analytics_lock = threading.Lock()
+
+
+def get_share_analytics():
+    global _analytics, _analytics_key
+    with _analytics_lock:
+        if _analytics is None or _analytics_key != Config.DATA_FOLDER:
+            _analytics = ShareAnalytics(os.path.join(Config.DATA_FOLDER, 'analytics.db'))
+            _analytics_key = Config.DATA_FOLDER
+        return _analytics
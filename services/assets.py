@@ -0,0 +1,324 @@
+# services/assets.py
+import os
+import re
+import glob
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # variante .br produite seulement si le module est installé
+    brotli = None
+
+# Construction hors ligne de la feuille de style de l'interface.
+#
+#   python -m services.assets
+#
+# assets/app.css est réduite aux règles dont toutes les classes apparaissent
+# dans templates/ ou static/ (même découpage en mots que Tailwind : une
+# classe ajoutée par JavaScript doit y figurer en toutes lettres), minifiée,
+# puis écrite dans Config.ASSETS_FOLDER sous un nom contenant son empreinte
+# (app.<hash>.css), avec ses variantes compressées .gz et .br. Le fichier
+# manifest.json associe le nom logique (app.css) au nom construit.
+#
+# Un nom de fichier ne désigne jamais qu'un seul contenu : il est servi avec
+# un cache « immutable » (voir routes/assets.py). Au premier usage, le
+# manifeste est relu et la feuille reconstruite si ses sources ont changé,
+# de sorte qu'un déploiement sans étape de construction fonctionne aussi.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = {'app.css': os.path.join(ROOT, 'assets', 'app.css')}
+CONTENT_GLOBS = (os.path.join(ROOT, 'templates', '*.html'), os.path.join(ROOT, 'static', '*.js'))
+MANIFEST = 'manifest.json'
+# Constructions précédentes gardées (pages encore en cache chez un client)
+KEEP_BUILDS = 3
+# Change quand la construction elle-même change (purge, minification)
+BUILD_FORMAT = '1'
+
+# Chaînes entre guillemets (gardées telles quelles) ou commentaires (retirés)
+_STRINGS_AND_COMMENTS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_CLASS_SELECTOR = re.compile(r'\.((?:\\.|[A-Za-z0-9_-])+)')
+_CANDIDATE = re.compile(r'[A-Za-z0-9_:/.-]+')
+# Règles @ dont le bloc contient d'autres règles (à purger aussi)
+_NESTED_AT_RULES = ('@media', '@supports', '@layer', '@container')
+
+
+# --- Purge -------------------------------------------------------------------
+
+# Mots des templates et scripts susceptibles d'être des noms de classes
+def collect_candidates(paths):
+    candidates = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for token in _CANDIDATE.findall(f.read()):
+                candidates.add(token)
+                candidates.update(token.split('.'))
+    return candidates
+
+
+def strip_comments(css):
+    return _STRINGS_AND_COMMENTS.sub(lambda m: m.group(1) or '', css)
+
+
+# Découpe une feuille (sans commentaires) en règles :
+#   ('rule', sélecteurs, déclarations), ('block', prélude, règles imbriquées),
+#   ('raw', prélude, contenu) pour @keyframes/@font-face, ('stmt', texte)
+def parse(css):
+    nodes = []
+    i, n = 0, len(css)
+    while i < n:
+        start = i
+        while i < n and css[i] not in '{;}':
+            if css[i] in '"\'':
+                i = _skip_string(css, i)
+            else:
+                i += 1
+        prelude = css[start:i].strip()
+        if i >= n or css[i] == '}':
+            i += 1
+            continue
+        if css[i] == ';':
+            if prelude:
+                nodes.append(('stmt', prelude))
+            i += 1
+            continue
+        body_start = i + 1
+        i = _block_end(css, body_start)
+        body = css[body_start:i]
+        i += 1
+        if prelude.startswith(_NESTED_AT_RULES):
+            nodes.append(('block', prelude, parse(body)))
+        elif prelude.startswith('@'):
+            nodes.append(('raw', prelude, body))
+        else:
+            nodes.append(('rule', prelude, body))
+    return nodes
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i + 1
+
+
+# Position de l'accolade fermante du bloc ouvert juste avant start
+def _block_end(css, start):
+    depth, i = 1, start
+    while i < len(css):
+        c = css[i]
+        if c in '"\'':
+            i = _skip_string(css, i)
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return i
+
+
+def split_selectors(selectors):
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(selectors):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(selectors[start:i].strip())
+            start = i + 1
+    parts.append(selectors[start:].strip())
+    return parts
+
+
+def selector_classes(selector):
+    return {re.sub(r'\\(.)', r'\1', name) for name in _CLASS_SELECTOR.findall(selector)}
+
+
+# Garde les sélecteurs dont toutes les classes sont utilisées ; les règles
+# sans classe (thèmes, éléments) et les @keyframes sont toujours gardées
+def purge(nodes, candidates):
+    kept = []
+    for node in nodes:
+        if node[0] == 'rule':
+            selectors = [s for s in split_selectors(node[1]) if selector_classes(s) <= candidates]
+            if selectors:
+                kept.append(('rule', ','.join(selectors), node[2]))
+        elif node[0] == 'block':
+            children = purge(node[2], candidates)
+            if children:
+                kept.append(('block', node[1], children))
+        else:
+            kept.append(node)
+    return kept
+
+
+def serialize(nodes):
+    parts = []
+    for node in nodes:
+        if node[0] == 'stmt':
+            parts.append(node[1] + ';')
+        elif node[0] == 'block':
+            parts.append(node[1] + '{' + serialize(node[2]) + '}')
+        else:
+            parts.append(node[1] + '{' + node[2] + '}')
+    return ''.join(parts)
+
+
+# --- Minification ------------------------------------------------------------
+
+# Espaces superflus d'un sélecteur ou (declarations=True) d'un bloc de
+# déclarations, où l'espace avant « : » peut aussi disparaître
+def _compact(css, declarations=False):
+    def segment(text):
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        return re.sub(r'\s*:\s*' if declarations else r':\s+', ':', text)
+    # Le texte entre guillemets (content, url(), polices) n'est pas touché
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', css)
+    css = ''.join(part if i % 2 else segment(part) for i, part in enumerate(parts)).strip()
+    return css.replace(';}', '}').rstrip(';') if declarations else css
+
+
+def minify_nodes(nodes):
+    minified = []
+    for node in nodes:
+        if node[0] == 'stmt':
+            minified.append(('stmt', _compact(node[1])))
+        elif node[0] == 'block':
+            minified.append(('block', _compact(node[1]), minify_nodes(node[2])))
+        else:
+            minified.append((node[0], _compact(node[1]), _compact(node[2], declarations=True)))
+    return minified
+
+
+# --- Construction ------------------------------------------------------------
+
+def content_paths():
+    paths = []
+    for pattern in CONTENT_GLOBS:
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+
+# Empreinte des entrées de la construction : sources et mots des templates
+def sources_stamp(sources=None, paths=None):
+    sources = SOURCES if sources is None else sources
+    paths = content_paths() if paths is None else paths
+    digest = hashlib.sha256(BUILD_FORMAT.encode())
+    for name in sorted(sources):
+        with open(sources[name], 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read() + b'\0')
+    for token in sorted(collect_candidates(paths)):
+        digest.update(token.encode() + b'\0')
+    return digest.hexdigest()[:16]
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_variants(path, data):
+    _write_atomic(path, data)
+    _write_atomic(path + '.gz', gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        _write_atomic(path + '.br', brotli.compress(data, quality=11))
+
+
+# Supprime les anciennes constructions au-delà de KEEP_BUILDS
+def _prune(output_folder, name):
+    stem, ext = os.path.splitext(name)
+    builds = glob.glob(os.path.join(output_folder, f'{glob.escape(stem)}.*{ext}'))
+    builds.sort(key=os.path.getmtime, reverse=True)
+    for path in builds[KEEP_BUILDS:]:
+        for variant in (path, path + '.gz', path + '.br'):
+            try:
+                os.remove(variant)
+            except FileNotFoundError:
+                pass
+
+
+def build(output_folder=None, sources=None, paths=None):
+    output_folder = output_folder or Config.ASSETS_FOLDER
+    sources = SOURCES if sources is None else sources
+    paths = content_paths() if paths is None else paths
+    os.makedirs(output_folder, exist_ok=True)
+    candidates = collect_candidates(paths)
+    built = {}
+    for name, source in sources.items():
+        with open(source, encoding='utf-8') as f:
+            css = serialize(minify_nodes(purge(parse(strip_comments(f.read())), candidates)))
+        data = css.encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        built[name] = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(output_folder, built[name])
+        if not os.path.exists(path):
+            _write_variants(path, data)
+        else:
+            os.utime(path)
+        _prune(output_folder, name)
+    manifest = {'stamp': sources_stamp(sources, paths), 'assets': built}
+    _write_atomic(os.path.join(output_folder, MANIFEST), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+def read_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Manifeste à jour : reconstruit si les sources ont changé depuis la dernière
+# construction ou si un fichier manque
+def ensure_built(output_folder=None):
+    output_folder = output_folder or Config.ASSETS_FOLDER
+    manifest = read_manifest(output_folder)
+    if (manifest is None or manifest.get('stamp') != sources_stamp()
+            or not all(os.path.isfile(os.path.join(output_folder, name))
+                       for name in manifest.get('assets', {}).values())):
+        manifest = build(output_folder)
+    return manifest
+
+
+_manifest = None
+_manifest_key = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    global _manifest, _manifest_key
+    with _manifest_lock:
+        if _manifest is None or _manifest_key != Config.ASSETS_FOLDER:
+            _manifest = ensure_built(Config.ASSETS_FOLDER)
+            _manifest_key = Config.ASSETS_FOLDER
+        return _manifest
+
+
+if __name__ == '__main__':
+    result = build()
+    for logical, built_name in result['assets'].items():
+        path = os.path.join(Config.ASSETS_FOLDER, built_name)
+        sizes = [f'{os.path.getsize(path)} o']
+        for suffix in ('.gz', '.br'):
+            if os.path.exists(path + suffix):
+                sizes.append(f'{suffix[1:]} {os.path.getsize(path + suffix)} o')
+        print(f'{logical} -> {path} ({", ".join(sizes)})')
@@ -0,0 +1,536 @@
+# services/audio_metadata.py
+import os
+import struct
+
+# Lecture des en-têtes audio en pur Python.
+#
+# Seuls le début du fichier, sa fin et quelques petits blocs d'en-tête
+# (trouvés par seek) sont lus : jamais les données audio elles-mêmes.
+# Chaque lecteur retourne un dictionnaire :
+#   {'format', 'duration', 'sample_rate', 'channels', 'bits_per_sample',
+#    'bitrate', 'tags': {'title', 'artist', 'album', 'date', 'genre', 'tracknumber'}}
+# Les valeurs inconnues valent None ; les tags absents ne sont pas présents.
+
+HEAD_SIZE = 64 * 1024
+TAIL_SIZE = 8 * 1024
+# Taille maximale de l'atome 'moov' lu pour les fichiers MP4
+MAX_MOOV_SIZE = 512 * 1024
+
+
+class MetadataError(Exception):
+    pass
+
+
+def _empty(fmt):
+    return {'format': fmt, 'duration': None, 'sample_rate': None, 'channels': None,
+            'bits_per_sample': None, 'bitrate': None, 'tags': {}}
+
+
+def _set_tag(tags, key, value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    value = (value or '').strip('\x00 \r\n')
+    if value and key not in tags:
+        tags[key] = value
+
+
+# Commentaires Vorbis (FLAC, Ogg Vorbis, Opus)
+VORBIS_KEYS = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album', 'DATE': 'date',
+               'GENRE': 'genre', 'TRACKNUMBER': 'tracknumber'}
+
+
+def parse_vorbis_comment(data, tags):
+    try:
+        vendor_length = struct.unpack_from('<I', data, 0)[0]
+        pos = 4 + vendor_length
+        count = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        for _ in range(count):
+            length = struct.unpack_from('<I', data, pos)[0]
+            pos += 4
+            comment = data[pos:pos + length]
+            pos += length
+            key, sep, value = comment.partition(b'=')
+            if sep and key.upper().decode('ascii', 'replace') in VORBIS_KEYS:
+                _set_tag(tags, VORBIS_KEYS[key.upper().decode('ascii')], value)
+    except struct.error:
+        # Commentaire tronqué (par exemple par une pochette) : on garde le début
+        pass
+
+
+# --- ID3 (MP3, parfois devant un FLAC) ---
+
+ID3_FRAMES = {
+    'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TDRC': 'date', 'TYER': 'date',
+    'TCON': 'genre', 'TRCK': 'tracknumber',
+    'TT2': 'title', 'TP1': 'artist', 'TAL': 'album', 'TYE': 'date', 'TCO': 'genre', 'TRK': 'tracknumber',
+}
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3_text(data):
+    if not data:
+        return ''
+    encoding, text = data[0], data[1:]
+    if encoding == 1:
+        return text.decode('utf-16', 'replace')
+    if encoding == 2:
+        return text.decode('utf-16-be', 'replace')
+    if encoding == 3:
+        return text.decode('utf-8', 'replace')
+    return text.decode('latin-1')
+
+
+# Taille totale d'un tag ID3v2 en début de données (0 s'il n'y en a pas)
+def id3v2_size(head):
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = 10 + _syncsafe(head[6:10])
+    if head[5] & 0x10:
+        size += 10
+    return size
+
+
+def parse_id3v2(data, tags):
+    major = data[3]
+    end = min(len(data), 10 + _syncsafe(data[6:10]))
+    pos = 10
+    if data[5] & 0x40 and major >= 3:
+        # En-tête étendu
+        ext_size = _syncsafe(data[10:14]) if major == 4 else struct.unpack('>I', data[10:14])[0] + 4
+        pos += ext_size
+    while pos < end:
+        if major == 2:
+            if pos + 6 > end:
+                break
+            frame_id = data[pos:pos + 3]
+            size = int.from_bytes(data[pos + 3:pos + 6], 'big')
+            pos += 6
+        else:
+            if pos + 10 > end:
+                break
+            frame_id = data[pos:pos + 4]
+            raw_size = data[pos + 4:pos + 8]
+            size = _syncsafe(raw_size) if major == 4 else struct.unpack('>I', raw_size)[0]
+            pos += 10
+        if not frame_id.strip(b'\x00') or size <= 0:
+            break
+        key = ID3_FRAMES.get(frame_id.decode('latin-1'))
+        if key:
+            _set_tag(tags, key, _decode_id3_text(data[pos:pos + size]))
+        pos += size
+
+
+def parse_id3v1(tail, tags):
+    if len(tail) < 128 or tail[-128:-125] != b'TAG':
+        return
+    tag = tail[-128:]
+    for key, start, stop in (('title', 3, 33), ('artist', 33, 63), ('album', 63, 93), ('date', 93, 97)):
+        _set_tag(tags, key, tag[start:stop].decode('latin-1'))
+    if tag[125] == 0 and tag[126]:
+        _set_tag(tags, 'tracknumber', str(tag[126]))
+
+
+# --- MP3 ---
+
+MPEG_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MPEG_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+
+
+def parse_mpeg_header(data, pos):
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = {0: 25, 2: 2, 3: 1}.get((b1 >> 3) & 0x03)
+    layer = {1: 3, 2: 2, 3: 1}.get((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 1) else 576
+        frame_length = samples // 8 * bitrate // sample_rate + padding
+    return {'version': version, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+            'channels': channels, 'samples': samples, 'frame_length': frame_length}
+
+
+def read_mp3(f, size):
+    info = _empty('mp3')
+    head = f.read(HEAD_SIZE)
+    audio_start = id3v2_size(head)
+    if audio_start:
+        parse_id3v2(head[:min(audio_start, HEAD_SIZE)], info['tags'])
+        f.seek(audio_start)
+        head = f.read(HEAD_SIZE)
+
+    # Première trame valide, confirmée par la trame suivante si elle est lue
+    frame = None
+    pos = 0
+    while pos < len(head) - 4:
+        pos = head.find(b'\xff', pos)
+        if pos < 0:
+            break
+        frame = parse_mpeg_header(head, pos)
+        if frame:
+            following = pos + frame['frame_length']
+            if following + 4 > len(head) or parse_mpeg_header(head, following):
+                break
+            frame = None
+        pos += 1
+    if frame is None:
+        raise MetadataError("Aucune trame MPEG trouvée.")
+    audio_start += pos
+
+    info['sample_rate'] = frame['sample_rate']
+    info['channels'] = frame['channels']
+    info['bitrate'] = frame['bitrate']
+
+    tail_size = min(size, 128)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    parse_id3v1(tail, info['tags'])
+    audio_bytes = size - audio_start - (128 if tail[-128:-125] == b'TAG' else 0)
+
+    # En-tête VBR (Xing/Info ou VBRI) : nombre exact de trames
+    if frame['version'] == 1:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+    frames = None
+    xing = pos + 4 + side_info
+    if head[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack_from('>I', head, xing + 4)[0]
+        field = xing + 8
+        if flags & 0x01:
+            frames = struct.unpack_from('>I', head, field)[0]
+            field += 4
+        if flags & 0x02:
+            audio_bytes = struct.unpack_from('>I', head, field)[0]
+    elif head[pos + 36:pos + 40] == b'VBRI':
+        audio_bytes, frames = struct.unpack_from('>II', head, pos + 46)
+
+    if frames:
+        info['duration'] = frames * frame['samples'] / frame['sample_rate']
+        info['bitrate'] = int(audio_bytes * 8 / info['duration']) if info['duration'] else None
+    elif frame['bitrate']:
+        info['duration'] = audio_bytes * 8 / frame['bitrate']
+    return info
+
+
+# --- WAV ---
+
+WAV_INFO_KEYS = {b'INAM': 'title', b'IART': 'artist', b'IPRD': 'album', b'ICRD': 'date',
+                 b'IGNR': 'genre', b'ITRK': 'tracknumber'}
+
+
+# Parcours des chunks RIFF par seek : seuls leurs en-têtes (et fmt/LIST) sont
+# lus. Retourne le format, la position et la taille des données audio.
+def read_wav_layout(f, size):
+    header = f.read(12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise MetadataError("En-tête RIFF/WAVE absent.")
+    layout = {'fmt': None, 'data_offset': None, 'data_size': None, 'info': None}
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+        if chunk_id == b'fmt ':
+            fmt = f.read(min(chunk_size, 40))
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack_from('<HHIIHH', fmt)
+            if audio_format == 0xFFFE and len(fmt) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE : le vrai format est au début du GUID
+                audio_format = struct.unpack_from('<H', fmt, 24)[0]
+            layout['fmt'] = {'audio_format': audio_format, 'channels': channels, 'sample_rate': sample_rate,
+                             'byte_rate': byte_rate, 'block_align': block_align, 'bits_per_sample': bits}
+        elif chunk_id == b'data':
+            layout['data_offset'] = pos + 8
+            layout['data_size'] = min(chunk_size, size - pos - 8)
+        elif chunk_id == b'LIST' and chunk_size <= HEAD_SIZE:
+            data = f.read(chunk_size)
+            if data[:4] == b'INFO':
+                layout['info'] = data[4:]
+        pos += 8 + chunk_size + (chunk_size & 1)
+    if layout['fmt'] is None or layout['data_offset'] is None:
+        raise MetadataError("Chunk fmt ou data absent.")
+    return layout
+
+
+def read_wav(f, size):
+    info = _empty('wav')
+    layout = read_wav_layout(f, size)
+    fmt = layout['fmt']
+    info.update(channels=fmt['channels'], sample_rate=fmt['sample_rate'],
+                bits_per_sample=fmt['bits_per_sample'], bitrate=fmt['byte_rate'] * 8)
+    data = layout['info'] or b''
+    pos = 0
+    while pos + 8 <= len(data):
+        sub_id, sub_size = struct.unpack_from('<4sI', data, pos)
+        if sub_id in WAV_INFO_KEYS:
+            _set_tag(info['tags'], WAV_INFO_KEYS[sub_id], data[pos + 8:pos + 8 + sub_size])
+        pos += 8 + sub_size + (sub_size & 1)
+    if fmt['byte_rate']:
+        info['duration'] = layout['data_size'] / fmt['byte_rate']
+    return info
+
+
+# --- FLAC ---
+
+def read_flac(f, size):
+    info = _empty('flac')
+    head = f.read(10)
+    offset = id3v2_size(head)
+    f.seek(offset)
+    if f.read(4) != b'fLaC':
+        raise MetadataError("Signature fLaC absente.")
+    total_samples = 0
+    while True:
+        block_header = f.read(4)
+        if len(block_header) < 4:
+            break
+        last = block_header[0] & 0x80
+        block_type = block_header[0] & 0x7F
+        length = int.from_bytes(block_header[1:4], 'big')
+        if block_type == 0:
+            data = f.read(length)
+            packed = int.from_bytes(data[10:18], 'big')
+            info['sample_rate'] = packed >> 44
+            info['channels'] = ((packed >> 41) & 0x07) + 1
+            info['bits_per_sample'] = ((packed >> 36) & 0x1F) + 1
+            total_samples = packed & 0xFFFFFFFFF
+        elif block_type == 4 and length <= HEAD_SIZE:
+            parse_vorbis_comment(f.read(length), info['tags'])
+        else:
+            f.seek(length, os.SEEK_CUR)
+        if last:
+            break
+    if info['sample_rate'] and total_samples:
+        info['duration'] = total_samples / info['sample_rate']
+        info['bitrate'] = int((size - f.tell()) * 8 / info['duration'])
+    return info
+
+
+# --- Ogg (Vorbis, Opus) ---
+
+def _ogg_packets(data):
+    # Reconstitue les paquets complets présents dans data
+    packets = []
+    current = b''
+    pos = 0
+    while pos + 27 <= len(data) and data[pos:pos + 4] == b'OggS':
+        segments = data[pos + 26]
+        table = data[pos + 27:pos + 27 + segments]
+        pos += 27 + segments
+        for lacing in table:
+            current += data[pos:pos + lacing]
+            pos += lacing
+            if lacing < 255:
+                packets.append(current)
+                current = b''
+        if len(packets) >= 2:
+            break
+    return packets
+
+
+def read_ogg(f, size):
+    head = f.read(HEAD_SIZE)
+    if head[:4] != b'OggS':
+        raise MetadataError("Signature OggS absente.")
+    serial = head[14:18]
+    packets = _ogg_packets(head)
+    if not packets:
+        raise MetadataError("Flux Ogg vide.")
+    ident = packets[0]
+    pre_skip = 0
+    if ident[:7] == b'\x01vorbis':
+        info = _empty('vorbis')
+        channels, sample_rate, _, nominal = struct.unpack_from('<BIiI', ident, 11)
+        if not sample_rate:
+            raise MetadataError("Fréquence d'échantillonnage Vorbis nulle.")
+        info.update(channels=channels, sample_rate=sample_rate, bitrate=nominal or None)
+        granule_rate = sample_rate
+        if len(packets) > 1 and packets[1][:7] == b'\x03vorbis':
+            parse_vorbis_comment(packets[1][7:], info['tags'])
+    elif ident[:8] == b'OpusHead':
+        info = _empty('opus')
+        channels, pre_skip, sample_rate = struct.unpack_from('<BHI', ident, 9)
+        info.update(channels=channels, sample_rate=sample_rate or 48000)
+        granule_rate = 48000
+        if len(packets) > 1 and packets[1][:8] == b'OpusTags':
+            parse_vorbis_comment(packets[1][8:], info['tags'])
+    else:
+        raise MetadataError("Codec Ogg non pris en charge.")
+
+    # Durée : position (granule) de la dernière page du flux
+    tail_size = min(size, TAIL_SIZE)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    pos = tail.rfind(b'OggS')
+    while pos >= 0:
+        if tail[pos + 14:pos + 18] == serial and pos + 14 <= len(tail):
+            granule = struct.unpack_from('<q', tail, pos + 6)[0]
+            if granule > 0:
+                info['duration'] = max(granule - pre_skip, 0) / granule_rate
+                break
+        pos = tail.rfind(b'OggS', 0, pos)
+    if info['duration']:
+        info['bitrate'] = int(size * 8 / info['duration'])
+    return info
+
+
+# --- MP4 / M4A ---
+
+MP4_TAGS = {b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album', b'\xa9day': 'date',
+            b'\xa9gen': 'genre'}
+MP4_CONTAINERS = {b'trak', b'mdia', b'minf', b'stbl', b'udta', b'ilst'}
+
+
+def _mp4_atoms(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        atom_size, atom_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if atom_size == 1:
+            atom_size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = end - pos
+        if atom_size < header:
+            break
+        yield atom_type, pos + header, min(pos + atom_size, end)
+        pos += atom_size
+
+
+def _parse_moov(data, start, end, info, state):
+    for atom_type, body, stop in _mp4_atoms(data, start, end):
+        if atom_type == b'mvhd':
+            if data[body] == 1:
+                timescale, duration = struct.unpack_from('>IQ', data, body + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', data, body + 12)
+            if timescale:
+                info['duration'] = duration / timescale
+        elif atom_type == b'stsd' and not state.get('audio'):
+            entry = body + 8
+            codec = data[entry + 4:entry + 8]
+            if codec in (b'mp4a', b'alac'):
+                state['audio'] = True
+                channels, bits = struct.unpack_from('>HH', data, entry + 24)
+                sample_rate = struct.unpack_from('>I', data, entry + 32)[0] >> 16
+                info.update(channels=channels, sample_rate=sample_rate)
+                info['format'] = 'alac' if codec == b'alac' else 'aac'
+                if codec == b'alac':
+                    info['bits_per_sample'] = bits
+                _parse_sample_entry(data, entry + 36, stop, info)
+        elif atom_type == b'meta':
+            # 'meta' est un atome complet : 4 octets de version/flags
+            _parse_moov(data, body + 4, stop, info, state)
+        elif atom_type in MP4_CONTAINERS:
+            _parse_moov(data, body, stop, info, state)
+        elif atom_type in MP4_TAGS or atom_type == b'trkn':
+            for child, child_body, child_stop in _mp4_atoms(data, body, stop):
+                if child == b'data':
+                    value = data[child_body + 8:child_stop]
+                    if atom_type == b'trkn':
+                        if len(value) >= 4:
+                            _set_tag(info['tags'], 'tracknumber', str(struct.unpack_from('>H', value, 2)[0]))
+                    else:
+                        _set_tag(info['tags'], MP4_TAGS[atom_type], value)
+                    break
+
+
+def _parse_sample_entry(data, start, end, info):
+    for atom_type, body, stop in _mp4_atoms(data, start, end):
+        if atom_type == b'esds':
+            # Descripteurs MPEG-4 : ES (0x03) puis DecoderConfig (0x04)
+            pos = body + 4
+            while pos < stop:
+                tag = data[pos]
+                pos += 1
+                length = 0
+                for _ in range(4):
+                    byte = data[pos]
+                    pos += 1
+                    length = (length << 7) | (byte & 0x7F)
+                    if not byte & 0x80:
+                        break
+                if tag == 0x03:
+                    flags = data[pos + 2]
+                    pos += 3
+                    if flags & 0x80:
+                        pos += 2
+                    if flags & 0x40:
+                        pos += 1 + data[pos]
+                    if flags & 0x20:
+                        pos += 2
+                elif tag == 0x04:
+                    avg_bitrate = struct.unpack_from('>I', data, pos + 9)[0]
+                    info['bitrate'] = avg_bitrate or info['bitrate']
+                    break
+                else:
+                    pos += length
+        elif atom_type == b'alac' and stop - body >= 28:
+            # Configuration ALAC : profondeur et fréquence réelles
+            info['bits_per_sample'] = data[body + 9]
+            info['sample_rate'] = struct.unpack_from('>I', data, body + 24)[0]
+
+
+def read_mp4(f, size):
+    info = _empty('aac')
+    pos = 0
+    moov = None
+    # Parcours des atomes de premier niveau par seek, sans lire mdat
+    while pos + 8 <= size:
+        f.seek(pos)
+        header = f.read(16)
+        atom_size, atom_type = struct.unpack_from('>I4s', header)
+        if atom_size == 1:
+            atom_size = struct.unpack_from('>Q', header, 8)[0]
+        elif atom_size == 0:
+            atom_size = size - pos
+        if atom_size < 8:
+            break
+        if atom_type == b'moov':
+            if atom_size > MAX_MOOV_SIZE:
+                raise MetadataError("Atome moov trop grand.")
+            f.seek(pos)
+            moov = f.read(atom_size)
+            break
+        pos += atom_size
+    if moov is None:
+        raise MetadataError("Atome moov absent.")
+    _parse_moov(moov, 8, len(moov), info, {})
+    if info['bitrate'] is None and info['duration']:
+        info['bitrate'] = int(size * 8 / info['duration'])
+    return info
+
+
+READERS = {'.mp3': read_mp3, '.wav': read_wav, '.flac': read_flac, '.ogg': read_ogg, '.m4a': read_mp4}
+
+
+def read_metadata(path):
+    reader = READERS.get(os.path.splitext(path.lower())[1])
+    if reader is None:
+        raise MetadataError("Format non pris en charge.")
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        try:
+            return reader(f, size)
+        except (struct.error, IndexError, ValueError) as e:
+            raise MetadataError(f"En-tête illisible : {e}")
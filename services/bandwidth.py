@@ -0,0 +1,136 @@
+# services/bandwidth.py
+import time
+import threading
+
+from config import Config
+
+# Partage de la bande passante entre les lectures de fichiers.
+#
+# Chaque flux (réponse 200/206 de send_audio_file) consomme des jetons dans
+# des seaux (token bucket) : un seau global, un par session et un par lien
+# partagé, chacun avec son débit (octets/s, 0 = illimité). Avant chaque bloc
+# envoyé, le bloc est réservé dans tous les seaux du flux ; s'ils sont à
+# découvert, le flux attend le temps nécessaire à leur remplissage. L'attente
+# a lieu entre deux blocs, pendant l'envoi : aucune requête n'est mise en
+# attente avant de commencer, le thread est simplement occupé plus longtemps
+# par une réponse qui l'occupait déjà.
+#
+# Les réservations étant servies dans l'ordre d'arrivée, les flux qui
+# partagent un seau se répartissent son débit. Un lien très diffusé est
+# borné par son propre seau (et son nombre de flux simultanés) et laisse le
+# reste du débit global aux autres utilisateurs.
+#
+# Les seaux sont propres à chaque processus : avec plusieurs workers, les
+# limites s'appliquent par worker.
+
+# Au-delà, les seaux inactifs (et pleins) sont oubliés
+MAX_IDLE_BUCKETS = 1024
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    # Réserve amount octets ; retourne le délai (secondes) avant de les envoyer
+    def reserve(self, amount):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    # Vrai si le seau s'est rempli depuis sa dernière utilisation
+    def idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class ThrottledStream:
+    # Corps de réponse limité par les seaux du flux ; close() libère la place
+    # du flux (fin de l'envoi, client parti ou réponse HEAD)
+    def __init__(self, scheduler, iterable, buckets, share_token):
+        self._scheduler = scheduler
+        self._iterable = iterable
+        self._buckets = buckets
+        self._share_token = share_token
+        self._closed = False
+
+    def __iter__(self):
+        for data in self._iterable:
+            if self._buckets:
+                delay = max(bucket.reserve(len(data)) for bucket in self._buckets)
+                if delay > 0:
+                    self._scheduler.sleep(delay)
+            yield data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._scheduler.release(self._share_token)
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+class BandwidthScheduler:
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, scope, key, rate):
+        if not rate:
+            return None
+        with self._lock:
+            bucket = self._buckets.get((scope, key))
+            if bucket is None:
+                if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                    now = self.clock()
+                    for idle in [k for k, b in self._buckets.items() if b.idle(now)]:
+                        del self._buckets[idle]
+                burst = max(rate * Config.BANDWIDTH_BURST_SECONDS, 1)
+                bucket = self._buckets[(scope, key)] = TokenBucket(rate, burst, self.clock)
+            return bucket
+
+    # Ouvre un flux pour une session (et un lien partagé) ; None si le lien a
+    # déjà SHARE_MAX_STREAMS flux en cours
+    def acquire(self, session_key, share_token=None):
+        if share_token is not None:
+            with self._lock:
+                active = self._streams.get(share_token, 0)
+                if Config.SHARE_MAX_STREAMS and active >= Config.SHARE_MAX_STREAMS:
+                    return None
+                self._streams[share_token] = active + 1
+        buckets = [self._bucket('global', None, Config.BANDWIDTH_GLOBAL_LIMIT),
+                   self._bucket('session', session_key, Config.BANDWIDTH_SESSION_LIMIT)]
+        if share_token is not None:
+            buckets.append(self._bucket('share', share_token, Config.BANDWIDTH_SHARE_LIMIT))
+        return [bucket for bucket in buckets if bucket is not None]
+
+    def release(self, share_token):
+        if share_token is None:
+            return
+        with self._lock:
+            active = self._streams.get(share_token, 0) - 1
+            if active > 0:
+                self._streams[share_token] = active
+            else:
+                self._streams.pop(share_token, None)
+
+    def active_streams(self, share_token):
+        with self._lock:
+            return self._streams.get(share_token, 0)
+
+    def wrap(self, iterable, buckets, share_token=None):
+        return ThrottledStream(self, iterable, buckets, share_token)
+
+
+bandwidth_scheduler = BandwidthScheduler()
@@ -0,0 +1,224 @@
+# services/catalog.py
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from services.db import SqliteDatabase
+from services.audio_metadata import read_metadata, MetadataError
+
+# Catalogue des morceaux : durée, fréquence, profondeur/débit, canaux et tags
+# de chaque fichier audio de UPLOAD_FOLDER.
+#
+# L'extraction (services/audio_metadata.py) ne lit que les en-têtes et tourne
+# dans un pool de threads, lancée au démarrage et après chaque envoi. Les
+# résultats sont gardés dans DATA_FOLDER/catalog.db, indexés par chemin et
+# validés par taille + mtime : un fichier inchangé n'est jamais relu, ni au
+# redémarrage ni à l'affichage.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tracks (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        metadata TEXT,
+        error TEXT
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+# Nombre maximal de paramètres par requête SQL (limite SQLite)
+BATCH_SIZE = 500
+
+
+class Catalog:
+    def __init__(self, db_path, upload_folder):
+        self.db = SqliteDatabase(db_path, SCHEMA)
+        self.upload_folder = os.path.abspath(upload_folder)
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def relative_path(self, full_path):
+        return os.path.relpath(full_path, self.upload_folder).replace(os.sep, '/')
+
+    def _full_path(self, relative_path):
+        return os.path.join(self.upload_folder, *relative_path.split('/'))
+
+    def _pool(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=Config.CATALOG_WORKERS,
+                                                thread_name_prefix='catalog')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    # Lignes à jour (même taille et mtime) des entrées données, par chemin
+    def _current_rows(self, prefix, entries, columns):
+        wanted = {prefix + entry.name: entry for entry in entries}
+        paths = list(wanted)
+        conn = self.db.connect()
+        for i in range(0, len(paths), BATCH_SIZE):
+            batch = paths[i:i + BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT path, size, mtime_ns{columns} FROM tracks WHERE path IN ({','.join('?' * len(batch))})",
+                batch).fetchall()
+            for row in rows:
+                st = wanted[row['path']].stat
+                if row['size'] == st.st_size and row['mtime_ns'] == st.st_mtime_ns:
+                    yield row
+
+    # Métadonnées connues pour les fichiers d'un dossier (entrées de l'index
+    # des dossiers). Les fichiers absents ou modifiés sont mis en file.
+    def lookup(self, relative_dir, entries):
+        prefix = relative_dir.strip('/') + '/' if relative_dir.strip('/') else ''
+        found = {row['path']: json.loads(row['metadata']) if row['metadata'] else None
+                 for row in self._current_rows(prefix, entries, ', metadata')}
+        for path in (prefix + entry.name for entry in entries):
+            if path not in found:
+                self.schedule(path)
+        return {path[len(prefix):]: metadata for path, metadata in found.items() if metadata}
+
+    # Fichiers parmi entries dont le catalogue est à jour : ce qui change le
+    # rendu de ces entrées (clé des pages mises en cache, propre au dossier)
+    def stamp(self, relative_dir, entries):
+        prefix = relative_dir.strip('/') + '/' if relative_dir.strip('/') else ''
+        return tuple(sorted(row['path'][len(prefix):] for row in self._current_rows(prefix, entries, '')))
+
+    def schedule(self, relative_path):
+        with self._lock:
+            if relative_path in self._pending:
+                return None
+            self._pending.add(relative_path)
+        return self._pool().submit(self._refresh_pending, relative_path)
+
+    def _refresh_pending(self, relative_path):
+        try:
+            return self.refresh(relative_path)
+        finally:
+            with self._lock:
+                self._pending.discard(relative_path)
+
+    # Extrait (si besoin) et enregistre les métadonnées d'un fichier
+    def refresh(self, relative_path):
+        full_path = self._full_path(relative_path)
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            self.forget(relative_path)
+            return None
+        conn = self.db.connect()
+        row = conn.execute('SELECT size, mtime_ns, metadata FROM tracks WHERE path = ?',
+                           (relative_path,)).fetchone()
+        if row and row['size'] == st.st_size and row['mtime_ns'] == st.st_mtime_ns:
+            return json.loads(row['metadata']) if row['metadata'] else None
+
+        metadata, error = None, None
+        try:
+            metadata = read_metadata(full_path)
+        except (MetadataError, OSError) as e:
+            error = str(e)
+        with self.db.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO tracks (path, size, mtime_ns, metadata, error)'
+                         ' VALUES (?, ?, ?, ?, ?)',
+                         (relative_path, st.st_size, st.st_mtime_ns,
+                          json.dumps(metadata) if metadata else None, error))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') ON CONFLICT (key)"
+                         " DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        if metadata:
+            from services.search_index import get_search_index
+
+            get_search_index().set_tags(relative_path, metadata)
+        return metadata
+
+    # Change à chaque métadonnée enregistrée (clé des pages mises en cache)
+    def version(self):
+        row = self.db.connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row['value']) if row else 0
+
+    def forget(self, relative_path):
+        relative_path = relative_path.strip('/')
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM tracks WHERE path = ? OR substr(path, 1, ?) = ?",
+                         (relative_path, len(relative_path) + 1, relative_path + '/'))
+
+    # Élément déplacé : les métadonnées déjà lues suivent le nouveau chemin
+    def rename_prefix(self, old_path, new_path):
+        with self.db.transaction() as conn:
+            conn.execute("UPDATE OR REPLACE tracks SET path = ? || substr(path, ?)"
+                         " WHERE path = ? OR substr(path, 1, ?) = ?",
+                         (new_path, len(old_path) + 1, old_path, len(old_path) + 1, old_path + '/'))
+
+    # Parcourt toute la bibliothèque et met en file les fichiers à (re)lire
+    # (retourne les tâches lancées)
+    def scan(self):
+        known = {row['path']: (row['size'], row['mtime_ns'])
+                 for row in self.db.connect().execute('SELECT path, size, mtime_ns FROM tracks')}
+        seen = set()
+        futures = []
+        for root, dirs, files in os.walk(self.upload_folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if os.path.splitext(name.lower())[1] not in Config.ALLOWED_EXTENSIONS:
+                    continue
+                relative_path = self.relative_path(os.path.join(root, name))
+                seen.add(relative_path)
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                if known.get(relative_path) != (st.st_size, st.st_mtime_ns):
+                    future = self.schedule(relative_path)
+                    if future is not None:
+                        futures.append(future)
+        removed = [path for path in known if path not in seen]
+        with self.db.transaction() as conn:
+            conn.executemany('DELETE FROM tracks WHERE path = ?', [(path,) for path in removed])
+        return futures
+
+    def scan_async(self):
+        return self._pool().submit(self.scan)
+
+
+_catalog = None
+_catalog_key = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog, _catalog_key
+    key = (Config.DATA_FOLDER, Config.UPLOAD_FOLDER)
+    with _catalog_lock:
+        if _catalog is None or _catalog_key != key:
+            _catalog = Catalog(os.path.join(Config.DATA_FOLDER, 'catalog.db'), Config.UPLOAD_FOLDER)
+            _catalog_key = key
+        return _catalog
+
+
+# Résumé lisible des métadonnées pour l'affichage
+def describe_track(metadata):
+    parts = []
+    tags = metadata.get('tags') or {}
+    if tags.get('artist') and tags.get('title'):
+        parts.append(f"{tags['artist']} — {tags['title']}")
+    elif tags.get('title'):
+        parts.append(tags['title'])
+    if metadata.get('duration'):
+        minutes, seconds = divmod(int(round(metadata['duration'])), 60)
+        parts.append(f"{minutes}:{seconds:02d}")
+    parts.append(metadata['format'].upper())
+    if metadata.get('sample_rate'):
+        quality = f"{metadata['sample_rate'] / 1000:g} kHz"
+        if metadata.get('bits_per_sample'):
+            quality += f" / {metadata['bits_per_sample']} bits"
+        elif metadata.get('bitrate'):
+            quality += f" / {round(metadata['bitrate'] / 1000)} kb/s"
+        parts.append(quality)
+    channels = metadata.get('channels')
+    if channels:
+        parts.append({1: 'mono', 2: 'stéréo'}.get(channels, f'{channels} canaux'))
+    return ' · '.join(parts)
@@ -0,0 +1,41 @@
+# services/db.py
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Accès partagé aux bases SQLite de DATA_FOLDER : une connexion par thread et
+# par processus (gunicorn peut forker après la création d'un store), mode WAL
+# pour que les lectures ne bloquent pas les écritures d'un autre worker.
+
+
+class SqliteDatabase:
+    def __init__(self, db_path, schema):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connect().executescript(schema)
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Transaction en écriture (verrou pris dès le début)
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
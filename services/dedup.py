@@ -0,0 +1,223 @@
+# services/dedup.py
+import os
+import errno
+import hashlib
+import secrets
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de reflink
+    fcntl = None
+
+from config import Config
+from services.db import SqliteDatabase
+
+# Déduplication des envois par empreinte du contenu.
+#
+# L'empreinte est calculée pendant l'écriture de l'envoi, sans relire le
+# fichier : SHA-256 de chaque bloc de HASH_BLOCK_SIZE octets, puis SHA-256
+# de la suite de ces empreintes. Découpée ainsi, elle se calcule aussi bien
+# d'un seul flux (formulaire) que morceau par morceau, sur plusieurs requêtes
+# (envois reprenables, services/uploads.py).
+#
+# DATA_FOLDER/dedup.db associe chaque empreinte à un fichier de référence et
+# liste les fichiers qui partagent son contenu. Un envoi identique à un
+# fichier existant est remplacé par un lien physique vers celui-ci (ou un
+# reflink si les liens physiques sont refusés). Supprimer un de ces fichiers
+# ne libère rien tant qu'un autre lien existe : forget() retire le chemin et
+# désigne si besoin une nouvelle référence parmi les liens restants.
+#
+# Un lien physique partage la date de modification de son inode : le fichier
+# dédupliqué garde donc la date du fichier de référence et se range à sa
+# place dans les listes triées par date. Elle n'est pas modifiée, ce qui
+# changerait aussi la date (et l'ETag, l'entrée du catalogue, le rang dans
+# la liste de leur dossier) de toutes les copies existantes. Un reflink est
+# un inode distinct : il reçoit la date de l'envoi.
+
+HASH_BLOCK_SIZE = 1024 * 1024
+DIGEST_SIZE = hashlib.sha256().digest_size
+# ioctl Linux de clonage de fichier (btrfs, xfs...)
+FICLONE = 0x40049409
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        digest TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        digest TEXT NOT NULL REFERENCES blobs(digest),
+        ino INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS files_digest ON files(digest);
+"""
+
+
+class BlockHasher:
+    def __init__(self):
+        self._block = hashlib.sha256()
+        self._filled = 0
+        self.digests = []
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), HASH_BLOCK_SIZE - self._filled)
+            self._block.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == HASH_BLOCK_SIZE:
+                self.digests.append(self._block.digest())
+                self._block = hashlib.sha256()
+                self._filled = 0
+
+    # Empreintes des blocs (le dernier bloc peut être incomplet)
+    def finish(self):
+        if self._filled:
+            self.digests.append(self._block.digest())
+            self._block = hashlib.sha256()
+            self._filled = 0
+        return b''.join(self.digests)
+
+
+def content_digest(block_digests):
+    return hashlib.sha256(block_digests).hexdigest()
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink indisponible")
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+class DedupIndex:
+    def __init__(self, db_path, upload_folder):
+        self.db = SqliteDatabase(db_path, SCHEMA)
+        self.upload_folder = os.path.abspath(upload_folder)
+
+    def relative_path(self, full_path):
+        return os.path.relpath(full_path, self.upload_folder).replace(os.sep, '/')
+
+    def _full_path(self, relative_path):
+        return os.path.join(self.upload_folder, *relative_path.split('/'))
+
+    def _stat(self, relative_path):
+        try:
+            return os.stat(self._full_path(relative_path))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    # Fichier de référence encore valide pour une empreinte (ou None)
+    def _canonical(self, conn, digest, size):
+        rows = conn.execute(
+            'SELECT f.path, f.ino, f.path = b.path AS is_canonical'
+            ' FROM blobs b JOIN files f ON f.digest = b.digest'
+            ' WHERE b.digest = ? AND b.size = ? ORDER BY is_canonical DESC',
+            (digest, size)).fetchall()
+        for row in rows:
+            st = self._stat(row['path'])
+            if st is not None and st.st_ino == row['ino'] and st.st_size == size:
+                if not row['is_canonical']:
+                    conn.execute('UPDATE blobs SET path = ? WHERE digest = ?', (row['path'], digest))
+                return row['path']
+            # Fichier supprimé ou modifié hors de l'application
+            conn.execute('DELETE FROM files WHERE path = ?', (row['path'],))
+        conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+        return None
+
+    # Enregistre un fichier qui vient d'être envoyé ; s'il a le même contenu
+    # qu'un fichier connu, il est remplacé par un lien vers celui-ci.
+    # Retourne le nombre d'octets économisés.
+    def store(self, full_path, digest):
+        relative_path = self.relative_path(full_path)
+        st = os.stat(full_path)
+        with self.db.transaction() as conn:
+            canonical = self._canonical(conn, digest, st.st_size)
+            if canonical is None or canonical == relative_path:
+                conn.execute('INSERT OR REPLACE INTO blobs (digest, path, size) VALUES (?, ?, ?)',
+                             (digest, relative_path, st.st_size))
+                conn.execute('INSERT OR REPLACE INTO files (path, digest, ino) VALUES (?, ?, ?)',
+                             (relative_path, digest, st.st_ino))
+                return 0
+
+            source = self._full_path(canonical)
+            tmp_path = os.path.join(os.path.dirname(full_path), f'.{secrets.token_hex(8)}.link')
+            try:
+                os.link(source, tmp_path)
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.EXDEV, errno.EMLINK):
+                    raise
+                try:
+                    _reflink(source, tmp_path)
+                except OSError:
+                    # Ni lien ni reflink possibles : la copie est conservée
+                    return 0
+                # Inode propre au reflink : il garde la date de l'envoi
+                os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, full_path)
+            conn.execute('INSERT OR REPLACE INTO files (path, digest, ino) VALUES (?, ?, ?)',
+                         (relative_path, digest, os.stat(full_path).st_ino))
+            return st.st_size
+
+    # Oublie un fichier (ou tout un dossier) supprimé. Si c'était la
+    # référence d'une empreinte, un autre lien encore présent prend le relais.
+    def forget(self, relative_path):
+        relative_path = relative_path.strip('/')
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                'SELECT path, digest FROM files WHERE path = ? OR substr(path, 1, ?) = ?',
+                (relative_path, len(relative_path) + 1, relative_path + '/')).fetchall()
+            for row in rows:
+                if self._stat(row['path']) is not None:
+                    continue
+                conn.execute('DELETE FROM files WHERE path = ?', (row['path'],))
+                blob = conn.execute('SELECT path, size FROM blobs WHERE digest = ?', (row['digest'],)).fetchone()
+                if blob is not None and blob['path'] == row['path']:
+                    self._canonical(conn, row['digest'], blob['size'])
+
+    # Élément déplacé : mêmes fichiers (et inodes), nouveaux chemins
+    def rename_prefix(self, old_path, new_path):
+        params = (new_path, len(old_path) + 1, old_path, len(old_path) + 1, old_path + '/')
+        with self.db.transaction() as conn:
+            conn.execute('UPDATE OR REPLACE files SET path = ? || substr(path, ?)'
+                         ' WHERE path = ? OR substr(path, 1, ?) = ?', params)
+            conn.execute('UPDATE blobs SET path = ? || substr(path, ?)'
+                         ' WHERE path = ? OR substr(path, 1, ?) = ?', params)
+
+    # Octets économisés : chaque fichier au-delà du premier d'une empreinte
+    def report(self):
+        row = self.db.connect().execute(
+            'SELECT COUNT(*) AS files, COUNT(DISTINCT f.digest) AS contents,'
+            ' COALESCE(SUM(b.size), 0) AS linked_bytes'
+            ' FROM files f JOIN blobs b ON b.digest = f.digest').fetchone()
+        unique_bytes = self.db.connect().execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        return {
+            'files': row['files'],
+            'unique_contents': row['contents'],
+            'logical_bytes': row['linked_bytes'],
+            'stored_bytes': unique_bytes,
+            'bytes_saved': row['linked_bytes'] - unique_bytes,
+        }
+
+
+_dedup_index = None
+_dedup_index_key = None
+_dedup_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    global _dedup_index, _dedup_index_key
+    key = (Config.DATA_FOLDER, Config.UPLOAD_FOLDER)
+    with _dedup_index_lock:
+        if _dedup_index is None or _dedup_index_key != key:
+            _dedup_index = DedupIndex(os.path.join(Config.DATA_FOLDER, 'dedup.db'), Config.UPLOAD_FOLDER)
+            _dedup_index_key = key
+        return _dedup_index
@@ -0,0 +1,156 @@
+# services/dir_index.py
+import os
+import stat
+import time
+import base64
+import bisect
+import threading
+from collections import OrderedDict, namedtuple
+
+from config import Config
+
+# Index des métadonnées de dossiers.
+#
+# Un dossier est lu en une seule passe os.scandir : le type de chaque entrée
+# vient du DirEntry (pas de stat supplémentaire) et seul un stat par fichier
+# est fait pour obtenir la date de modification, conservée dans l'index.
+# Le résultat est mis en cache par dossier et revalidé par un unique stat du
+# dossier lui-même : si son mtime a changé, il est relu. L'application
+# invalide aussi explicitement les dossiers qu'elle modifie.
+
+FileEntry = namedtuple('FileEntry', ['name', 'stat'])
+
+
+# Clé de tri des fichiers : du plus récent au plus ancien, puis par nom
+def sort_key(entry):
+    return (-entry.stat.st_mtime_ns, entry.name)
+
+
+# Curseur de pagination opaque : position (mtime, nom) du dernier fichier vu
+def encode_cursor(entry):
+    raw = f'{entry.stat.st_mtime_ns}:{entry.name}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        mtime_ns, name = raw.split(':', 1)
+        return (-int(mtime_ns), name)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Curseur invalide.")
+
+# Un dossier modifié moins d'une seconde avant sa lecture peut encore changer
+# sans que son mtime ne bouge (résolution de l'horloge du système de fichiers) :
+# une telle lecture n'est pas réutilisée.
+RACY_WINDOW_NS = 1_000_000_000
+
+
+class DirectoryListing:
+    __slots__ = ('path', 'mtime_ns', 'files', 'folders', 'racy')
+
+    def __init__(self, path, mtime_ns, files, folders, racy):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.files = files        # FileEntry, du plus récent au plus ancien
+        self.folders = folders    # noms triés par ordre alphabétique
+        self.racy = racy
+
+    def __len__(self):
+        return len(self.files) + len(self.folders)
+
+    # Page de fichiers après le curseur (pagination par clé : la liste déjà
+    # triée est parcourue par dichotomie, sans nouveau tri)
+    def page(self, cursor=None, limit=50):
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(self.files, decode_cursor(cursor), key=sort_key)
+        entries = self.files[start:start + limit]
+        next_cursor = None
+        if start + limit < len(self.files) and entries:
+            next_cursor = encode_cursor(entries[-1])
+        return entries, next_cursor
+
+
+def scan_directory(path, dir_stat=None):
+    if dir_stat is None:
+        dir_stat = os.stat(path)
+    scan_started_ns = time.time_ns()
+    files = []
+    folders = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    if os.path.splitext(entry.name.lower())[1] in Config.ALLOWED_EXTENSIONS:
+                        files.append(FileEntry(entry.name, entry.stat()))
+                elif entry.is_dir() and not entry.name.startswith('.'):
+                    # Les dossiers cachés (suppressions en cours...) ne sont pas listés
+                    folders.append(entry.name)
+            except FileNotFoundError:
+                # Entrée supprimée pendant la lecture
+                continue
+    folders.sort()
+    files.sort(key=sort_key)
+    racy = scan_started_ns - dir_stat.st_mtime_ns < RACY_WINDOW_NS
+    return DirectoryListing(path, dir_stat.st_mtime_ns, files, folders, racy)
+
+
+class DirectoryIndex:
+    def __init__(self):
+        self._listings = OrderedDict()
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    # Retourne la liste du dossier (depuis le cache si elle est à jour),
+    # ou None si le chemin n'est pas un dossier
+    def get(self, path):
+        try:
+            dir_stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.invalidate(path)
+            return None
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            return None
+
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None and listing.mtime_ns == dir_stat.st_mtime_ns and not listing.racy:
+                self._listings.move_to_end(path)
+                return listing
+
+        listing = scan_directory(path, dir_stat)
+        with self._lock:
+            self._remove(path)
+            self._listings[path] = listing
+            self._entries += len(listing)
+            self._evict()
+        return listing
+
+    def invalidate(self, path, recursive=False):
+        with self._lock:
+            self._remove(path)
+            if recursive:
+                prefix = path.rstrip(os.sep) + os.sep
+                for cached in [p for p in self._listings if p.startswith(prefix)]:
+                    self._remove(cached)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._entries = 0
+
+    def _remove(self, path):
+        listing = self._listings.pop(path, None)
+        if listing is not None:
+            self._entries -= len(listing)
+
+    # Éviction LRU : borne le nombre total d'entrées gardées en mémoire
+    # (on garde toujours au moins le dernier dossier lu)
+    def _evict(self):
+        while self._entries > Config.DIR_INDEX_MAX_ENTRIES and len(self._listings) > 1:
+            _, listing = self._listings.popitem(last=False)
+            self._entries -= len(listing)
+
+
+directory_index = DirectoryIndex()
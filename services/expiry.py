@@ -0,0 +1,63 @@
+# services/expiry.py
+import os
+import time
+import threading
+
+from config import Config
+from services.link_store import get_link_store
+from services.analytics import get_share_analytics
+
+# Purge des liens partagés expirés en arrière-plan.
+#
+# Un thread par processus dort jusqu'à la prochaine expiration (lue via
+# l'index sur la date d'expiration du store), bornée par
+# Config.LINK_PURGE_INTERVAL pour voir les liens créés par d'autres workers,
+# puis supprime les liens expirés par lots. notify() le réveille quand ce
+# processus crée un lien qui expire plus tôt. Les statistiques des liens
+# purgés sont supprimées avec eux.
+
+
+class ExpiryScheduler:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='link-expiry', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    # Une passe : purge puis délai avant la prochaine passe (en secondes)
+    def run_once(self):
+        store = get_link_store()
+        now = self.clock()
+        next_expiry = store.next_expiry()
+        if next_expiry is not None and next_expiry <= now:
+            purged = store.purge_expired(now, Config.LINK_PURGE_BATCH_SIZE)
+            if purged and Config.ANALYTICS_ENABLED:
+                get_share_analytics().forget(purged)
+            next_expiry = store.next_expiry()
+        delay = Config.LINK_PURGE_INTERVAL
+        if next_expiry is not None:
+            delay = min(delay, max(next_expiry - now, 0))
+        return delay
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                print(f"Erreur lors de la purge des liens expirés: {e}") # Log pour debug
+                delay = Config.LINK_PURGE_INTERVAL
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+
+expiry_scheduler = ExpiryScheduler()
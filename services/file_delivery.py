@@ -0,0 +1,175 @@
+# services/file_delivery.py
+import os
+import secrets
+import mimetypes
+from urllib.parse import quote
+from flask import request, Response
+from werkzeug.http import http_date, parse_date, parse_range_header, parse_etags
+
+from config import Config
+
+# Envoi des fichiers audio avec prise en charge explicite des requêtes
+# partielles (Range, simple ou multiple), des ETag forts et des requêtes
+# conditionnelles (If-None-Match, If-Modified-Since, If-Range).
+# Le fichier n'est jamais lu en entier : seules les plages demandées sont
+# lues, par blocs, au moment de l'envoi.
+
+CHUNK_SIZE = 64 * 1024
+# Au-delà, la requête Range est ignorée et le fichier envoyé en entier
+MAX_RANGES = 32
+
+AUDIO_MIMETYPES = {
+    '.mp3': 'audio/mpeg',
+    '.ogg': 'audio/ogg',
+    '.wav': 'audio/wav',
+    '.flac': 'audio/flac',
+    '.m4a': 'audio/mp4',
+}
+
+
+def guess_mimetype(path):
+    ext = os.path.splitext(path.lower())[1]
+    return AUDIO_MIMETYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+# ETag fort dérivé de l'inode, de la taille et de la date de modification
+def file_etag(st):
+    return f'{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}'
+
+
+def iter_file_ranges(path, ranges, chunk_size=CHUNK_SIZE):
+    # ranges : liste de (préfixe, début, fin exclue, suffixe)
+    with open(path, 'rb') as f:
+        for prefix, start, stop, suffix in ranges:
+            if prefix:
+                yield prefix
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+            if suffix:
+                yield suffix
+
+
+def _not_modified(etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # Comparaison faible pour If-None-Match (RFC 9110, 13.1.2)
+        return parse_etags(if_none_match).contains_weak(etag)
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if if_modified_since is not None:
+        return last_modified <= int(if_modified_since.timestamp())
+    return False
+
+
+def _if_range_matches(etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        # Comparaison forte : un ETag faible ne correspond jamais
+        return if_range == f'"{etag}"'
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == last_modified
+
+
+# Convertit l'en-tête Range en plages absolues [début, fin[ satisfaisables.
+# Retourne None si l'en-tête doit être ignoré.
+def _resolve_ranges(header, size):
+    parsed = parse_range_header(header)
+    if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > MAX_RANGES:
+        return None
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def send_audio_file(full_path):
+    st = os.stat(full_path)
+    size = st.st_size
+    etag = file_etag(st)
+    last_modified = int(st.st_mtime)
+    mimetype = guess_mimetype(full_path)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'no-cache',
+    }
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    range_header = request.headers.get('Range')
+    ranges = None
+    if range_header and request.method in ('GET', 'HEAD') and _if_range_matches(etag, last_modified):
+        ranges = _resolve_ranges(range_header, size)
+
+    if ranges is None:
+        headers['Content-Length'] = str(size)
+        body = iter_file_ranges(full_path, [(b'', 0, size, b'')])
+        return Response(body, status=200, mimetype=mimetype, headers=headers)
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        headers['Content-Length'] = str(stop - start)
+        body = iter_file_ranges(full_path, [(b'', start, stop, b'')])
+        return Response(body, status=206, mimetype=mimetype, headers=headers)
+
+    # Plusieurs plages : réponse multipart/byteranges dont la taille est
+    # calculée à l'avance
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, stop in ranges:
+        prefix = (f'\r\n--{boundary}\r\n'
+                  f'Content-Type: {mimetype}\r\n'
+                  f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+        parts.append([prefix, start, stop, b''])
+    parts[-1][3] = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    headers['Content-Length'] = str(sum(len(p) + (stop - start) + len(s) for p, start, stop, s in parts))
+    body = iter_file_ranges(full_path, parts)
+    return Response(body, status=206, headers=headers,
+                    content_type=f'multipart/byteranges; boundary={boundary}')
+
+
+# Chemin interne nginx correspondant à un fichier de UPLOAD_FOLDER
+def x_accel_path(full_path):
+    relative_path = os.path.relpath(full_path, os.path.abspath(Config.UPLOAD_FOLDER))
+    relative_path = relative_path.replace(os.sep, '/')
+    return Config.X_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative_path)
+
+
+# Envoie un fichier selon Config.FILE_DELIVERY. En mode délégué, Flask ne fait
+# que les vérifications (chemin, droits) : le proxy lit le fichier et gère
+# lui-même Range et les requêtes conditionnelles.
+def deliver_file(full_path):
+    mode = Config.FILE_DELIVERY
+    if mode == 'python':
+        return send_audio_file(full_path)
+
+    response = Response(status=200, mimetype=guess_mimetype(full_path))
+    if mode == 'x-accel':
+        response.headers['X-Accel-Redirect'] = x_accel_path(full_path)
+    elif mode == 'x-sendfile':
+        # Les en-têtes WSGI sont en latin-1 : on transmet les octets UTF-8 du chemin
+        response.headers['X-Sendfile'] = full_path.encode('utf-8').decode('latin-1')
+    else:
+        raise ValueError(f"FILE_DELIVERY inconnu : {mode}")
+    return response
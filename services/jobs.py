@@ -0,0 +1,301 @@
+# services/jobs.py
+import os
+import json
+import stat
+import time
+import secrets
+import threading
+
+from config import Config
+from services.db import SqliteDatabase
+
+# File de tâches en arrière-plan pour les opérations longues sur la
+# bibliothèque : suppression récursive (d'un ou plusieurs éléments) et
+# déplacement/renommage.
+#
+# Les tâches sont enregistrées dans DATA_FOLDER/jobs.db, partagé par tous
+# les workers : la requête ne fait que créer la tâche et répond tout de
+# suite, quelques threads par processus les exécutent et mettent à jour leur
+# avancement, que le navigateur interroge. Une tâche interrompue (processus
+# arrêté) est reprise après JOB_STALE_AFTER secondes sans nouvelles ; les
+# opérations sont écrites pour pouvoir être rejouées.
+#
+# Les index (dossiers, catalogue, recherche, liens partagés...) sont mis à
+# jour par les fonctions enregistrées avec on() (voir routes/main.py).
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created REAL NOT NULL,
+        started REAL,
+        finished REAL,
+        heartbeat REAL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+"""
+
+# Intervalle minimal entre deux écritures de l'avancement (secondes)
+PROGRESS_INTERVAL = 0.25
+
+
+class JobError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, queue, row):
+        self.queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'])
+        self.total = row['total']
+        self.done = row['done']
+        self._saved_at = 0.0
+
+    def set_total(self, total):
+        self.total = total
+        self.save_progress(force=True)
+
+    def advance(self, count=1):
+        self.done += count
+        self.save_progress()
+
+    def save_progress(self, force=False):
+        now = time.time()
+        if not force and now - self._saved_at < PROGRESS_INTERVAL:
+            return
+        self._saved_at = now
+        with self.queue.db.transaction() as conn:
+            conn.execute('UPDATE jobs SET total = ?, done = ?, heartbeat = ? WHERE id = ?',
+                         (self.total, self.done, now, self.id))
+
+
+class JobQueue:
+    def __init__(self, db_path, upload_folder):
+        self.db = SqliteDatabase(db_path, SCHEMA)
+        self.upload_folder = os.path.abspath(upload_folder)
+        self._handlers = {'delete': self._run_delete, 'move': self._run_move}
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _full_path(self, relative_path):
+        return os.path.join(self.upload_folder, *relative_path.split('/'))
+
+    def _emit(self, event, *args):
+        for listener in _listeners.get(event, []):
+            listener(*args)
+
+    # --- Création et suivi -------------------------------------------------
+
+    def submit(self, kind, params):
+        if kind not in self._handlers:
+            raise JobError(f"Type de tâche inconnu : {kind}")
+        job_id = secrets.token_hex(12)
+        with self.db.transaction() as conn:
+            conn.execute('INSERT INTO jobs (id, kind, params, status, created) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, kind, json.dumps(params), 'queued', time.time()))
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        row = self.db.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._describe(row) if row else None
+
+    def recent(self, limit=20):
+        rows = self.db.connect().execute('SELECT * FROM jobs ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+        return [self._describe(row) for row in rows]
+
+    @staticmethod
+    def _describe(row):
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'params': json.loads(row['params']),
+            'status': row['status'],
+            'total': row['total'],
+            'done': row['done'],
+            'progress': 1.0 if row['status'] == 'done' else (row['done'] / row['total'] if row['total'] else 0.0),
+            'error': row['error'],
+            'created': row['created'],
+            'finished': row['finished'],
+        }
+
+    # --- Exécution -----------------------------------------------------------
+
+    # Réserve la plus ancienne tâche en attente (ou abandonnée par un processus arrêté)
+    def _claim(self):
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat < ?",
+                         (now - Config.JOB_STALE_AFTER,))
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started = COALESCE(started, ?), heartbeat = ?"
+                         " WHERE id = ?", (now, now, row['id']))
+        return Job(self, row)
+
+    def _finish(self, job, error=None):
+        with self.db.transaction() as conn:
+            conn.execute('UPDATE jobs SET status = ?, total = ?, done = ?, error = ?, finished = ? WHERE id = ?',
+                         ('failed' if error else 'done', job.total, job.done, error, time.time(), job.id))
+
+    def run_one(self):
+        job = self._claim()
+        if job is None:
+            return False
+        try:
+            self._handlers[job.kind](job)
+        except (JobError, OSError) as e:
+            self._finish(job, str(e))
+        except Exception as e:
+            print(f"Erreur lors de la tâche {job.id} ({job.kind}): {e}") # Log pour debug
+            self._finish(job, "Erreur interne.")
+        else:
+            self._finish(job)
+        return True
+
+    # Exécute les tâches en attente dans le thread courant (tests, scripts)
+    def run_pending(self):
+        while self.run_one():
+            pass
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(Config.JOB_WORKERS):
+                thread = threading.Thread(target=self._worker, name=f'jobs-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            try:
+                if self.run_one():
+                    continue
+            except Exception as e:
+                print(f"Erreur de la file de tâches: {e}") # Log pour debug
+            # Réveil à chaque nouvelle tâche de ce processus, sinon périodiquement
+            # pour celles créées par les autres workers
+            self._wakeup.wait(Config.JOB_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    # --- Suppression récursive -----------------------------------------------
+
+    def _run_delete(self, job):
+        paths = job.params['paths']
+        # Chaque élément est d'abord renommé en dossier caché : il disparaît
+        # d'un coup de la bibliothèque, puis est vidé en arrière-plan
+        trash = []
+        deleted = []
+        for i, relative_path in enumerate(paths):
+            full_path = self._full_path(relative_path)
+            hidden = os.path.join(os.path.dirname(full_path), f'.deleting-{job.id}-{i}')
+            size = None
+            if os.path.lexists(full_path) and not os.path.lexists(hidden):
+                st = os.lstat(full_path)
+                os.rename(full_path, hidden)
+                # Taille transmise une seule fois (pas lors d'une reprise)
+                if not stat.S_ISDIR(st.st_mode):
+                    size = st.st_size
+            if os.path.lexists(hidden):
+                trash.append((relative_path, hidden))
+            deleted.append((relative_path, size))
+        # Un seul événement pour tous les éléments (liens supprimés en une fois)
+        self._emit('deleted', deleted)
+
+        # Le comptage d'une grande arborescence peut être long : le battement
+        # de cœur est mis à jour à chaque dossier pour que la tâche ne passe
+        # pas pour abandonnée (limité par PROGRESS_INTERVAL)
+        total = len(trash)
+        for _, hidden in trash:
+            if os.path.isdir(hidden) and not os.path.islink(hidden):
+                for _, dirs, files in os.walk(hidden):
+                    total += len(dirs) + len(files)
+                    job.save_progress()
+        job.set_total(total)
+
+        for relative_path, hidden in trash:
+            if os.path.isdir(hidden) and not os.path.islink(hidden):
+                for root, dirs, files in os.walk(hidden, topdown=False):
+                    for name in files:
+                        os.remove(os.path.join(root, name))
+                        rel = relative_path + '/' + os.path.relpath(os.path.join(root, name), hidden).replace(os.sep, '/')
+                        self._emit('file_deleted', rel)
+                        job.advance()
+                    for name in dirs:
+                        path = os.path.join(root, name)
+                        if os.path.islink(path):
+                            os.remove(path)
+                        else:
+                            os.rmdir(path)
+                        job.advance()
+                os.rmdir(hidden)
+            else:
+                os.remove(hidden)
+                self._emit('file_deleted', relative_path)
+            job.advance()
+
+    # --- Déplacement / renommage ---------------------------------------------
+
+    def _run_move(self, job):
+        source = job.params['source']
+        destination = job.params['destination']
+        source_path = self._full_path(source)
+        destination_path = self._full_path(destination)
+        job.set_total(1)
+        if not os.path.lexists(source_path) and os.path.lexists(destination_path) and job.done:
+            # Tâche reprise après le renommage : seuls les index restent à mettre à jour
+            self._emit('moved', source, destination)
+            return
+        if not os.path.lexists(source_path):
+            raise JobError(f"Élément introuvable : {source}")
+        if os.path.lexists(destination_path):
+            raise JobError(f"Un élément existe déjà à cet emplacement : {destination}")
+        if not os.path.isdir(os.path.dirname(destination_path)):
+            raise JobError("Dossier de destination introuvable.")
+        # Même système de fichiers : renommage atomique, quelle que soit la taille du dossier
+        os.rename(source_path, destination_path)
+        job.advance()
+        job.save_progress(force=True)
+        self._emit('moved', source, destination)
+
+
+# Fonctions appelées par les tâches (partagées par toutes les files) :
+#   'deleted' ([(chemin, taille)]) éléments retirés de la bibliothèque par
+#                                 une tâche (taille des fichiers, None pour
+#                                 un dossier)
+#   'file_deleted' (chemin)       fichier effacé du disque
+#   'moved' (source, destination) élément déplacé
+_listeners = {}
+
+
+def on(event, listener):
+    if listener not in _listeners.setdefault(event, []):
+        _listeners[event].append(listener)
+
+
+_queue = None
+_queue_key = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue, _queue_key
+    key = (Config.DATA_FOLDER, Config.UPLOAD_FOLDER)
+    with _queue_lock:
+        if _queue is None or _queue_key != key:
+            _queue = JobQueue(os.path.join(Config.DATA_FOLDER, 'jobs.db'), Config.UPLOAD_FOLDER)
+            _queue_key = key
+        return _queue
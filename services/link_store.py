@@ -0,0 +1,392 @@
+# services/link_store.py
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+from config import Config
+from services.db import SqliteDatabase
+from services.metrics import timed
+
+# Stockage des liens partagés.
+#
+# Chaque lien est un dictionnaire de la forme :
+#   {'link_name', 'item_name', 'is_directory', 'creation_date', 'expiry_date'}
+# Les dates sont des chaînes ISO 8601 avec fuseau horaire.
+#
+# Deux implémentations interchangeables (Config.LINK_STORE) :
+#   - 'sqlite' (par défaut) : base SQLite en mode WAL, indexée par token et
+#     par date d'expiration, sûre avec plusieurs workers gunicorn ;
+#   - 'json' : l'ancien fichier shared_links.json, réécrit de façon atomique
+#     sous verrou (pratique pour le développement, O(n) par opération).
+#
+# version() change à chaque écriture (quel que soit le worker) : elle sert de
+# clé aux caches construits à partir des liens.
+
+
+def _normalize_link(data):
+    # Les anciennes entrées utilisent la clé 'filename' au lieu de 'item_name'
+    item_name = data.get('item_name', data.get('filename'))
+    if not item_name or not data.get('expiry_date'):
+        return None
+    expiry_date = data['expiry_date']
+    return {
+        'link_name': data.get('link_name') or '',
+        'item_name': item_name,
+        'is_directory': bool(data.get('is_directory', False)),
+        'creation_date': data.get('creation_date') or expiry_date,
+        'expiry_date': expiry_date,
+    }
+
+
+def _timestamp(iso_date):
+    return datetime.fromisoformat(iso_date).timestamp()
+
+
+def read_json_links(path):
+    try:
+        with open(path, 'r') as f:
+            links = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(links, dict):
+        return {}
+    return links
+
+
+class SqliteLinkStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS shared_links (
+            token TEXT PRIMARY KEY,
+            link_name TEXT NOT NULL DEFAULT '',
+            item_name TEXT NOT NULL,
+            is_directory INTEGER NOT NULL DEFAULT 0,
+            creation_date TEXT NOT NULL,
+            expiry_date TEXT NOT NULL,
+            expiry_ts REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_shared_links_expiry ON shared_links (expiry_ts);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db = SqliteDatabase(db_path, self.SCHEMA)
+        if legacy_json_path:
+            self.migrate_from_json(legacy_json_path)
+
+    @staticmethod
+    def _row_to_link(row):
+        return {
+            'link_name': row['link_name'],
+            'item_name': row['item_name'],
+            'is_directory': bool(row['is_directory']),
+            'creation_date': row['creation_date'],
+            'expiry_date': row['expiry_date'],
+        }
+
+    def _insert(self, conn, token, link, replace=True):
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        conn.execute(
+            f'{verb} INTO shared_links (token, link_name, item_name, is_directory,'
+            ' creation_date, expiry_date, expiry_ts) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (token, link['link_name'], link['item_name'], int(link['is_directory']),
+             link['creation_date'], link['expiry_date'], _timestamp(link['expiry_date'])))
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') ON CONFLICT (key)"
+                     " DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self):
+        row = self.db.connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row['value']) if row else 0
+
+    # Import unique de l'ancien fichier JSON (y compris la clé 'filename')
+    def migrate_from_json(self, json_path):
+        with self.db.transaction() as conn:
+            done = conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return 0
+            imported = 0
+            for token, data in read_json_links(json_path).items():
+                link = _normalize_link(data) if isinstance(data, dict) else None
+                if link is None:
+                    continue
+                self._insert(conn, token, link, replace=False)
+                imported += 1
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (os.path.abspath(json_path),))
+            self._bump_version(conn)
+            return imported
+
+    @timed('read_shared_links')
+    def get(self, token):
+        row = self.db.connect().execute(
+            'SELECT * FROM shared_links WHERE token = ?', (token,)).fetchone()
+        return self._row_to_link(row) if row else None
+
+    @timed('read_shared_links')
+    def all(self):
+        rows = self.db.connect().execute(
+            'SELECT * FROM shared_links ORDER BY creation_date, token').fetchall()
+        return [(row['token'], self._row_to_link(row)) for row in rows]
+
+    @timed('write_shared_links')
+    def add(self, token, data):
+        link = _normalize_link(data)
+        if link is None:
+            raise ValueError("Lien partagé incomplet.")
+        with self.db.transaction() as conn:
+            self._insert(conn, token, link)
+            self._bump_version(conn)
+
+    @timed('write_shared_links')
+    def delete(self, token):
+        with self.db.transaction() as conn:
+            cur = conn.execute('DELETE FROM shared_links WHERE token = ?', (token,))
+            if cur.rowcount:
+                self._bump_version(conn)
+            return cur.rowcount > 0
+
+    # Après un déplacement : les liens vers l'élément ou son contenu suivent
+    # le nouveau chemin (une seule requête)
+    @timed('write_shared_links')
+    def rewrite_paths(self, old_path, new_path):
+        with self.db.transaction() as conn:
+            cur = conn.execute(
+                'UPDATE shared_links SET item_name = ? || substr(item_name, ?)'
+                ' WHERE item_name = ? OR substr(item_name, 1, ?) = ?',
+                (new_path, len(old_path) + 1, old_path, len(old_path) + 1, old_path + '/'))
+            if cur.rowcount:
+                self._bump_version(conn)
+            return cur.rowcount
+
+    # Après une suppression : retire les liens vers les éléments ou leur
+    # contenu (une transaction pour tous)
+    @timed('write_shared_links')
+    def delete_paths(self, *paths):
+        removed = 0
+        with self.db.transaction() as conn:
+            for path in paths:
+                removed += conn.execute(
+                    'DELETE FROM shared_links WHERE item_name = ? OR substr(item_name, 1, ?) = ?',
+                    (path, len(path) + 1, path + '/')).rowcount
+            if removed:
+                self._bump_version(conn)
+        return removed
+
+    # Date d'expiration (timestamp) la plus proche, via l'index sur expiry_ts
+    def next_expiry(self):
+        row = self.db.connect().execute('SELECT MIN(expiry_ts) AS ts FROM shared_links').fetchone()
+        return row['ts']
+
+    # Supprime les liens expirés par lots de batch_size ; retourne leurs jetons
+    @timed('write_shared_links')
+    def purge_expired(self, now, batch_size=500):
+        purged = []
+        while True:
+            with self.db.transaction() as conn:
+                batch = [row['token'] for row in conn.execute(
+                    'SELECT token FROM shared_links WHERE expiry_ts <= ? LIMIT ?', (now, batch_size))]
+                conn.executemany('DELETE FROM shared_links WHERE token = ?', [(token,) for token in batch])
+                if batch:
+                    self._bump_version(conn)
+            purged.extend(batch)
+            if len(batch) < batch_size:
+                return purged
+
+
+class JsonLinkStore:
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.lock_path = json_path + '.lock'
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, links):
+        # Écriture dans un fichier temporaire puis remplacement atomique
+        directory = os.path.dirname(os.path.abspath(self.json_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.shared_links-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(links, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.json_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def version(self):
+        try:
+            st = os.stat(self.json_path)
+        except FileNotFoundError:
+            return 0
+        return st.st_mtime_ns ^ st.st_size
+
+    @timed('read_shared_links')
+    def get(self, token):
+        data = read_json_links(self.json_path).get(token)
+        return _normalize_link(data) if isinstance(data, dict) else None
+
+    @timed('read_shared_links')
+    def all(self):
+        links = []
+        for token, data in read_json_links(self.json_path).items():
+            link = _normalize_link(data) if isinstance(data, dict) else None
+            if link is not None:
+                links.append((token, link))
+        links.sort(key=lambda item: (item[1]['creation_date'], item[0]))
+        return links
+
+    @timed('write_shared_links')
+    def add(self, token, data):
+        link = _normalize_link(data)
+        if link is None:
+            raise ValueError("Lien partagé incomplet.")
+        with self._locked():
+            links = read_json_links(self.json_path)
+            links[token] = link
+            self._write(links)
+
+    @timed('write_shared_links')
+    def delete(self, token):
+        with self._locked():
+            links = read_json_links(self.json_path)
+            if links.pop(token, None) is None:
+                return False
+            self._write(links)
+            return True
+
+    @timed('write_shared_links')
+    def rewrite_paths(self, old_path, new_path):
+        with self._locked():
+            links = read_json_links(self.json_path)
+            changed = 0
+            for token, data in links.items():
+                link = _normalize_link(data) if isinstance(data, dict) else None
+                if link is None:
+                    continue
+                item_name = link['item_name']
+                if item_name == old_path or item_name.startswith(old_path + '/'):
+                    link['item_name'] = new_path + item_name[len(old_path):]
+                    links[token] = link
+                    changed += 1
+            if changed:
+                self._write(links)
+            return changed
+
+    @timed('write_shared_links')
+    def delete_paths(self, *paths):
+        prefixes = tuple(path + '/' for path in paths)
+        with self._locked():
+            links = read_json_links(self.json_path)
+            removed = []
+            for token, data in links.items():
+                link = _normalize_link(data) if isinstance(data, dict) else None
+                if link and (link['item_name'] in paths or link['item_name'].startswith(prefixes)):
+                    removed.append(token)
+            for token in removed:
+                links.pop(token)
+            if removed:
+                self._write(links)
+            return len(removed)
+
+    def next_expiry(self):
+        expiries = [_timestamp(link['expiry_date']) for _, link in self.all()]
+        return min(expiries) if expiries else None
+
+    @timed('write_shared_links')
+    def purge_expired(self, now, batch_size=500):
+        with self._locked():
+            links = read_json_links(self.json_path)
+            expired = [token for token, data in links.items()
+                       if not isinstance(data, dict) or not data.get('expiry_date')
+                       or _timestamp(data['expiry_date']) <= now]
+            for token in expired:
+                links.pop(token)
+            if expired:
+                self._write(links)
+            return expired
+
+
+_store = None
+_store_key = None
+_store_lock = threading.Lock()
+
+
+# Retourne le store configuré (une instance par processus)
+def get_link_store():
+    global _store, _store_key
+    key = (Config.LINK_STORE, Config.DATA_FOLDER, Config.SHARED_LINKS_FILE)
+    with _store_lock:
+        if _store is None or _store_key != key:
+            if Config.LINK_STORE == 'json':
+                _store = JsonLinkStore(Config.SHARED_LINKS_FILE)
+            elif Config.LINK_STORE == 'sqlite':
+                db_path = os.path.join(Config.DATA_FOLDER, 'shared_links.db')
+                _store = SqliteLinkStore(db_path, legacy_json_path=Config.SHARED_LINKS_FILE)
+            else:
+                raise ValueError(f"LINK_STORE inconnu : {Config.LINK_STORE}")
+            _store_key = key
+        return _store
+
+
+# Vue des liens pour le panneau de l'éditeur, déjà formatée et mise en cache.
+# Elle est recalculée quand le store change (version) ou quand le prochain
+# lien affiché arrive à expiration.
+class LinkListCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._valid_until = None
+        self._links = []
+
+    def get(self, store, now):
+        version = store.version()
+        with self._lock:
+            if self._key == (id(store), version) and (self._valid_until is None or now < self._valid_until):
+                return self._links
+        links = []
+        valid_until = None
+        for token, data in store.all():
+            expiry = datetime.fromisoformat(data['expiry_date'])
+            is_expired = expiry.timestamp() <= now
+            if not is_expired:
+                valid_until = min(valid_until or expiry.timestamp(), expiry.timestamp())
+            links.append({
+                'token': token,
+                'link_name': data['link_name'],
+                'item_name': data['item_name'], # Peut être un fichier ou un dossier
+                'is_directory': data['is_directory'],
+                'expiry_date_str': expiry.strftime('%d/%m/%Y %H:%M'),
+                'is_expired': is_expired,
+            })
+        with self._lock:
+            self._key = (id(store), version)
+            self._valid_until = valid_until
+            self._links = links
+        return links
+
+
+link_list_cache = LinkListCache()
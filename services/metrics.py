@@ -0,0 +1,291 @@
+# services/metrics.py
+import sys
+import time
+import bisect
+import threading
+import functools
+from collections import Counter
+
+from flask import g, request, template_rendered, before_render_template
+
+from config import Config
+
+# Mesures internes de l'application, exposées au format texte de Prometheus.
+#
+# init_app() enregistre la durée de chaque requête par endpoint (histogramme),
+# le nombre de requêtes par code de réponse, les octets envoyés et le nombre
+# de flux en cours (fichiers audio, archives ZIP). timed() mesure les
+# chemins critiques (liens partagés, listing des dossiers, écriture des
+# envois) et le rendu des templates est mesuré via les signaux de Flask.
+#
+# Le coût par requête est de quelques microsecondes : un verrou et quelques
+# additions. Les valeurs sont propres à chaque processus (un worker gunicorn
+# = une série de mesures). Le profileur par échantillonnage n'a aucun coût
+# tant qu'il n'est pas démarré.
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class CounterMetric(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}')
+        return lines
+
+
+class GaugeMetric(CounterMetric):
+    kind = 'gauge'
+
+    def dec(self, *labels):
+        self.inc(*labels, amount=-1)
+
+
+class HistogramMetric(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, ([*counts], total, count)) for labels, (counts, total, count) in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(HistogramMetric(
+    'hush_request_duration_seconds', "Durée de traitement des requêtes (jusqu'au début de la réponse).",
+    ('endpoint', 'method')))
+requests_total = registry.register(CounterMetric(
+    'hush_requests_total', "Nombre de requêtes par code de réponse.", ('endpoint', 'method', 'status')))
+response_bytes = registry.register(CounterMetric(
+    'hush_response_bytes_total', "Octets de corps de réponse envoyés.", ('endpoint',)))
+streams_in_flight = registry.register(GaugeMetric(
+    'hush_streams_in_flight', "Réponses en flux en cours d'envoi.", ('endpoint',)))
+operation_duration = registry.register(HistogramMetric(
+    'hush_operation_duration_seconds', "Durée des opérations critiques.", ('operation',)))
+template_duration = registry.register(HistogramMetric(
+    'hush_template_render_seconds', "Durée de rendu des templates.", ('template',)))
+
+
+# Mesure la durée d'une fonction (décorateur) dans hush_operation_duration_seconds
+def timed(operation):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                operation_duration.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+
+class _CountingStream:
+    # Enveloppe le corps d'une réponse en flux : compte les octets envoyés et
+    # les flux en cours, jusqu'à la fermeture (fin de l'envoi ou client parti)
+    def __init__(self, iterable, endpoint):
+        self._iterable = iterable
+        self._endpoint = endpoint
+        self._closed = False
+        streams_in_flight.inc(endpoint)
+
+    def __iter__(self):
+        for data in self._iterable:
+            response_bytes.inc(self._endpoint, amount=len(data))
+            yield data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        streams_in_flight.dec(self._endpoint)
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def _endpoint():
+    return request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    if response.is_streamed:
+        response.response = _CountingStream(response.response, endpoint)
+    elif request.method != 'HEAD':
+        response_bytes.inc(endpoint, amount=response.calculate_content_length() or 0)
+    return response
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('_metrics_templates', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stack = g.get('_metrics_templates')
+    if stack:
+        template_duration.observe(time.perf_counter() - stack.pop(), template.name or '<string>')
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+
+# Accès à /metrics : jeton dédié (pour le collecteur) ou session éditeur
+def authorized(session):
+    token = Config.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if token and header == f'Bearer {token}':
+        return True
+    return bool(session.get('editor_mode'))
+
+
+class SamplingProfiler:
+    # Échantillonne périodiquement la pile de tous les threads et compte les
+    # piles identiques (format « collapsed » des flamegraphs)
+    def __init__(self, max_stacks=10000):
+        self.max_stacks = max_stacks
+        self._samples = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval):
+        with self._lock:
+            if self.running:
+                return False
+            self._samples.clear()
+            self.interval = interval
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            with self._lock:
+                if key in self._samples or len(self._samples) < self.max_stacks:
+                    self._samples[key] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self):
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self._samples.most_common())
+
+
+profiler = SamplingProfiler()
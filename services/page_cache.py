@@ -0,0 +1,67 @@
+# services/page_cache.py
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import Config
+
+# Cache HTTP des pages de dossiers (racine, sous-dossiers, dossiers partagés).
+#
+# Chaque page reçoit un ETag faible calculé à partir de ce qui détermine son
+# contenu : mtime et nombre d'entrées du dossier (index des dossiers), rôle
+# de la session, métadonnées du catalogue connues pour les fichiers affichés,
+# taille des sous-dossiers et, pour l'éditeur, version des liens partagés.
+# Un envoi ou une extraction de métadonnées dans un autre dossier ne change
+# donc pas l'ETag d'un dossier. Une requête conditionnelle dont l'ETag correspond reçoit un 304
+# sans que le dossier soit relu ni la page rendue.
+#
+# Le contenu du dossier (liste des sous-dossiers et première page de
+# fichiers) est aussi gardé déjà rendu, pour les visiteurs qui n'ont pas la
+# page en cache. Ce cache est propre à chaque processus ; les ETags, eux,
+# sont identiques d'un worker à l'autre.
+
+
+def listing_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return digest[:20]
+
+
+class FragmentCache:
+    def __init__(self):
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Fragment déjà rendu pour cette clé, sinon render() (puis gardé)
+    def get(self, key, render):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                return fragment
+        fragment = render()
+        with self._lock:
+            self._fragments[key] = fragment
+            while len(self._fragments) > Config.FRAGMENT_CACHE_SIZE:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+_templates_stamp = None
+
+
+# Date de modification des templates : une nouvelle version de l'interface
+# change tous les ETags
+def templates_stamp(folder):
+    global _templates_stamp
+    if _templates_stamp is None:
+        stamps = [entry.stat().st_mtime_ns for entry in os.scandir(folder) if entry.is_file()]
+        _templates_stamp = max(stamps, default=0)
+    return _templates_stamp
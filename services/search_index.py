@@ -0,0 +1,381 @@
+# services/search_index.py
+import os
+import re
+import sys
+import json
+import heapq
+import sqlite3
+import bisect
+import threading
+import unicodedata
+
+from config import Config
+from services.db import SqliteDatabase
+
+# Index de recherche en mémoire sur toute la bibliothèque.
+#
+# Chaque chemin (dossier ou morceau) est découpé en mots normalisés
+# (minuscules, sans accents) auxquels s'ajoutent les tags du catalogue
+# (titre, artiste, album...). L'index inversé associe chaque mot aux chemins
+# qui le contiennent ; la liste triée des mots permet la recherche par
+# préfixe (« beet » trouve « Beethoven ») par dichotomie.
+#
+# L'index est construit en parcourant UPLOAD_FOLDER une fois au démarrage
+# puis tenu à jour par les envois, suppressions et créations de dossiers
+# (et par le catalogue quand les tags d'un morceau sont lus).
+#
+# Chaque processus a son propre index en mémoire (environ 1 Ko par fichier,
+# voir Config.SEARCH_INDEX_ON_STARTUP). Les modifications sont
+# aussi ajoutées au journal partagé DATA_FOLDER/search.db : avant une
+# recherche, un processus compare le dernier numéro du journal au sien et
+# rejoue les modifications faites par les autres workers. S'il a pris trop
+# de retard (journal tronqué au-delà de JOURNAL_SIZE entrées), il
+# reconstruit son index.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        args TEXT NOT NULL
+    );
+"""
+
+_WORD = re.compile(r'[^\W_]+')
+# Diacritiques isolés par la décomposition NFKD
+_COMBINING = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+# En dessous, un mot de la requête doit correspondre exactement (pas de préfixe)
+MIN_PREFIX_LENGTH = 2
+TAG_FIELDS = ('title', 'artist', 'album', 'albumartist', 'genre', 'composer')
+# Entrées gardées dans le journal partagé, et fréquence de la troncature
+JOURNAL_SIZE = 10000
+JOURNAL_PRUNE_EVERY = 1000
+
+
+def normalize(text):
+    if text.isascii():
+        return text.lower()
+    return _COMBINING.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def tokenize(text):
+    # Mots internés : partagés entre les entrées et l'index inversé
+    return [sys.intern(word) for word in _WORD.findall(normalize(text))]
+
+
+def _tag_text(metadata):
+    tags = (metadata or {}).get('tags') or {}
+    return ' '.join(str(tags[field]) for field in TAG_FIELDS if tags.get(field))
+
+
+class SearchIndex:
+    def __init__(self, upload_folder, db_path=None):
+        self.upload_folder = os.path.abspath(upload_folder)
+        # Journal partagé entre processus (aucun pour un index autonome)
+        self.db = SqliteDatabase(db_path, SCHEMA) if db_path else None
+        self._lock = threading.Lock()
+        self._reset()
+        self.ready = False
+        self._journal = None
+        self._build_thread = None
+        # Dernière entrée du journal partagé prise en compte, et entrées
+        # plus récentes écrites par ce processus (déjà appliquées)
+        self._seq = 0
+        self._own = set()
+
+    def _reset(self):
+        # chemin -> (est un dossier, mots du chemin, mots des tags)
+        self._entries = {}
+        # mot -> ensemble de chemins
+        self._postings = {}
+        # tous les mots, triés (recherche par préfixe)
+        self._words = []
+
+    # --- Mise à jour -----------------------------------------------------
+
+    def _index(self, path, is_dir, tags_text=None):
+        previous = self._entries.get(path)
+        if tags_text is None:
+            tag_words = previous[2] if previous else ()
+        else:
+            tag_words = tuple(tokenize(tags_text))
+        if previous:
+            self._unindex(path)
+        path_words = tuple(tokenize(path))
+        self._entries[path] = (is_dir, path_words, tag_words)
+        for word in set(path_words + tag_words):
+            paths = self._postings.get(word)
+            if paths is None:
+                paths = self._postings[word] = set()
+                bisect.insort(self._words, word)
+            paths.add(path)
+
+    def _unindex(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return
+        for word in set(entry[1] + entry[2]):
+            paths = self._postings.get(word)
+            if paths is None:
+                continue
+            paths.discard(path)
+            if not paths:
+                del self._postings[word]
+                i = bisect.bisect_left(self._words, word)
+                if i < len(self._words) and self._words[i] == word:
+                    del self._words[i]
+
+    def _remove_tree(self, path):
+        prefix = path + '/'
+        for existing in [p for p in self._entries if p == path or p.startswith(prefix)]:
+            self._unindex(existing)
+
+    def _move_tree(self, path, new_path):
+        prefix = path + '/'
+        moved = [(p, self._entries[p]) for p in self._entries if p == path or p.startswith(prefix)]
+        for existing, _ in moved:
+            self._unindex(existing)
+        for existing, (is_dir, _, tag_words) in moved:
+            target = new_path + existing[len(path):]
+            self._index(target, is_dir, ' '.join(tag_words))
+
+    def _apply(self, op, *args):
+        # Pendant une reconstruction, les modifications sont aussi rejouées
+        # sur le nouvel index une fois le parcours terminé
+        if self._journal is not None:
+            self._journal.append((op, args))
+        getattr(self, op)(*args)
+        if self.db is not None:
+            self._publish(op, args)
+
+    # Ajoute une modification au journal partagé (appelé sous self._lock)
+    def _publish(self, op, args):
+        try:
+            with self.db.transaction() as conn:
+                seq = conn.execute('INSERT INTO changes (op, args) VALUES (?, ?)', (op, json.dumps(args))).lastrowid
+                if seq % JOURNAL_PRUNE_EVERY == 0:
+                    conn.execute('DELETE FROM changes WHERE seq <= ?', (seq - JOURNAL_SIZE,))
+        except sqlite3.Error as e:
+            print(f"Erreur lors de l'écriture du journal de recherche: {e}") # Log pour debug
+            return
+        if seq == self._seq + 1:
+            self._seq = seq
+        else:
+            self._own.add(seq)
+
+    def _latest_seq(self):
+        if self.db is None:
+            return 0
+        return self.db.connect().execute('SELECT MAX(seq) FROM changes').fetchone()[0] or 0
+
+    # Rejoue les modifications des autres processus ; False si une partie
+    # du journal a déjà été tronquée (l'index doit être reconstruit)
+    def sync(self):
+        if self.db is None or self._latest_seq() <= self._seq:
+            return True
+        rows = self.db.connect().execute('SELECT seq, op, args FROM changes WHERE seq > ? ORDER BY seq',
+                                         (self._seq,)).fetchall()
+        with self._lock:
+            rows = [row for row in rows if row['seq'] > self._seq]
+            if not rows:
+                return True
+            if rows[0]['seq'] != self._seq + 1:
+                return False
+            for row in rows:
+                if row['seq'] in self._own:
+                    self._own.discard(row['seq'])
+                else:
+                    self._apply_local(row['op'], *json.loads(row['args']))
+            self._seq = rows[-1]['seq']
+        return True
+
+    def _apply_local(self, op, *args):
+        if self._journal is not None:
+            self._journal.append((op, args))
+        getattr(self, op)(*args)
+
+    def add(self, relative_path, is_dir=False, tags_text=None):
+        relative_path = relative_path.strip('/')
+        if not relative_path:
+            return
+        with self._lock:
+            self._apply('_index', relative_path, is_dir, tags_text)
+
+    def set_tags(self, relative_path, metadata):
+        relative_path = relative_path.strip('/')
+        with self._lock:
+            if relative_path in self._entries or self._journal is not None:
+                self._apply('_index', relative_path, False, _tag_text(metadata))
+
+    def remove(self, relative_path):
+        relative_path = relative_path.strip('/')
+        with self._lock:
+            self._apply('_remove_tree', relative_path)
+
+    def move(self, relative_path, new_path):
+        relative_path, new_path = relative_path.strip('/'), new_path.strip('/')
+        with self._lock:
+            self._apply('_move_tree', relative_path, new_path)
+
+    # --- Construction ----------------------------------------------------
+
+    def build(self, tags=None):
+        # tags : {chemin: métadonnées} déjà connues (catalogue)
+        with self._lock:
+            self._journal = []
+        # Les modifications suivantes du journal partagé seront rejouées
+        start = self._latest_seq()
+        fresh = SearchIndex(self.upload_folder)
+        tags = tags or {}
+        for root, dirs, files in os.walk(self.upload_folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            relative_dir = os.path.relpath(root, self.upload_folder).replace(os.sep, '/')
+            relative_dir = '' if relative_dir == '.' else relative_dir + '/'
+            for name in dirs:
+                fresh._index(relative_dir + name, True)
+            for name in files:
+                if os.path.splitext(name.lower())[1] not in Config.ALLOWED_EXTENSIONS:
+                    continue
+                path = relative_dir + name
+                fresh._index(path, False, _tag_text(tags.get(path)))
+        with self._lock:
+            for op, args in self._journal:
+                getattr(fresh, op)(*args)
+            self._entries, self._postings, self._words = fresh._entries, fresh._postings, fresh._words
+            self._journal = None
+            # Entrées après start écrites par ce processus : déjà rejouées
+            # ci-dessus depuis le journal local
+            self._seq = max(self._seq, start)
+            self._own = {seq for seq in self._own if seq > self._seq}
+            self.ready = True
+
+    def build_async(self, tags_loader=None):
+        def run():
+            try:
+                self.build(tags_loader() if tags_loader else None)
+            except Exception as e:
+                print(f"Erreur lors de l'indexation de la bibliothèque: {e}") # Log pour debug
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return self._build_thread
+            self._build_thread = threading.Thread(target=run, name='search-index', daemon=True)
+            self._build_thread.start()
+            return self._build_thread
+
+    # Construit l'index à la première recherche si le démarrage ne l'a pas
+    # fait, sinon le met à jour avec les modifications des autres processus
+    def ensure_built(self, tags_loader=None):
+        with self._lock:
+            building = self._build_thread is not None and self._build_thread.is_alive()
+        if not self.ready and not building:
+            self.build(tags_loader() if tags_loader else None)
+        elif self.ready and not self.sync():
+            self.build(tags_loader() if tags_loader else None)
+
+    # --- Recherche -------------------------------------------------------
+
+    def _word_range(self, term):
+        lo = bisect.bisect_left(self._words, term)
+        if len(term) < MIN_PREFIX_LENGTH:
+            hi = lo + 1 if lo < len(self._words) and self._words[lo] == term else lo
+        else:
+            hi = bisect.bisect_left(self._words, term + '\U0010ffff', lo)
+        return lo, hi
+
+    # Nombre de chemins couverts par une plage de mots, compté seulement
+    # jusqu'à dépasser celui de la meilleure plage déjà trouvée
+    def _estimate(self, lo, hi, best):
+        total = 0
+        for word in self._words[lo:hi] if hi - lo < 1024 else self._iter_words(lo, hi):
+            total += len(self._postings[word])
+            if total > best:
+                break
+        return total
+
+    def _iter_words(self, lo, hi):
+        for i in range(lo, hi):
+            yield self._words[i]
+
+    def search(self, query, limit=50):
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return []
+        with self._lock:
+            ranges = [(self._word_range(term), term) for term in terms]
+            if any(lo == hi for (lo, hi), _ in ranges):
+                return []
+            # Le mot le plus sélectif fournit les candidats, les autres filtrent
+            ranges.sort(key=lambda item: item[0][1] - item[0][0])
+            best, best_size = 0, sys.maxsize
+            for i, ((lo, hi), _) in enumerate(ranges):
+                size = self._estimate(lo, hi, best_size)
+                if size < best_size:
+                    best, best_size = i, size
+            ranges.insert(0, ranges.pop(best))
+            (lo, hi), _ = ranges[0]
+            if hi - lo == 1:
+                candidates = self._postings[self._words[lo]]
+            else:
+                candidates = set().union(*(self._postings[w] for w in self._words[lo:hi]))
+            others = [term for _, term in ranges[1:]]
+            matches = []
+            for path in candidates:
+                is_dir, path_words, tag_words = self._entries[path]
+                if all(any(w.startswith(term) if len(term) >= MIN_PREFIX_LENGTH else w == term
+                           for w in path_words + tag_words) for term in others):
+                    matches.append((not is_dir, path.count('/'), path.casefold(), path, is_dir))
+        # Dossiers d'abord, puis les chemins les moins profonds
+        best = heapq.nsmallest(limit, matches)
+        return [{'path': path, 'is_directory': is_dir} for _, _, _, path, is_dir in best]
+
+    # --- Statistiques ----------------------------------------------------
+
+    # Taille approximative de l'index en mémoire (structures et chaînes)
+    def memory_usage(self):
+        with self._lock:
+            size = sys.getsizeof(self._entries) + sys.getsizeof(self._postings) + sys.getsizeof(self._words)
+            seen = set()
+
+            def add_string(s):
+                nonlocal size
+                if id(s) not in seen:
+                    seen.add(id(s))
+                    size += sys.getsizeof(s)
+
+            for path, (_, path_words, tag_words) in self._entries.items():
+                add_string(path)
+                size += sys.getsizeof(path_words) + sys.getsizeof(tag_words)
+                for word in path_words + tag_words:
+                    add_string(word)
+            for word, paths in self._postings.items():
+                add_string(word)
+                size += sys.getsizeof(paths)
+            return size
+
+    def stats(self):
+        with self._lock:
+            stats = {'paths': len(self._entries), 'words': len(self._words), 'ready': self.ready}
+        stats['memory_bytes'] = self.memory_usage()
+        return stats
+
+
+_search_index = None
+_search_index_key = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _search_index, _search_index_key
+    key = (os.path.abspath(Config.UPLOAD_FOLDER), Config.DATA_FOLDER)
+    with _search_index_lock:
+        if _search_index is None or _search_index_key != key:
+            _search_index = SearchIndex(Config.UPLOAD_FOLDER, os.path.join(Config.DATA_FOLDER, 'search.db'))
+            _search_index_key = key
+        return _search_index
+
+
+# Tags connus du catalogue, pour la construction initiale
+def catalog_tags():
+    from services.catalog import get_catalog
+
+    rows = get_catalog().db.connect().execute('SELECT path, metadata FROM tracks WHERE metadata IS NOT NULL')
+    return {row['path']: json.loads(row['metadata']) for row in rows}
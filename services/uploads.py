@@ -0,0 +1,267 @@
+# services/uploads.py
+import os
+import json
+import time
+import errno
+import secrets
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+from config import Config
+from services import dedup
+from services.metrics import timed
+
+# Envois par morceaux, reprenables.
+#
+# Le client annonce le fichier (nom, taille), puis envoie des morceaux de
+# taille fixe (Config.UPLOAD_CHUNK_SIZE, sauf le dernier) avec leur position.
+# Chaque morceau est écrit directement dans un fichier '.<id>.partial' du
+# dossier cible, sans passer par les fichiers temporaires de Werkzeug. Après
+# une coupure, le client demande la position atteinte et reprend à partir de
+# là. Au dernier morceau, le fichier est renommé de façon atomique sous un
+# nom libre (même logique nom_N.ext que le formulaire d'envoi).
+#
+# L'état de chaque envoi est un petit fichier JSON dans DATA_FOLDER/uploads,
+# partagé par tous les workers. Les empreintes des blocs déjà reçus
+# (services/dedup.py) sont ajoutées à un fichier '<id>.hashes' à côté, pour
+# dédupliquer le fichier terminé sans le relire.
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+# Trouve un nom de fichier libre : nom.ext, nom_1.ext, nom_2.ext...
+def unique_filepath(target_dir, filename):
+    filepath = os.path.join(target_dir, filename)
+    counter = 1
+    name, ext = os.path.splitext(filename)
+    while os.path.exists(filepath):
+        filepath = os.path.join(target_dir, f"{name}_{counter}{ext}")
+        counter += 1
+    return filepath
+
+
+# Déplace src vers un nom libre sans jamais écraser un fichier existant,
+# même si un autre worker termine un envoi du même nom au même moment
+def move_to_unique_path(src, target_dir, filename):
+    while True:
+        filepath = unique_filepath(target_dir, filename)
+        try:
+            os.link(src, filepath)
+        except FileExistsError:
+            continue
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.EXDEV, errno.EMLINK):
+                raise
+            # Système de fichiers sans liens physiques
+            os.rename(src, filepath)
+            return filepath
+        os.remove(src)
+        return filepath
+
+
+def _state_dir():
+    return os.path.join(Config.DATA_FOLDER, 'uploads')
+
+
+def _state_path(upload_id):
+    if not upload_id.isalnum():
+        raise UploadError("Envoi inconnu.", 404)
+    return os.path.join(_state_dir(), upload_id + '.json')
+
+
+def _partial_path(target_dir, upload_id):
+    return os.path.join(target_dir, f'.{upload_id}.partial')
+
+
+def _hashes_path(upload_id):
+    return os.path.join(_state_dir(), upload_id + '.hashes')
+
+
+# Remplace le fichier envoyé par un lien vers un fichier identique déjà présent
+def _deduplicate(final_path, digest):
+    if not Config.DEDUP_UPLOADS or digest is None:
+        return
+    try:
+        dedup.get_dedup_index().store(final_path, digest)
+    except Exception as e:
+        print(f"Erreur lors de la déduplication de {final_path}: {e}") # Log pour debug
+
+
+# Enregistre un envoi d'un seul tenant (formulaire) sous un nom libre, en
+# calculant son empreinte pendant l'écriture
+@timed('file_save')
+def save_upload(stream, target_dir, filename):
+    partial_path = _partial_path(target_dir, secrets.token_hex(16))
+    hasher = dedup.BlockHasher()
+    try:
+        with open(partial_path, 'xb') as f:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+                f.write(data)
+        final_path = move_to_unique_path(partial_path, target_dir, filename)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    _deduplicate(final_path, dedup.content_digest(hasher.finish()))
+    return final_path
+
+
+def load_upload(upload_id):
+    try:
+        with open(_state_path(upload_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise UploadError("Envoi inconnu.", 404)
+
+
+def start_upload(target_dir, relative_dir, filename, total_size):
+    filename = os.path.basename(filename or '')
+    if not filename or filename in ('.', '..'):
+        raise UploadError("Nom de fichier invalide.")
+    if os.path.splitext(filename.lower())[1] not in Config.ALLOWED_EXTENSIONS:
+        raise UploadError(f"Extension non autorisée pour le fichier: {filename}")
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError("Taille de fichier invalide.")
+    if not os.path.isdir(target_dir):
+        raise UploadError("Dossier cible introuvable.", 404)
+
+    upload_id = secrets.token_hex(16)
+    state = {
+        'upload_id': upload_id,
+        'target_dir': relative_dir,
+        'filename': filename,
+        'total_size': total_size,
+        'chunk_size': Config.UPLOAD_CHUNK_SIZE,
+        'created': time.time(),
+    }
+    open(_partial_path(target_dir, upload_id), 'xb').close()
+    os.makedirs(_state_dir(), exist_ok=True)
+    # Les morceaux doivent couvrir des blocs entiers pour que l'empreinte soit calculable
+    if Config.DEDUP_UPLOADS and state['chunk_size'] % dedup.HASH_BLOCK_SIZE == 0:
+        open(_hashes_path(upload_id), 'xb').close()
+    with open(_state_path(upload_id), 'x') as f:
+        json.dump(state, f)
+    return state
+
+
+def upload_offset(target_dir, state):
+    try:
+        return os.path.getsize(_partial_path(target_dir, state['upload_id']))
+    except FileNotFoundError:
+        raise UploadError("Envoi inconnu.", 404)
+
+
+# Ajoute un morceau lu depuis stream. Retourne (position atteinte, chemin
+# final ou None si l'envoi n'est pas terminé).
+@timed('file_save_chunk')
+def write_chunk(target_dir, state, offset, length, stream):
+    total_size = state['total_size']
+    chunk_size = state['chunk_size']
+    if length is None or length <= 0:
+        raise UploadError("Content-Length requis.", 411)
+    if length > chunk_size or offset + length > total_size:
+        raise UploadError("Morceau trop grand.", 413)
+    if length != chunk_size and offset + length != total_size:
+        raise UploadError("Seul le dernier morceau peut être plus court.")
+
+    partial_path = _partial_path(target_dir, state['upload_id'])
+    try:
+        f = open(partial_path, 'r+b')
+    except FileNotFoundError:
+        raise UploadError("Envoi inconnu.", 404)
+    with f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            raise UploadError("Position inattendue.", 409, offset=current)
+
+        f.seek(offset)
+        hasher = dedup.BlockHasher()
+        received = 0
+        try:
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                hasher.update(data)
+                f.write(data)
+                received += len(data)
+        except BaseException:
+            # Lecture interrompue (ClientDisconnected de Werkzeug...) : le
+            # fichier revient au début du morceau, aligné sur les empreintes
+            f.truncate(offset)
+            raise
+        if received != length:
+            # Connexion coupée : le morceau incomplet est abandonné
+            f.truncate(offset)
+            raise UploadError("Morceau incomplet.", 400, offset=offset)
+        f.flush()
+        _append_hashes(state, offset, hasher.finish())
+        offset += length
+
+        if offset < total_size:
+            return offset, None
+        os.fsync(f.fileno())
+        final_path = move_to_unique_path(partial_path, target_dir, state['filename'])
+    digest = _finish_hashes(state)
+    os.remove(_state_path(state['upload_id']))
+    _deduplicate(final_path, digest)
+    return offset, final_path
+
+
+# Ajoute les empreintes des blocs d'un morceau. Si le fichier des empreintes
+# ne correspond plus aux données reçues (arrêt entre les deux écritures), il
+# est supprimé et l'envoi ne sera pas dédupliqué.
+def _append_hashes(state, offset, block_digests):
+    hashes_path = _hashes_path(state['upload_id'])
+    expected = offset // dedup.HASH_BLOCK_SIZE * dedup.DIGEST_SIZE
+    try:
+        with open(hashes_path, 'r+b') as h:
+            if os.fstat(h.fileno()).st_size < expected:
+                raise ValueError
+            h.truncate(expected)
+            h.seek(expected)
+            h.write(block_digests)
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        os.remove(hashes_path)
+
+
+def _finish_hashes(state):
+    hashes_path = _hashes_path(state['upload_id'])
+    blocks = -(-state['total_size'] // dedup.HASH_BLOCK_SIZE)
+    try:
+        with open(hashes_path, 'rb') as h:
+            block_digests = h.read()
+        os.remove(hashes_path)
+    except FileNotFoundError:
+        return None
+    if len(block_digests) != blocks * dedup.DIGEST_SIZE:
+        return None
+    return dedup.content_digest(block_digests)
+
+
+def abort_upload(target_dir, state):
+    for path in (_partial_path(target_dir, state['upload_id']), _state_path(state['upload_id']),
+                 _hashes_path(state['upload_id'])):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
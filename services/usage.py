@@ -0,0 +1,241 @@
+# services/usage.py
+import os
+import time
+import threading
+
+from config import Config
+from services.db import SqliteDatabase
+
+# Espace occupé par dossier et quotas.
+#
+# DATA_FOLDER/usage.db garde, pour chaque dossier de UPLOAD_FOLDER, le total
+# des octets et le nombre de fichiers qu'il contient (sous-dossiers compris) ;
+# la ligne '' est la bibliothèque entière. Un parcours complet au démarrage
+# (scan) remet les totaux d'aplomb, puis les envois, suppressions et
+# déplacements les mettent à jour : ajouter un fichier ne touche que les
+# lignes de ses dossiers parents. Afficher la taille des sous-dossiers d'un
+# dossier est une seule requête indexée.
+#
+# Les tailles sont les tailles apparentes des fichiers : deux envois
+# identiques dédupliqués (liens physiques) comptent chacun pour leur taille.
+#
+# Les quotas (Config.QUOTA_TOTAL_BYTES pour la bibliothèque,
+# Config.FOLDER_QUOTAS par dossier) sont vérifiés avec la taille annoncée de
+# l'envoi, avant d'en écrire le moindre octet. Cette taille est réservée
+# (table reservations) dans la même transaction que la vérification, et
+# comptée par les vérifications suivantes jusqu'à la fin de l'envoi : des
+# envois simultanés ne peuvent pas dépasser ensemble un quota. Une réservation
+# est libérée quand l'envoi se termine ou est annulé, et ignorée après
+# Config.UPLOAD_RESERVATION_TTL secondes (envoi abandonné).
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS folders (
+        path TEXT PRIMARY KEY,
+        parent TEXT,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        files INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS folders_parent ON folders(parent);
+    CREATE TABLE IF NOT EXISTS reservations (
+        id TEXT PRIMARY KEY,
+        folder TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+
+class QuotaError(Exception):
+    pass
+
+
+def _parent(path):
+    return None if path == '' else path.rpartition('/')[0]
+
+
+# Le dossier et tous ses parents jusqu'à la racine ('')
+def _ancestors(folder):
+    ancestors = ['']
+    if folder:
+        parts = folder.split('/')
+        ancestors.extend('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return ancestors
+
+
+def format_size(size):
+    for unit in ('o', 'Ko', 'Mo', 'Go'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'o' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} To'
+
+
+class UsageIndex:
+    def __init__(self, db_path, upload_folder):
+        self.db = SqliteDatabase(db_path, SCHEMA)
+        self.upload_folder = os.path.abspath(upload_folder)
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("INSERT INTO meta (key, value) VALUES ('version', '1') ON CONFLICT (key)"
+                     " DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self):
+        row = self.db.connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row['value']) if row else 0
+
+    def _add(self, conn, folder, size, files):
+        conn.executemany(
+            'INSERT INTO folders (path, parent, bytes, files) VALUES (?, ?, ?, ?) ON CONFLICT (path)'
+            ' DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files',
+            [(path, _parent(path), size, files) for path in _ancestors(folder)])
+
+    # --- Mises à jour ------------------------------------------------------
+
+    def add_file(self, relative_path, size):
+        with self.db.transaction() as conn:
+            self._add(conn, _parent(relative_path), size, 1)
+            self._bump_version(conn)
+
+    # Retire un fichier (taille connue) ou un dossier (totaux de l'index)
+    def remove(self, relative_path, size=None):
+        with self.db.transaction() as conn:
+            if size is not None:
+                self._add(conn, _parent(relative_path), -size, -1)
+            else:
+                row = conn.execute('SELECT bytes, files FROM folders WHERE path = ?', (relative_path,)).fetchone()
+                if row is None:
+                    return
+                self._add(conn, _parent(relative_path), -row['bytes'], -row['files'])
+                conn.execute('DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?',
+                             (relative_path, len(relative_path) + 1, relative_path + '/'))
+            self._bump_version(conn)
+
+    def move(self, relative_path, new_path, size=None):
+        if size is not None:
+            with self.db.transaction() as conn:
+                self._add(conn, _parent(relative_path), -size, -1)
+                self._add(conn, _parent(new_path), size, 1)
+                self._bump_version(conn)
+            return
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT bytes, files FROM folders WHERE path = ?', (relative_path,)).fetchone()
+            if row is None:
+                return
+            self._add(conn, _parent(relative_path), -row['bytes'], -row['files'])
+            conn.execute('DELETE FROM folders WHERE path = ?', (new_path,))
+            conn.execute('UPDATE folders SET path = ? || substr(path, ?), parent = ? || substr(parent, ?)'
+                         ' WHERE substr(path, 1, ?) = ?',
+                         (new_path, len(relative_path) + 1, new_path, len(relative_path) + 1,
+                          len(relative_path) + 1, relative_path + '/'))
+            conn.execute('UPDATE folders SET path = ?, parent = ? WHERE path = ?',
+                         (new_path, _parent(new_path), relative_path))
+            self._add(conn, _parent(new_path), row['bytes'], row['files'])
+            self._bump_version(conn)
+
+    # Parcours complet : recalcule tous les totaux
+    def scan(self):
+        totals = {'': [0, 0]}
+        for root, dirs, files in os.walk(self.upload_folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            folder = os.path.relpath(root, self.upload_folder).replace(os.sep, '/')
+            folder = '' if folder == '.' else folder
+            size = count = 0
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                size += st.st_size
+                count += 1
+            totals.setdefault(folder, [0, 0])
+            for path in _ancestors(folder):
+                entry = totals.setdefault(path, [0, 0])
+                entry[0] += size
+                entry[1] += count
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM folders')
+            conn.executemany('INSERT INTO folders (path, parent, bytes, files) VALUES (?, ?, ?, ?)',
+                             [(path, _parent(path), size, count) for path, (size, count) in totals.items()])
+            self._bump_version(conn)
+        return totals['']
+
+    def scan_async(self):
+        def run():
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Erreur lors du calcul de l'espace occupé: {e}") # Log pour debug
+        thread = threading.Thread(target=run, name='usage-scan', daemon=True)
+        thread.start()
+        return thread
+
+    # --- Lecture -----------------------------------------------------------
+
+    def get(self, relative_path=''):
+        row = self.db.connect().execute('SELECT bytes, files FROM folders WHERE path = ?',
+                                        (relative_path,)).fetchone()
+        return (row['bytes'], row['files']) if row else (0, 0)
+
+    # Totaux des sous-dossiers d'un dossier : {nom: (octets, fichiers)}
+    def children(self, relative_path=''):
+        rows = self.db.connect().execute('SELECT path, bytes, files FROM folders WHERE parent = ?',
+                                         (relative_path,)).fetchall()
+        return {row['path'].rpartition('/')[2]: (row['bytes'], row['files']) for row in rows}
+
+    # --- Quotas ------------------------------------------------------------
+
+    def _check_quota(self, conn, relative_dir, size):
+        now = time.time()
+        for path in _ancestors(relative_dir):
+            limit = Config.QUOTA_TOTAL_BYTES if path == '' else Config.FOLDER_QUOTAS.get(path)
+            if not limit:
+                continue
+            row = conn.execute('SELECT bytes FROM folders WHERE path = ?', (path,)).fetchone()
+            used = row['bytes'] if row else 0
+            # Envois en cours dans le dossier ou ses sous-dossiers
+            used += conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM reservations WHERE expires > ?"
+                " AND (? = '' OR folder = ? OR substr(folder, 1, ?) = ?)",
+                (now, path, path, len(path) + 1, path + '/')).fetchone()[0]
+            if used + size > limit:
+                where = f'le dossier « {path} »' if path else 'la bibliothèque'
+                raise QuotaError(f"Quota dépassé pour {where} : {format_size(used)} utilisés"
+                                 f" sur {format_size(limit)}, envoi de {format_size(size)}.")
+
+    # Vérifie qu'un envoi de size octets dans le dossier respecte les quotas
+    def check_quota(self, relative_dir, size):
+        self._check_quota(self.db.connect(), relative_dir, size)
+
+    # Vérifie les quotas et réserve size octets pour l'envoi reservation_id
+    def reserve(self, reservation_id, relative_dir, size):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM reservations WHERE expires <= ?', (time.time(),))
+            self._check_quota(conn, relative_dir, size)
+            conn.execute('INSERT OR REPLACE INTO reservations (id, folder, bytes, expires) VALUES (?, ?, ?, ?)',
+                         (reservation_id, relative_dir, size, time.time() + Config.UPLOAD_RESERVATION_TTL))
+
+    def release(self, reservation_id):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM reservations WHERE id = ?', (reservation_id,))
+
+
+_usage_index = None
+_usage_index_key = None
+_usage_index_lock = threading.Lock()
+
+
+def get_usage_index():
+    global _usage_index, _usage_index_key
+    key = (Config.DATA_FOLDER, Config.UPLOAD_FOLDER)
+    with _usage_index_lock:
+        if _usage_index is None or _usage_index_key != key:
+            _usage_index = UsageIndex(os.path.join(Config.DATA_FOLDER, 'usage.db'), Config.UPLOAD_FOLDER)
+            _usage_index_key = key
+        return _usage_index
@@ -0,0 +1,236 @@
+# services/waveform.py
+import os
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # décodage FLAC optionnel
+    soundfile = None
+
+from config import Config
+from services.audio_metadata import read_wav_layout, MetadataError
+
+# Pics de forme d'onde précalculés.
+#
+# Pour chaque fichier, on calcule Config.WAVEFORM_BUCKETS paires (min, max)
+# en int8, toutes voies confondues. Les échantillons WAV sont lus par blocs
+# d'au plus BLOCK_FRAMES trames, avec des réductions NumPy vectorisées : la
+# mémoire utilisée ne dépend pas de la durée du fichier. Les blocs sont lus
+# avec pread plutôt que via un memmap, dont les pages déjà parcourues
+# resteraient comptées dans la mémoire résidente du worker.
+# Le FLAC est pris en charge si le module optionnel soundfile est installé.
+#
+# Les résultats sont de petits fichiers binaires dans DATA_FOLDER/peaks :
+#   'HPK1' | taille (Q) | mtime_ns (q) | nombre de paires (I) | min0 max0 min1 max1 ...
+
+MAGIC = b'HPK1'
+HEADER = struct.Struct('<4sQqI')
+BLOCK_FRAMES = 1 << 18
+
+WAV_PCM = 1
+WAV_FLOAT = 3
+
+
+def supports(path):
+    ext = os.path.splitext(path.lower())[1]
+    return ext == '.wav' or (ext == '.flac' and soundfile is not None)
+
+
+# Lecture des échantillons WAV dans leur type d'origine (sans copie sauf pour
+# le 24 bits) et fonction ramenant leurs valeurs dans [-1, 1]. Le min et le
+# max étant conservés par une transformation affine croissante, elle n'est
+# appliquée qu'aux pics, pas aux échantillons.
+def _wav_sample_reader(fmt):
+    bits = fmt['bits_per_sample']
+    if fmt['audio_format'] == WAV_FLOAT and bits == 32:
+        return (lambda raw: np.frombuffer(raw, dtype='<f4')), (lambda v: v)
+    if fmt['audio_format'] == WAV_PCM and bits == 8:
+        return (lambda raw: np.frombuffer(raw, dtype=np.uint8)), (lambda v: (v - 128) / 128)
+    if fmt['audio_format'] == WAV_PCM and bits == 16:
+        return (lambda raw: np.frombuffer(raw, dtype='<i2')), (lambda v: v / 32768)
+    if fmt['audio_format'] == WAV_PCM and bits == 24:
+        def read_24(raw):
+            triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+            return (values << 8) >> 8
+        return read_24, (lambda v: v / 8388608)
+    if fmt['audio_format'] == WAV_PCM and bits == 32:
+        return (lambda raw: np.frombuffer(raw, dtype='<i4')), (lambda v: v / 2147483648)
+    raise MetadataError("Format d'échantillons WAV non pris en charge.")
+
+
+def _bucket_edges(frames):
+    buckets = min(Config.WAVEFORM_BUCKETS, frames)
+    return np.linspace(0, frames, buckets + 1).astype(np.int64)
+
+
+# Calcule les (min, max) de chaque intervalle de trames [edges[k], edges[k+1][.
+# read_block(début, fin) retourne les échantillons entrelacés du bloc et
+# normalize ramène les pics dans [-1, 1].
+def _reduce_peaks(edges, channels, read_block, normalize):
+    buckets = len(edges) - 1
+    mins = np.zeros(buckets, dtype=np.float64)
+    maxs = np.zeros(buckets, dtype=np.float64)
+    k = 0
+    while k < buckets:
+        start = edges[k]
+        # Regroupe autant d'intervalles que possible dans un bloc
+        g = k + 1
+        while g < buckets and edges[g + 1] - start <= BLOCK_FRAMES:
+            g += 1
+        end = edges[g]
+        if end - start <= BLOCK_FRAMES:
+            samples = read_block(start, end)
+            local = (edges[k:g] - start) * channels
+            mins[k:g] = np.minimum.reduceat(samples, local)
+            maxs[k:g] = np.maximum.reduceat(samples, local)
+        else:
+            # Intervalle plus grand qu'un bloc : lu en plusieurs fois
+            low, high = np.inf, -np.inf
+            for sub in range(start, end, BLOCK_FRAMES):
+                samples = read_block(sub, min(sub + BLOCK_FRAMES, end))
+                low = min(low, samples.min())
+                high = max(high, samples.max())
+            mins[k], maxs[k] = low, high
+        k = g
+    peaks = np.empty(buckets * 2, dtype=np.int8)
+    peaks[0::2] = np.clip(np.round(normalize(mins) * 127), -127, 127)
+    peaks[1::2] = np.clip(np.round(normalize(maxs) * 127), -127, 127)
+    return peaks
+
+
+def compute_wav_peaks(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        layout = read_wav_layout(f, size)
+    fmt = layout['fmt']
+    align = fmt['block_align']
+    frames = layout['data_size'] // align if align else 0
+    if frames == 0:
+        return np.empty(0, dtype=np.int8)
+    read_samples, normalize = _wav_sample_reader(fmt)
+    offset = layout['data_offset']
+    with open(path, 'rb') as f:
+        fd = f.fileno()
+        return _reduce_peaks(_bucket_edges(frames), fmt['channels'],
+                             lambda start, end: read_samples(os.pread(fd, (end - start) * align, offset + start * align)),
+                             normalize)
+
+
+def compute_flac_peaks(path):
+    with soundfile.SoundFile(path) as f:
+        frames = f.frames
+        if frames == 0:
+            return np.empty(0, dtype=np.int8)
+
+        def read_block(start, end):
+            f.seek(start)
+            return f.read(end - start, dtype='float32', always_2d=True).ravel()
+
+        return _reduce_peaks(_bucket_edges(frames), f.channels, read_block, lambda v: v)
+
+
+def compute_peaks(path):
+    if path.lower().endswith('.flac'):
+        return compute_flac_peaks(path)
+    return compute_wav_peaks(path)
+
+
+class WaveformStore:
+    def __init__(self, folder):
+        self.folder = folder
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def sidecar_path(self, relative_path):
+        digest = hashlib.sha1(relative_path.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, digest[:2], digest + '.peaks')
+
+    # Pics enregistrés (octets int8 min/max entrelacés), ou None s'ils sont
+    # absents ou ne correspondent plus au fichier
+    def load(self, relative_path, st):
+        try:
+            with open(self.sidecar_path(relative_path), 'rb') as f:
+                header = f.read(HEADER.size)
+                if len(header) != HEADER.size:
+                    return None
+                magic, size, mtime_ns, count = HEADER.unpack(header)
+                if magic != MAGIC or size != st.st_size or mtime_ns != st.st_mtime_ns:
+                    return None
+                return f.read(count * 2)
+        except FileNotFoundError:
+            return None
+
+    def generate(self, full_path, relative_path):
+        st = os.stat(full_path)
+        peaks = compute_peaks(full_path)
+        sidecar = self.sidecar_path(relative_path)
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        tmp_path = f'{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, st.st_size, st.st_mtime_ns, len(peaks) // 2))
+            f.write(peaks.tobytes())
+        os.replace(tmp_path, sidecar)
+        return peaks.tobytes()
+
+    def forget(self, relative_path):
+        try:
+            os.remove(self.sidecar_path(relative_path))
+        except FileNotFoundError:
+            pass
+
+    # Fichier déplacé : le fichier de pics est renommé (il reste valide, le
+    # fichier audio garde sa taille et sa date de modification)
+    def move(self, relative_path, new_path):
+        sidecar = self.sidecar_path(new_path)
+        try:
+            os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+            os.replace(self.sidecar_path(relative_path), sidecar)
+        except FileNotFoundError:
+            pass
+
+    def _pool(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=Config.WAVEFORM_WORKERS,
+                                                thread_name_prefix='waveform')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def schedule(self, full_path, relative_path):
+        if not supports(full_path):
+            return None
+        with self._lock:
+            if relative_path in self._pending:
+                return None
+            self._pending.add(relative_path)
+        return self._pool().submit(self._generate_pending, full_path, relative_path)
+
+    def _generate_pending(self, full_path, relative_path):
+        try:
+            return self.generate(full_path, relative_path)
+        except (MetadataError, OSError, ValueError, RuntimeError) as e:
+            print(f"Erreur lors du calcul de la forme d'onde de {relative_path}: {e}") # Log pour debug
+        finally:
+            with self._lock:
+                self._pending.discard(relative_path)
+
+
+_store = None
+_store_key = None
+_store_lock = threading.Lock()
+
+
+def get_waveform_store():
+    global _store, _store_key
+    with _store_lock:
+        if _store is None or _store_key != Config.DATA_FOLDER:
+            _store = WaveformStore(os.path.join(Config.DATA_FOLDER, 'peaks'))
+            _store_key = Config.DATA_FOLDER
+        return _store
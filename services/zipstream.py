@@ -0,0 +1,212 @@
+# services/zipstream.py
+import os
+import stat
+import time
+import struct
+import zlib
+import unicodedata
+from urllib.parse import quote
+
+from config import Config
+
+# Archive ZIP d'un dossier générée à la volée.
+#
+# Les fichiers sont stockés sans compression (méthode STORED) : l'audio est
+# déjà compressé et la taille de l'archive se calcule alors à l'avance à
+# partir des seules tailles des fichiers, ce qui permet d'envoyer un
+# Content-Length exact. Le CRC-32 n'est connu qu'après la lecture du
+# fichier : il est écrit dans un descripteur de données (bit 3) placé après
+# le contenu. Mémoire constante, aucun fichier temporaire ; Zip64 au-delà
+# de 4 Go (taille d'un fichier, position ou nombre d'entrées).
+
+CHUNK_SIZE = 64 * 1024
+# Seuil à partir duquel les champs 32 bits passent en Zip64 (modifiable pour les tests)
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+_ZIP64_LOCATOR = struct.Struct('<IIQI')
+
+_FLAGS = 0x08 | 0x800  # descripteur de données, noms en UTF-8
+_VERSION_STORED = 20
+_VERSION_ZIP64 = 45
+_VERSION_MADE_BY = (3 << 8) | _VERSION_ZIP64  # Unix
+_EXTERNAL_ATTR = (stat.S_IFREG | 0o644) << 16
+
+
+class ZipEntry:
+    def __init__(self, arcname, path, size, mtime):
+        self.arcname = arcname
+        self.name_bytes = arcname.encode('utf-8')
+        self.path = path
+        self.size = size
+        self.dos_time, self.dos_date = _dos_datetime(mtime)
+        self.offset = 0
+        self.crc = 0
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_LIMIT or self.offset >= ZIP64_LIMIT
+
+    def local_header_size(self):
+        return _LOCAL_HEADER.size + len(self.name_bytes) + (20 if self.zip64 else 0)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_header_size(self):
+        return _CENTRAL_HEADER.size + len(self.name_bytes) + len(self._central_extra())
+
+    def local_header(self):
+        version = _VERSION_ZIP64 if self.zip64 else _VERSION_STORED
+        extra = b''
+        size = self.size
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, self.size, self.size)
+            size = 0xFFFFFFFF
+        return _LOCAL_HEADER.pack(
+            0x04034b50, version, _FLAGS, 0, self.dos_time, self.dos_date,
+            0, size, size, len(self.name_bytes), len(extra),
+        ) + self.name_bytes + extra
+
+    def descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.size, self.size)
+
+    def _central_extra(self):
+        # Seuls les champs qui débordent figurent dans l'extra Zip64, dans l'ordre imposé
+        fields = []
+        if self.size >= ZIP64_LIMIT:
+            fields += [self.size, self.size]
+        if self.offset >= ZIP64_LIMIT:
+            fields.append(self.offset)
+        if not fields:
+            return b''
+        return struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields)
+
+    def central_header(self):
+        size = 0xFFFFFFFF if self.size >= ZIP64_LIMIT else self.size
+        offset = 0xFFFFFFFF if self.offset >= ZIP64_LIMIT else self.offset
+        extra = self._central_extra()
+        version = _VERSION_ZIP64 if self.zip64 else _VERSION_STORED
+        return _CENTRAL_HEADER.pack(
+            0x02014b50, _VERSION_MADE_BY, version, _FLAGS, 0,
+            self.dos_time, self.dos_date, self.crc, size, size,
+            len(self.name_bytes), len(extra), 0, 0, 0, _EXTERNAL_ATTR, offset,
+        ) + self.name_bytes + extra
+
+
+def _dos_datetime(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+# Liste récursive des fichiers audio d'un dossier, dans un ordre stable.
+# Les liens symboliques et les fichiers cachés (envois en cours) sont ignorés.
+def collect_entries(root):
+    entries = []
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, relative_dir)) as it:
+                items = sorted(it, key=lambda e: e.name)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        subfolders = []
+        for item in items:
+            if item.name.startswith('.'):
+                continue
+            arcname = f'{relative_dir}/{item.name}' if relative_dir else item.name
+            try:
+                if item.is_dir(follow_symlinks=False):
+                    subfolders.append(arcname)
+                elif item.is_file(follow_symlinks=False):
+                    if os.path.splitext(item.name.lower())[1] in Config.ALLOWED_EXTENSIONS:
+                        st = item.stat(follow_symlinks=False)
+                        entries.append(ZipEntry(arcname, item.path, st.st_size, st.st_mtime))
+            except FileNotFoundError:
+                continue
+        pending.extend(reversed(subfolders))
+    return entries
+
+
+class ZipStream:
+    def __init__(self, entries):
+        self.entries = entries
+        # Positions de chaque entrée et taille totale, calculées avant l'envoi
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            offset += entry.local_header_size() + entry.size + entry.descriptor_size()
+        self.central_offset = offset
+        self.central_size = sum(entry.central_header_size() for entry in entries)
+        self.size = self.central_offset + self.central_size + len(self._end_records())
+
+    def _needs_zip64_end(self):
+        return (len(self.entries) >= ZIP64_COUNT_LIMIT
+                or self.central_offset >= ZIP64_LIMIT
+                or self.central_size >= ZIP64_LIMIT)
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self._needs_zip64_end():
+            zip64_end_offset = self.central_offset + self.central_size
+            records += _ZIP64_END_RECORD.pack(
+                0x06064b50, _ZIP64_END_RECORD.size - 12, _VERSION_MADE_BY, _VERSION_ZIP64,
+                0, 0, count, count, self.central_size, self.central_offset,
+            )
+            records += _ZIP64_LOCATOR.pack(0x07064b50, 0, zip64_end_offset, 1)
+        records += _END_RECORD.pack(
+            0x06054b50, 0, 0,
+            min(count, 0xFFFF), min(count, 0xFFFF),
+            min(self.central_size, 0xFFFFFFFF), min(self.central_offset, 0xFFFFFFFF), 0,
+        )
+        return records
+
+    def _iter_file(self, entry):
+        crc = 0
+        remaining = entry.size
+        with open(entry.path, 'rb') as f:
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    # Le fichier a raccourci depuis le calcul de la taille :
+                    # l'archive ne peut plus correspondre au Content-Length annoncé
+                    raise IOError(f"Fichier modifié pendant l'envoi : {entry.arcname}")
+                remaining -= len(data)
+                crc = zlib.crc32(data, crc)
+                yield data
+        entry.crc = crc
+
+    def __iter__(self):
+        for entry in self.entries:
+            yield entry.local_header()
+            yield from self._iter_file(entry)
+            yield entry.descriptor()
+        for entry in self.entries:
+            yield entry.central_header()
+        yield self._end_records()
+
+
+def zip_directory(root):
+    return ZipStream(collect_entries(root))
+
+
+# En-tête Content-Disposition avec repli ASCII pour les noms accentués
+def content_disposition(filename):
+    ascii_name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+    ascii_name = ascii_name.replace('"', '').replace('\\', '') or 'archive.zip'
+    value = f'attachment; filename="{ascii_name}"'
+    if ascii_name != filename:
+        value += f"; filename*=UTF-8''{quote(filename)}"
+    return value
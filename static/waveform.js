@@ -0,0 +1,70 @@
+// static/waveform.js
+// Formes d'onde précalculées (/peaks/...) dessinées à côté des lecteurs.
+// Un clic sur la forme d'onde déplace la lecture. Les pics ne sont chargés
+// que pour les lecteurs visibles.
+(function () {
+  function draw(canvas, peaks, progress) {
+    const ctx = canvas.getContext('2d');
+    const width = canvas.width = canvas.clientWidth * window.devicePixelRatio;
+    const height = canvas.height = canvas.clientHeight * window.devicePixelRatio;
+    const buckets = peaks.length / 2;
+    const style = getComputedStyle(canvas);
+    ctx.clearRect(0, 0, width, height);
+    for (let x = 0; x < width; x++) {
+      const i = Math.floor(x * buckets / width) * 2;
+      const top = (1 - peaks[i + 1] / 127) * height / 2;
+      const bottom = (1 - peaks[i] / 127) * height / 2;
+      ctx.fillStyle = x / width < progress ? style.color : style.borderColor;
+      ctx.fillRect(x, top, 1, Math.max(bottom - top, 1));
+    }
+  }
+
+  function load(canvas, attempt) {
+    fetch(canvas.dataset.peaks).then(function (response) {
+      if (response.status === 202 && attempt < 10) {
+        setTimeout(function () { load(canvas, attempt + 1); }, 2000);
+        return;
+      }
+      if (!response.ok) {
+        canvas.remove();
+        return;
+      }
+      return response.arrayBuffer().then(function (buffer) {
+        const peaks = new Int8Array(buffer);
+        const audio = canvas.closest('.card').querySelector('audio');
+        const progress = function () {
+          return audio && audio.duration ? audio.currentTime / audio.duration : 0;
+        };
+        draw(canvas, peaks, progress());
+        if (!audio) return;
+        audio.addEventListener('timeupdate', function () { draw(canvas, peaks, progress()); });
+        canvas.addEventListener('click', function (event) {
+          const ratio = event.offsetX / canvas.clientWidth;
+          if (audio.duration) audio.currentTime = ratio * audio.duration;
+          else audio.addEventListener('loadedmetadata', function () {
+            audio.currentTime = ratio * audio.duration;
+          }, { once: true });
+          audio.play();
+        });
+      });
+    });
+  }
+
+  const observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (!entry.isIntersecting) return;
+      observer.unobserve(entry.target);
+      load(entry.target, 0);
+    });
+  });
+
+  window.hushWaveforms = {
+    observe: function (root) {
+      root.querySelectorAll('canvas[data-peaks]:not([data-observed])').forEach(function (canvas) {
+        canvas.dataset.observed = '1';
+        observer.observe(canvas);
+      });
+    },
+  };
+  window.hushWaveforms.observe(document);
+})();
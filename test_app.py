@@ -1,5 +1,9 @@
 import pytest
 import os
+import io
+import zipfile
+import re
+import hashlib
 import json
 import time
 import shutil
@@ -59,12 +63,12 @@ def test_index_no_auth(client):
 def test_index_view_password(client):
     rv = client.post('/', data={'password': Config.VIEW_PASSWORD}, follow_redirects=True)
     assert b"Morceaux disponibles" in rv.data
-    assert b"Mode éditeur activé" not in rv.data
+    assert "Mode éditeur activé".encode() not in rv.data
 
 def test_index_edit_password(client):
     rv = client.post('/', data={'password': Config.EDIT_PASSWORD}, follow_redirects=True)
     assert b"Morceaux disponibles" in rv.data
-    assert b"Mode éditeur activé" in rv.data
+    assert "Mode éditeur activé".encode() in rv.data
 
 def test_index_wrong_password(client):
     rv = client.post('/', data={'password': 'wrong_password'}, follow_redirects=True)
@@ -85,7 +89,7 @@ def test_link_expiration(client, mock_time):
     # Crée un lien de partage
     rv = client.post(f'/create-share/{test_filename}', data={'link_name': 'Test Link'}, follow_redirects=True)
     assert rv.status_code == 200
-    assert b"Lien temporaire généré" in rv.data # "Lien temporaire généré"
+    assert "Lien temporaire généré".encode() in rv.data # "Lien temporaire généré"
     
     # Extrait le token du lien créé
     share_url_prefix = client.base_url.rstrip('/') + '/share/'
@@ -105,7 +109,7 @@ def test_link_expiration(client, mock_time):
     # Vérifie que le lien est maintenant expiré
     rv = client.get(f'/share/{token}')
     assert rv.status_code == 404
-    assert b"Lien expiré." in rv.data # "Lien expiré."
+    assert "Lien expiré.".encode() in rv.data # "Lien expiré."
 
     # Nettoie le fichier temporaire
     os.remove(test_filepath)
@@ -148,7 +152,7 @@ def test_share_folder(client):
 
     rv = client.post('/create-share/SharedFolder', data={'link_name': 'My Shared Folder'}, follow_redirects=True)
     assert rv.status_code == 200
-    assert b"Lien temporaire généré" in rv.data # "Lien temporaire généré"
+    assert "Lien temporaire généré".encode() in rv.data # "Lien temporaire généré"
 
     # Extrait le token du lien créé
     share_url_prefix = client.base_url.rstrip('/') + '/share/'
@@ -190,4 +194,1515 @@ def test_delete_non_empty_folder_fails(client):
     rv = client.post('/', data={'delete_item': 'NonEmptyFolder'}, follow_redirects=True)
     assert rv.status_code == 200 # La suppression échoue mais la page se recharge
     assert os.path.isdir(os.path.join(Config.UPLOAD_FOLDER, 'NonEmptyFolder'))
-    assert os.path.exists(test_filepath)
\ No newline at end of file
+    assert os.path.exists(test_filepath)
+# Environnement isolé : dossiers temporaires et mots de passe connus
+@pytest.fixture
+def isolated_app(monkeypatch, tmp_path):
+    upload_folder = tmp_path / 'uploads'
+    data_folder = tmp_path / 'data'
+    upload_folder.mkdir()
+    monkeypatch.setattr(Config, 'UPLOAD_FOLDER', str(upload_folder))
+    monkeypatch.setattr(Config, 'DATA_FOLDER', str(data_folder))
+    monkeypatch.setattr(Config, 'SHARED_LINKS_FILE', str(tmp_path / 'shared_links.json'))
+    monkeypatch.setattr(Config, 'VIEW_PASSWORD', 'view-secret')
+    monkeypatch.setattr(Config, 'EDIT_PASSWORD', 'edit-secret')
+    monkeypatch.setattr(Config, 'SECRET_KEY', 'test-secret-key')
+    monkeypatch.setattr(Config, 'CATALOG_SCAN_ON_STARTUP', False)
+    monkeypatch.setattr(Config, 'LINK_EXPIRY_SCHEDULER', False)
+    monkeypatch.setattr(Config, 'SEARCH_INDEX_ON_STARTUP', False)
+    monkeypatch.setattr(Config, 'JOB_WORKERS_ON_STARTUP', False)
+    monkeypatch.setattr(Config, 'ANALYTICS_FLUSH_ON_TIMER', False)
+    monkeypatch.setattr(Config, 'USAGE_SCAN_ON_STARTUP', False)
+    monkeypatch.setattr(Config, 'ASSETS_FOLDER', str(tmp_path / 'assets'))
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def viewer_client(isolated_app):
+    with isolated_app.test_client() as client:
+        client.post('/', data={'password': 'view-secret'})
+        yield client
+
+@pytest.fixture
+def editor_client(isolated_app):
+    with isolated_app.test_client() as client:
+        client.post('/', data={'password': 'edit-secret'})
+        yield client
+
+def write_upload(relative_path, content=b'dummy audio content'):
+    path = os.path.join(Config.UPLOAD_FOLDER, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def extract_share_token(data):
+    marker = b'/share/'
+    start = data.find(marker) + len(marker)
+    end = data.find(b'"', start)
+    return data[start:end].decode()
+
+# Tests du stockage des liens partagés
+def test_link_store_migrates_legacy_json(isolated_app):
+    from services.link_store import get_link_store
+    expiry = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    with open(Config.SHARED_LINKS_FILE, 'w') as f:
+        json.dump({'legacy': {'link_name': '', 'filename': 'old.mp3',
+                              'creation_date': expiry, 'expiry_date': expiry}}, f)
+
+    store = get_link_store()
+    assert store.get('legacy')['item_name'] == 'old.mp3'
+    assert store.get('legacy')['is_directory'] is False
+
+    # La migration n'est faite qu'une seule fois
+    store.delete('legacy')
+    store.migrate_from_json(Config.SHARED_LINKS_FILE)
+    assert store.get('legacy') is None
+
+def test_link_store_concurrent_writes(isolated_app):
+    import threading
+    from services.link_store import get_link_store
+    store = get_link_store()
+    now = datetime.now(timezone.utc)
+    link = {'link_name': '', 'item_name': 'a.mp3', 'is_directory': False,
+            'creation_date': now.isoformat(), 'expiry_date': (now + timedelta(hours=1)).isoformat()}
+
+    threads = [threading.Thread(target=store.add, args=(f'token-{i}', link)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store.all()) == 20
+
+def test_json_link_store_roundtrip(isolated_app, monkeypatch):
+    from services.link_store import get_link_store
+    monkeypatch.setattr(Config, 'LINK_STORE', 'json')
+    store = get_link_store()
+    now = datetime.now(timezone.utc)
+    store.add('abc', {'item_name': 'a.mp3', 'creation_date': now.isoformat(),
+                      'expiry_date': (now + timedelta(hours=1)).isoformat()})
+    assert read_json(Config.SHARED_LINKS_FILE)['abc']['item_name'] == 'a.mp3'
+    assert store.delete('abc')
+    assert store.get('abc') is None
+
+def test_share_link_uses_store(editor_client):
+    write_upload('song.mp3')
+    rv = editor_client.post('/create-share/song.mp3', data={'link_name': 'Démo'})
+    token = extract_share_token(rv.data)
+
+    rv = editor_client.get(f'/share/{token}')
+    assert rv.status_code == 200
+    assert b'song.mp3' in rv.data
+
+    editor_client.post('/', data={'delete_link': token})
+    assert editor_client.get(f'/share/{token}').status_code == 404
+
+# Tests de l'index des dossiers
+def test_directory_index_sorts_and_caches(isolated_app, monkeypatch):
+    from services import dir_index
+    old = write_upload('old.mp3')
+    write_upload('new.mp3')
+    write_upload('notes.txt')
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'B'))
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'A'))
+    os.utime(old, (1000, 1000))
+    # Date du dossier dans le passé pour que la lecture soit réutilisable
+    os.utime(Config.UPLOAD_FOLDER, (2000, 2000))
+
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(dir_index.os, 'scandir', lambda p: scans.append(p) or real_scandir(p))
+
+    listing = dir_index.directory_index.get(Config.UPLOAD_FOLDER)
+    assert [f.name for f in listing.files] == ['new.mp3', 'old.mp3']
+    assert listing.folders == ['A', 'B']
+    assert listing.files[1].stat.st_mtime == 1000
+
+    assert dir_index.directory_index.get(Config.UPLOAD_FOLDER) is listing
+    assert len(scans) == 1
+
+    # Un changement du mtime du dossier force une nouvelle lecture
+    os.utime(Config.UPLOAD_FOLDER, (3000, 3000))
+    assert dir_index.directory_index.get(Config.UPLOAD_FOLDER) is not listing
+    assert len(scans) == 2
+
+def test_directory_index_lru_bound(isolated_app, monkeypatch):
+    from services.dir_index import DirectoryIndex
+    monkeypatch.setattr(Config, 'DIR_INDEX_MAX_ENTRIES', 3)
+    index = DirectoryIndex()
+    for name in ('a', 'b', 'c'):
+        for i in range(2):
+            write_upload(f'{name}/{i}.mp3')
+        index.get(os.path.join(Config.UPLOAD_FOLDER, name))
+    assert list(index._listings) == [os.path.join(Config.UPLOAD_FOLDER, 'c')]
+    assert index._entries == 2
+
+def test_upload_invalidates_directory_index(editor_client):
+    editor_client.get('/')
+    rv = editor_client.post('/', data={'file': (io.BytesIO(b'data'), 'fresh.mp3')}, follow_redirects=True)
+    assert b'fresh.mp3' in rv.data
+
+# Tests des requêtes partielles et conditionnelles sur /uploads
+AUDIO_BYTES = bytes(range(256)) * 40
+
+def test_uploads_full_and_single_range(viewer_client):
+    write_upload('track.flac', AUDIO_BYTES)
+    client = viewer_client
+
+    rv = client.get('/uploads/track.flac')
+    assert rv.status_code == 200
+    assert rv.data == AUDIO_BYTES
+    assert rv.headers['Accept-Ranges'] == 'bytes'
+    assert rv.headers['Content-Type'] == 'audio/flac'
+
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=1000-1999'})
+    assert rv.status_code == 206
+    assert rv.data == AUDIO_BYTES[1000:2000]
+    assert rv.headers['Content-Range'] == f'bytes 1000-1999/{len(AUDIO_BYTES)}'
+    assert rv.headers['Content-Length'] == '1000'
+
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=-100'})
+    assert rv.data == AUDIO_BYTES[-100:]
+
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=10000-'})
+    assert rv.data == AUDIO_BYTES[10000:]
+
+def test_uploads_multi_range(viewer_client):
+    write_upload('track.flac', AUDIO_BYTES)
+    client = viewer_client
+
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=0-9,5000-5009,-5'})
+    assert rv.status_code == 206
+    assert rv.mimetype == 'multipart/byteranges'
+    assert int(rv.headers['Content-Length']) == len(rv.data)
+    boundary = rv.mimetype_params['boundary'].encode()
+    parts = [p for p in rv.data.split(b'--' + boundary) if p.strip(b'\r\n-')]
+    bodies = [p.split(b'\r\n\r\n', 1)[1][:-2] for p in parts]
+    assert bodies == [AUDIO_BYTES[0:10], AUDIO_BYTES[5000:5010], AUDIO_BYTES[-5:]]
+    assert b'Content-Range: bytes 5000-5009/10240' in parts[1]
+
+def test_uploads_unsatisfiable_range(viewer_client):
+    write_upload('track.flac', AUDIO_BYTES)
+    rv = viewer_client.get('/uploads/track.flac', headers={'Range': 'bytes=20000-'})
+    assert rv.status_code == 416
+    assert rv.headers['Content-Range'] == f'bytes */{len(AUDIO_BYTES)}'
+
+def test_uploads_conditional_requests(viewer_client):
+    path = write_upload('track.flac', AUDIO_BYTES)
+    client = viewer_client
+    rv = client.get('/uploads/track.flac')
+    etag = rv.headers['ETag']
+    st = os.stat(path)
+    assert etag == f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+    assert client.get('/uploads/track.flac', headers={'If-None-Match': etag}).status_code == 304
+    rv = client.get('/uploads/track.flac', headers={'If-Modified-Since': rv.headers['Last-Modified']})
+    assert rv.status_code == 304
+
+    # If-Range correspondant : la plage est servie
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=0-3', 'If-Range': etag})
+    assert rv.status_code == 206
+    assert rv.data == AUDIO_BYTES[:4]
+
+    # If-Range obsolète : le fichier entier est renvoyé
+    rv = client.get('/uploads/track.flac', headers={'Range': 'bytes=0-3', 'If-Range': '"stale"'})
+    assert rv.status_code == 200
+    assert rv.data == AUDIO_BYTES
+
+# Tests de l'envoi délégué au proxy (X-Accel-Redirect / X-Sendfile)
+def test_x_accel_delivery(viewer_client, monkeypatch):
+    monkeypatch.setattr(Config, 'FILE_DELIVERY', 'x-accel')
+    monkeypatch.setattr(Config, 'X_ACCEL_PREFIX', '/internal/')
+    write_upload('Mon dossier/été #1.mp3', AUDIO_BYTES)
+
+    rv = viewer_client.get('/uploads/Mon dossier/été #1.mp3'.replace('#', '%23'))
+    assert rv.status_code == 200
+    assert rv.headers['X-Accel-Redirect'] == '/internal/Mon%20dossier/%C3%A9t%C3%A9%20%231.mp3'
+    assert rv.headers['Content-Type'] == 'audio/mpeg'
+    assert rv.data == b''
+
+def test_x_sendfile_delivery(viewer_client, monkeypatch):
+    monkeypatch.setattr(Config, 'FILE_DELIVERY', 'x-sendfile')
+    path = write_upload('folder/track.flac', AUDIO_BYTES)
+
+    rv = viewer_client.get('/uploads/folder/track.flac')
+    assert rv.status_code == 200
+    assert rv.headers['X-Sendfile'] == os.path.abspath(path)
+    assert rv.data == b''
+
+def test_offload_still_checks_path(viewer_client, monkeypatch):
+    monkeypatch.setattr(Config, 'FILE_DELIVERY', 'x-accel')
+    client = viewer_client
+    assert client.get('/uploads/missing.mp3').status_code == 404
+    rv = client.get('/uploads/%2E%2E/secret.mp3')
+    assert rv.status_code in (400, 404)
+    assert 'X-Accel-Redirect' not in rv.headers
+
+# Tests des envois par morceaux
+def start_chunked_upload(client, filename, size, path=''):
+    rv = client.post('/api/uploads', json={'path': path, 'filename': filename, 'size': size})
+    assert rv.status_code == 201
+    return rv.get_json()['upload_id']
+
+def test_chunked_upload_resume(editor_client, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_SIZE', 1024)
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'Album'))
+    write_upload('Album/song.flac', b'existing')
+    upload_id = start_chunked_upload(editor_client, 'song.flac', len(AUDIO_BYTES), 'Album')
+    url = f'/api/uploads/{upload_id}'
+
+    rv = editor_client.put(f'{url}?offset=0', data=AUDIO_BYTES[:1024])
+    assert rv.get_json() == {'offset': 1024, 'complete': False}
+    # Le fichier partiel est dans le dossier cible mais n'est pas listé
+    assert os.path.exists(os.path.join(Config.UPLOAD_FOLDER, 'Album', f'.{upload_id}.partial'))
+    assert b'.partial' not in editor_client.get('/Album').data
+
+    # Morceau envoyé à la mauvaise position : le serveur indique où reprendre
+    rv = editor_client.put(f'{url}?offset=0', data=AUDIO_BYTES[:1024])
+    assert rv.status_code == 409
+    assert rv.get_json()['offset'] == 1024
+    assert editor_client.get(url).get_json()['offset'] == 1024
+
+    offset = 1024
+    while offset < len(AUDIO_BYTES):
+        rv = editor_client.put(f'{url}?offset={offset}', data=AUDIO_BYTES[offset:offset + 1024])
+        offset = rv.get_json()['offset']
+    body = rv.get_json()
+    assert body['complete'] is True
+    assert body['filename'] == 'song_1.flac'
+    with open(os.path.join(Config.UPLOAD_FOLDER, 'Album', 'song_1.flac'), 'rb') as f:
+        assert f.read() == AUDIO_BYTES
+    assert sorted(os.listdir(os.path.join(Config.UPLOAD_FOLDER, 'Album'))) == ['song.flac', 'song_1.flac']
+    assert editor_client.get(url).status_code == 404
+
+def test_chunked_upload_rejects_bad_chunks(editor_client, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_SIZE', 1024)
+    upload_id = start_chunked_upload(editor_client, 'song.mp3', 3000)
+    url = f'/api/uploads/{upload_id}'
+    assert editor_client.put(f'{url}?offset=0', data=b'x' * 2048).status_code == 413
+    assert editor_client.put(f'{url}?offset=0', data=b'x' * 10).status_code == 400
+    assert editor_client.post('/api/uploads', json={'filename': 'notes.txt', 'size': 10}).status_code == 400
+
+def test_chunked_upload_requires_editor(isolated_app):
+    client = isolated_app.test_client()
+    client.post('/', data={'password': 'view-secret'})
+    rv = client.post('/api/uploads', json={'filename': 'song.mp3', 'size': 10})
+    assert rv.status_code == 403
+
+# Tests du catalogue (lecture des en-têtes audio)
+import struct
+
+def make_wav(seconds=1, rate=44100, channels=2, bits=16, title=b'Wave Title'):
+    data_size = rate * channels * bits // 8 * seconds
+    fmt = struct.pack('<HHIIHH', 1, channels, rate, rate * channels * bits // 8, channels * bits // 8, bits)
+    info = b'INFO' + b'INAM' + struct.pack('<I', len(title) + 1) + title + b'\x00'
+    if len(info) % 2:
+        info += b'\x00'
+    body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'data' + struct.pack('<I', data_size) + b'\x00' * data_size
+            + b'LIST' + struct.pack('<I', len(info)) + info)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+def make_flac(rate=48000, channels=2, bits=24, samples=96000):
+    packed = (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6 + packed.to_bytes(8, 'big') + b'\x00' * 16
+    comments = [b'TITLE=Flac Title', b'ARTIST=Flac Artist']
+    vorbis = struct.pack('<I', 6) + b'vendor' + struct.pack('<I', len(comments))
+    vorbis += b''.join(struct.pack('<I', len(c)) + c for c in comments)
+    return (b'fLaC' + bytes([0]) + len(streaminfo).to_bytes(3, 'big') + streaminfo
+            + bytes([0x84]) + len(vorbis).to_bytes(3, 'big') + vorbis + b'\xff\xf8' + b'\x00' * 1000)
+
+def make_mp3(frames=100):
+    def text_frame(frame_id, text):
+        payload = b'\x03' + text.encode()
+        return frame_id + struct.pack('>I', len(payload)) + b'\x00\x00' + payload
+    frames_data = text_frame(b'TIT2', 'Mp3 Title') + text_frame(b'TPE1', 'Mp3 Artist')
+    size = len(frames_data)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    id3 = b'ID3\x03\x00\x00' + syncsafe + frames_data
+    header = b'\xff\xfb\x90\x00'  # MPEG1 Layer III, 128 kb/s, 44.1 kHz, stéréo
+    xing = header + b'\x00' * 32 + b'Xing' + struct.pack('>III', 3, frames, frames * 417)
+    xing += b'\x00' * (417 - len(xing))
+    audio = header + b'\x00' * 413
+    return id3 + xing + audio * frames
+
+def make_ogg(rate=44100, channels=2, granule=44100 * 3):
+    def page(packet, granule_position, sequence, header_type=0):
+        segments = [255] * (len(packet) // 255) + [len(packet) % 255]
+        return (b'OggS' + bytes([0, header_type]) + struct.pack('<qII', granule_position, 1234, sequence)
+                + b'\x00' * 4 + bytes([len(segments)]) + bytes(segments) + packet)
+    ident = b'\x01vorbis' + struct.pack('<IBIiIiB', 0, channels, rate, 0, 160000, 0, 0xB8) + b'\x01'
+    comment = b'\x03vorbis' + struct.pack('<I', 0) + struct.pack('<I', 1)
+    comment += struct.pack('<I', 15) + b'TITLE=Ogg Title' + b'\x01'
+    return (page(ident, 0, 0, 2) + page(comment, 0, 1) + page(b'\x00' * 5000, 44100, 2)
+            + page(b'\x00' * 100, granule, 3, 4))
+
+def make_m4a(rate=44100, channels=2, duration_ms=5000):
+    def atom(kind, body):
+        return struct.pack('>I', len(body) + 8) + kind + body
+    mvhd = atom(b'mvhd', b'\x00' * 12 + struct.pack('>II', 1000, duration_ms) + b'\x00' * 80)
+    esds = atom(b'esds', b'\x00' * 4 + b'\x03\x19' + b'\x00\x01\x00' + b'\x04\x11\x40\x15'
+                + b'\x00' * 3 + struct.pack('>II', 320000, 256000) + b'\x05\x02\x12\x10')
+    mp4a = atom(b'mp4a', b'\x00' * 6 + b'\x00\x01' + b'\x00' * 8 + struct.pack('>HHHH', channels, 16, 0, 0)
+                + struct.pack('>I', rate << 16) + esds)
+    stsd = atom(b'stsd', b'\x00' * 4 + struct.pack('>I', 1) + mp4a)
+    trak = atom(b'trak', atom(b'mdia', atom(b'minf', atom(b'stbl', stsd))))
+    ilst = atom(b'ilst', atom(b'\xa9nam', atom(b'data', b'\x00\x00\x00\x01' + b'\x00' * 4 + b'M4a Title')))
+    udta = atom(b'udta', atom(b'meta', b'\x00' * 4 + ilst))
+    return atom(b'ftyp', b'M4A \x00\x00\x00\x00') + atom(b'moov', mvhd + trak + udta) + atom(b'mdat', b'\x00' * 2000)
+
+def test_read_metadata_formats(tmp_path):
+    from services.audio_metadata import read_metadata
+    samples = {'a.wav': make_wav(), 'b.flac': make_flac(), 'c.mp3': make_mp3(),
+               'd.ogg': make_ogg(), 'e.m4a': make_m4a()}
+    results = {}
+    for name, content in samples.items():
+        (tmp_path / name).write_bytes(content)
+        results[name] = read_metadata(str(tmp_path / name))
+
+    wav = results['a.wav']
+    assert (wav['sample_rate'], wav['channels'], wav['bits_per_sample']) == (44100, 2, 16)
+    assert wav['duration'] == 1.0
+    assert wav['tags']['title'] == 'Wave Title'
+
+    flac = results['b.flac']
+    assert (flac['sample_rate'], flac['channels'], flac['bits_per_sample']) == (48000, 2, 24)
+    assert flac['duration'] == 2.0
+    assert flac['tags'] == {'title': 'Flac Title', 'artist': 'Flac Artist'}
+
+    mp3 = results['c.mp3']
+    assert (mp3['sample_rate'], mp3['channels']) == (44100, 2)
+    assert mp3['duration'] == pytest.approx(100 * 1152 / 44100)
+    assert mp3['tags'] == {'title': 'Mp3 Title', 'artist': 'Mp3 Artist'}
+
+    ogg = results['d.ogg']
+    assert (ogg['format'], ogg['sample_rate'], ogg['channels']) == ('vorbis', 44100, 2)
+    assert ogg['duration'] == 3.0
+    assert ogg['tags']['title'] == 'Ogg Title'
+
+    m4a = results['e.m4a']
+    assert (m4a['sample_rate'], m4a['channels'], m4a['bitrate']) == (44100, 2, 256000)
+    assert m4a['duration'] == 5.0
+    assert m4a['tags']['title'] == 'M4a Title'
+
+def test_read_metadata_rejects_zero_ogg_rate(tmp_path):
+    from services.audio_metadata import read_metadata, MetadataError
+    path = tmp_path / 'broken.ogg'
+    path.write_bytes(make_ogg(rate=0))
+    with pytest.raises(MetadataError):
+        read_metadata(str(path))
+
+def test_read_metadata_only_reads_headers(tmp_path, monkeypatch):
+    import builtins
+    from services import audio_metadata
+    path = tmp_path / 'long.wav'
+    path.write_bytes(make_wav(seconds=10))
+    reads = []
+
+    real_open = builtins.open
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        real_read = f.read
+        class Tracked:
+            def __getattr__(self, name):
+                return getattr(f, name)
+            def read(self, n=-1):
+                data = real_read(n)
+                reads.append(len(data))
+                return data
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                f.close()
+        return Tracked()
+    monkeypatch.setattr(audio_metadata, 'open', tracking_open, raising=False)
+
+    audio_metadata.read_metadata(str(path))
+    assert sum(reads) < 1024
+
+def test_catalog_caches_by_size_and_mtime(isolated_app, monkeypatch):
+    from services import catalog as catalog_module
+    write_upload('Album/song.flac', make_flac())
+    catalog = catalog_module.get_catalog()
+
+    calls = []
+    real_read = catalog_module.read_metadata
+    monkeypatch.setattr(catalog_module, 'read_metadata', lambda p: calls.append(p) or real_read(p))
+
+    assert catalog.refresh('Album/song.flac')['sample_rate'] == 48000
+    assert catalog.refresh('Album/song.flac')['sample_rate'] == 48000
+    assert len(calls) == 1
+
+    # Un nouveau catalogue (redémarrage) relit la base sans réanalyser
+    restarted = catalog_module.Catalog(os.path.join(Config.DATA_FOLDER, 'catalog.db'), Config.UPLOAD_FOLDER)
+    restarted.refresh('Album/song.flac')
+    assert len(calls) == 1
+
+    # Après un oubli, le scan de la bibliothèque relance l'extraction
+    catalog.forget('Album')
+    for future in catalog.scan_async().result():
+        future.result()
+    assert len(calls) == 2
+
+def test_listing_shows_track_info(editor_client):
+    from services.catalog import get_catalog
+    write_upload('song.flac', make_flac())
+    get_catalog().refresh('song.flac')
+    rv = editor_client.get('/')
+    assert 'Flac Artist — Flac Title · 0:02 · FLAC · 48 kHz / 24 bits · stéréo'.encode() in rv.data
+
+# Tests des formes d'onde
+def make_pcm_wav(samples, rate=8000, channels=1, bits=16):
+    import numpy as np
+    if bits == 16:
+        raw = np.asarray(samples, dtype='<i2').tobytes()
+    else:  # 24 bits
+        values = np.asarray(samples, dtype=np.int32)
+        raw = np.stack([values & 0xFF, (values >> 8) & 0xFF, (values >> 16) & 0xFF], axis=1).astype(np.uint8).tobytes()
+    align = channels * bits // 8
+    fmt = struct.pack('<HHIIHH', 1, channels, rate, rate * align, align, bits)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(raw)) + raw
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+def test_wav_peaks_across_blocks(tmp_path, monkeypatch):
+    import numpy as np
+    from services import waveform
+    monkeypatch.setattr(Config, 'WAVEFORM_BUCKETS', 4)
+    # Petits blocs pour tester le regroupement et les intervalles découpés
+    monkeypatch.setattr(waveform, 'BLOCK_FRAMES', 3)
+
+    # Stéréo : les pics couvrent les deux voies
+    frames = [(0, 0), (16384, -32768), (0, 0), (0, 0),
+              (0, 0), (0, 0), (8192, 0), (0, -8192),
+              (0, 0), (0, 0), (0, 0), (0, 0),
+              (32767, 0), (0, 0), (0, 0), (0, -16384)]
+    path = tmp_path / 'stereo.wav'
+    path.write_bytes(make_pcm_wav(np.array(frames).ravel(), channels=2))
+    peaks = waveform.compute_wav_peaks(str(path))
+    assert peaks.tolist() == [-127, 64, -32, 32, 0, 0, -64, 127]
+
+    monkeypatch.setattr(Config, 'WAVEFORM_BUCKETS', 2)
+    path = tmp_path / 'deep.wav'
+    path.write_bytes(make_pcm_wav([0, -4194304, 0, 8388607], bits=24))
+    assert waveform.compute_wav_peaks(str(path)).tolist() == [-64, 0, 0, 127]
+
+def test_peaks_endpoint(viewer_client):
+    from services.waveform import get_waveform_store
+    write_upload('Album/track.wav', make_pcm_wav([0, 100, -100, 0] * 500))
+    client = viewer_client
+
+    rv = client.get('/peaks/Album/track.wav')
+    if rv.status_code == 202:
+        get_waveform_store().generate(os.path.join(Config.UPLOAD_FOLDER, 'Album', 'track.wav'), 'Album/track.wav')
+        rv = client.get('/peaks/Album/track.wav')
+    assert rv.status_code == 200
+    assert len(rv.data) == 2000
+    assert client.get('/peaks/Album/track.wav', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+    write_upload('Album/track.mp3', make_mp3())
+    assert client.get('/peaks/Album/track.mp3').status_code == 404
+
+def test_waveform_canvas_only_for_supported_files(viewer_client, monkeypatch):
+    from services import waveform
+    # Sans soundfile, les FLAC n'ont pas de forme d'onde
+    monkeypatch.setattr(waveform, 'soundfile', None)
+    write_upload('Album/track.wav', make_pcm_wav([0, 100, -100, 0]))
+    write_upload('Album/track.flac', make_flac())
+    page = viewer_client.get('/Album').get_data(as_text=True)
+    assert 'data-peaks="/peaks/Album/track.wav"' in page
+    assert 'data-peaks="/peaks/Album/track.flac"' not in page
+
+# Tests de la liste paginée
+def test_list_api_cursor_pagination(editor_client, monkeypatch):
+    from services import dir_index
+    for i in range(7):
+        path = write_upload(f'Big/track{i}.mp3')
+        os.utime(path, (1000 + i, 1000 + i))
+    # Même date : départagés par le nom
+    os.utime(write_upload('Big/same_b.mp3'), (500, 500))
+    os.utime(write_upload('Big/same_a.mp3'), (500, 500))
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'Big', 'Sub'))
+    os.utime(os.path.join(Config.UPLOAD_FOLDER, 'Big'), (2000, 2000))
+
+    sorts = []
+    real_scan = dir_index.scan_directory
+    monkeypatch.setattr(dir_index, 'scan_directory', lambda *a: sorts.append(a) or real_scan(*a))
+
+    names = []
+    cursor = None
+    pages = 0
+    while True:
+        query = {'limit': 3}
+        if cursor:
+            query['cursor'] = cursor
+        body = editor_client.get('/api/list/Big', query_string=query).get_json()
+        assert (body['folders'] == ['Sub']) == (cursor is None)
+        names += [f['name'] for f in body['files']]
+        pages += 1
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert names == [f'track{i}.mp3' for i in range(6, -1, -1)] + ['same_a.mp3', 'same_b.mp3']
+    assert pages == 3
+    assert body['files'][1]['url'].endswith('/uploads/Big/same_a.mp3')
+    # Le dossier n'est lu et trié qu'une fois pour toutes les pages
+    assert len(sorts) == 1
+
+    assert editor_client.get('/api/list/Big?cursor=!!').status_code == 400
+    assert editor_client.get('/api/list/Missing').status_code == 404
+
+def test_index_renders_first_page_only(editor_client, monkeypatch):
+    monkeypatch.setattr(Config, 'LISTING_PAGE_SIZE', 2)
+    for i in range(3):
+        os.utime(write_upload(f'track{i}.mp3'), (1000 + i, 1000 + i))
+    rv = editor_client.get('/')
+    assert b'track2.mp3' in rv.data and b'track1.mp3' in rv.data
+    assert b'>track0.mp3<' not in rv.data
+    assert b'data-next-cursor=""' not in rv.data
+
+def test_list_api_requires_login(isolated_app):
+    assert isolated_app.test_client().get('/api/list/').status_code == 401
+
+def _add_link(store, token, expiry_ts):
+    expiry = datetime.fromtimestamp(expiry_ts, timezone.utc)
+    store.add(token, {
+        'link_name': token,
+        'item_name': 'song.mp3',
+        'is_directory': False,
+        'creation_date': (expiry - timedelta(hours=1)).isoformat(),
+        'expiry_date': expiry.isoformat(),
+    })
+
+def test_purge_expired_in_batches(isolated_app):
+    from services.link_store import get_link_store
+    store = get_link_store()
+    now = time.time()
+    for i in range(7):
+        _add_link(store, f'old{i}', now - 10 - i)
+    _add_link(store, 'fresh', now + 3600)
+
+    assert sorted(store.purge_expired(now, batch_size=3)) == [f'old{i}' for i in range(7)]
+    assert [token for token, _ in store.all()] == ['fresh']
+    assert store.next_expiry() == pytest.approx(now + 3600, abs=1)
+
+def test_link_list_cache_reuses_until_change(isolated_app):
+    from services.link_store import get_link_store, LinkListCache
+    store = get_link_store()
+    cache = LinkListCache()
+    now = time.time()
+    _add_link(store, 'a', now + 60)
+
+    first = cache.get(store, now)
+    assert cache.get(store, now + 1) is first
+    assert first[0]['token'] == 'a' and not first[0]['is_expired']
+
+    # Un lien qui expire invalide la vue
+    expired = cache.get(store, now + 61)
+    assert expired is not first and expired[0]['is_expired']
+
+    # Une écriture change la version du store
+    _add_link(store, 'b', now + 120)
+    assert {link['token'] for link in cache.get(store, now + 61)} == {'a', 'b'}
+
+def test_share_link_ttl_choice(editor_client):
+    from services.link_store import get_link_store
+    write_upload('song.mp3')
+    before = time.time()
+    response = editor_client.post('/create-share/song.mp3', data={'link_name': 'demo', 'ttl_hours': '1'})
+    assert response.status_code == 200
+    token = extract_share_token(response.data)
+    expiry = datetime.fromisoformat(get_link_store().get(token)['expiry_date']).timestamp()
+    assert before + 3600 - 5 <= expiry <= time.time() + 3600
+
+    # Une durée hors bornes retombe sur la valeur par défaut
+    response = editor_client.post('/create-share/song.mp3', data={'ttl_hours': '100000'})
+    token = extract_share_token(response.data)
+    expiry = datetime.fromisoformat(get_link_store().get(token)['expiry_date']).timestamp()
+    assert expiry == pytest.approx(time.time() + Config.SHARE_DEFAULT_TTL_HOURS * 3600, abs=5)
+
+    page = editor_client.get('/').data.decode()
+    assert 'name="ttl_hours"' in page
+    assert f'/share/{token}' in page
+
+def test_expiry_scheduler_purges(isolated_app):
+    from services.link_store import get_link_store
+    from services.expiry import ExpiryScheduler
+    store = get_link_store()
+    now = 1_000_000.0
+    _add_link(store, 'old', now - 1)
+    _add_link(store, 'soon', now + 30)
+
+    scheduler = ExpiryScheduler(clock=lambda: now)
+    assert scheduler.run_once() == pytest.approx(30)
+    assert [token for token, _ in store.all()] == ['soon']
+
+# Tests de l'archive ZIP en flux
+def test_folder_zip_stream(editor_client):
+    write_upload('album/01 intro.mp3', b'a' * 1000)
+    write_upload('album/Été/02 outro.flac', b'b' * 70000)
+    write_upload('album/notes.txt', b'ignored')
+    write_upload('album/.abc.partial', b'partial')
+
+    response = editor_client.get('/zip/album')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="album.zip"'
+    data = response.get_data()
+    assert int(response.headers['Content-Length']) == len(data)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ['01 intro.mp3', 'Été/02 outro.flac']
+        assert archive.testzip() is None
+        assert archive.read('Été/02 outro.flac') == b'b' * 70000
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+
+def test_folder_zip_zip64(editor_client, monkeypatch):
+    import services.zipstream as zipstream
+    monkeypatch.setattr(zipstream, 'ZIP64_LIMIT', 100)
+    write_upload('big/a.mp3', b'a' * 150)
+    write_upload('big/b.mp3', b'b' * 50)
+
+    response = editor_client.get('/zip/big')
+    data = response.get_data()
+    assert int(response.headers['Content-Length']) == len(data)
+    assert b'PK\x06\x06' in data
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.read('a.mp3') == b'a' * 150
+        assert archive.read('b.mp3') == b'b' * 50
+
+def test_shared_folder_zip(isolated_app, editor_client):
+    write_upload('shared/song.mp3', AUDIO_BYTES)
+    rv = editor_client.post('/create-share/shared', data={'link_name': 'Dossier'})
+    token = extract_share_token(rv.data)
+
+    with isolated_app.test_client() as anonymous:
+        page = anonymous.get(f'/share/{token}')
+        assert f'/share/{token}/zip'.encode() in page.data
+        response = anonymous.get(f'/share/{token}/zip')
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+            assert archive.read('song.mp3') == AUDIO_BYTES
+        assert anonymous.get('/zip/shared').status_code == 403
+
+# Tests de la recherche
+def test_search_index_tokens_and_prefixes():
+    from services.search_index import SearchIndex, tokenize
+    assert tokenize('Été à Zürich_live-2.FLAC') == ['ete', 'a', 'zurich', 'live', '2', 'flac']
+
+    index = SearchIndex('.')
+    index.add('Beethoven', is_dir=True)
+    index.add('Beethoven/Symphonie nº5.flac', tags_text='Allegro con brio')
+    index.add('Bach/Préludes.mp3')
+    assert [r['path'] for r in index.search('beet')] == ['Beethoven', 'Beethoven/Symphonie nº5.flac']
+    assert [r['path'] for r in index.search('PRELUDE')] == ['Bach/Préludes.mp3']
+    assert [r['path'] for r in index.search('beeth allegro')] == ['Beethoven/Symphonie nº5.flac']
+    assert index.search('beethoven mozart') == []
+
+    index.remove('Beethoven')
+    assert index.search('beet') == []
+    assert index.search('allegro') == []
+    assert index.stats()['paths'] == 1
+
+def test_search_index_shared_between_processes(tmp_path, monkeypatch):
+    from services import search_index
+    (tmp_path / 'lib').mkdir()
+    (tmp_path / 'lib' / 'intro.mp3').write_bytes(AUDIO_BYTES)
+    db_path = str(tmp_path / 'search.db')
+    # Deux workers : chacun son index, un journal commun
+    first = search_index.SearchIndex(str(tmp_path / 'lib'), db_path)
+    second = search_index.SearchIndex(str(tmp_path / 'lib'), db_path)
+    first.ensure_built()
+    second.ensure_built()
+
+    first.add('Live', is_dir=True)
+    first.add('Live/encore.mp3')
+    second.ensure_built()
+    assert [r['path'] for r in second.search('encore')] == ['Live/encore.mp3']
+
+    second.move('Live', 'Concerts')
+    first.remove('intro.mp3')
+    first.ensure_built()
+    second.ensure_built()
+    for index in (first, second):
+        assert [r['path'] for r in index.search('encore')] == ['Concerts/encore.mp3']
+        assert index.search('intro') == []
+
+    # Trop de retard : le journal a été tronqué, l'index est reconstruit
+    monkeypatch.setattr(search_index, 'JOURNAL_SIZE', 2)
+    monkeypatch.setattr(search_index, 'JOURNAL_PRUNE_EVERY', 1)
+    (tmp_path / 'lib' / 'outro.mp3').write_bytes(AUDIO_BYTES)
+    for name in ('a.mp3', 'b.mp3', 'outro.mp3'):
+        first.add(name)
+    second.ensure_built()
+    assert [r['path'] for r in second.search('outro')] == ['outro.mp3']
+    assert second.search('encore') == []
+
+def test_search_follows_uploads_and_deletes(editor_client):
+    write_upload('Albums/old.mp3')
+    assert editor_client.get('/api/search?q=old').get_json()['results'][0]['path'] == 'Albums/old.mp3'
+
+    editor_client.post('/Albums', data={'file': (io.BytesIO(AUDIO_BYTES), 'Café Noir.mp3')},
+                       content_type='multipart/form-data')
+    editor_client.post('/Albums', data={'create_folder': 'Démos'})
+    results = editor_client.get('/api/search?q=cafe').get_json()['results']
+    assert [r['path'] for r in results] == ['Albums/Café Noir.mp3']
+    assert results[0]['url'].endswith('/uploads/Albums/Caf%C3%A9%20Noir.mp3')
+    assert editor_client.get('/api/search?q=demos').get_json()['results'][0]['is_directory']
+
+    editor_client.post('/Albums', data={'delete_item': 'Café Noir.mp3'})
+    assert editor_client.get('/api/search?q=cafe').get_json()['results'] == []
+
+    page = editor_client.get('/search?q=old')
+    assert b'Albums' in page.data and b'old.mp3' in page.data
+    assert editor_client.get('/api/search/stats').get_json()['memory_bytes'] > 0
+
+def test_search_matches_catalog_tags(editor_client):
+    from services.catalog import get_catalog
+    write_upload('take1.flac', make_flac())
+    get_catalog().refresh('take1.flac')
+    # Construction initiale : tags déjà connus du catalogue
+    results = editor_client.get('/api/search?q=artist title').get_json()['results']
+    assert [r['path'] for r in results] == ['take1.flac']
+
+    # Mise à jour incrémentale quand le catalogue lit un nouveau morceau
+    write_upload('take2.flac', make_flac())
+    editor_client.get('/api/search?q=x')
+    from services.search_index import get_search_index
+    get_search_index().add('take2.flac')
+    get_catalog().refresh('take2.flac')
+    results = editor_client.get('/api/search?q=flac artist').get_json()['results']
+    assert [r['path'] for r in results] == ['take1.flac', 'take2.flac']
+
+def test_search_requires_login(isolated_app):
+    with isolated_app.test_client() as client:
+        assert client.get('/api/search?q=x').status_code == 401
+        assert client.get('/search?q=x').status_code == 302
+
+# Tests de la déduplication des envois
+def form_upload(client, path, filename, content):
+    rv = client.post(f'/{path}', data={'file': (io.BytesIO(content), filename)},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 302
+
+def test_block_digest_independent_of_chunking(monkeypatch):
+    from services import dedup
+    monkeypatch.setattr(dedup, 'HASH_BLOCK_SIZE', 4)
+    data = bytes(range(23))
+    whole = dedup.BlockHasher()
+    whole.update(data)
+    pieces = b''
+    for i in range(0, len(data), 8):
+        hasher = dedup.BlockHasher()
+        hasher.update(data[i:i + 3])
+        hasher.update(data[i + 3:i + 8])
+        pieces += hasher.finish()
+    assert whole.finish() == pieces
+
+def test_identical_uploads_are_hardlinked(editor_client):
+    content = AUDIO_BYTES * 50
+    editor_client.post('/', data={'create_folder': 'A'})
+    editor_client.post('/', data={'create_folder': 'B'})
+    form_upload(editor_client, 'A', 'master.flac', content)
+    form_upload(editor_client, 'B', 'master.flac', content)
+    form_upload(editor_client, 'B', 'master.flac', content)
+    form_upload(editor_client, 'B', 'other.flac', content + b'x')
+
+    a = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'A', 'master.flac'))
+    b = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'B', 'master.flac'))
+    b1 = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'B', 'master_1.flac'))
+    other = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'B', 'other.flac'))
+    assert a.st_ino == b.st_ino == b1.st_ino and a.st_nlink == 3
+    assert other.st_ino != a.st_ino
+    assert not [n for n in os.listdir(os.path.join(Config.UPLOAD_FOLDER, 'B')) if n.startswith('.')]
+
+    report = editor_client.get('/api/dedup/report').get_json()
+    assert report['bytes_saved'] == 2 * len(content)
+    assert report['unique_contents'] == 2
+
+def test_deduplicated_upload_leaves_existing_copies_untouched(editor_client):
+    content = AUDIO_BYTES * 20
+    form_upload(editor_client, '', 'master.flac', content)
+    master_path = os.path.join(Config.UPLOAD_FOLDER, 'master.flac')
+    os.utime(master_path, (1000, 1000))
+    editor_client.post('/', data={'create_folder': 'Album'})
+    os.utime(write_upload('Album/recent.flac', b'other'), (2000, 2000))
+    master_entry = editor_client.get('/api/list/').get_json()['files'][0]
+
+    # Lien physique : la copie a la date de la référence, qui ne change pas
+    form_upload(editor_client, 'Album', 'copy.flac', content)
+    copy = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'Album', 'copy.flac'))
+    assert copy.st_ino == os.stat(master_path).st_ino
+    assert os.stat(master_path).st_mtime == copy.st_mtime == 1000
+    assert editor_client.get('/api/list/').get_json()['files'][0] == master_entry
+    body = editor_client.get('/api/list/Album').get_json()
+    assert [f['name'] for f in body['files']] == ['recent.flac', 'copy.flac']
+
+def test_dedup_delete_keeps_other_links(editor_client):
+    content = AUDIO_BYTES * 10
+    form_upload(editor_client, '', 'one.mp3', content)
+    form_upload(editor_client, '', 'two.mp3', content)
+
+    # Supprimer la référence : l'autre lien garde le contenu et prend le relais
+    editor_client.post('/', data={'delete_item': 'one.mp3'})
+    assert editor_client.get('/api/dedup/report').get_json()['bytes_saved'] == 0
+    with open(os.path.join(Config.UPLOAD_FOLDER, 'two.mp3'), 'rb') as f:
+        assert f.read() == content
+
+    form_upload(editor_client, '', 'three.mp3', content)
+    two = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'two.mp3'))
+    three = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'three.mp3'))
+    assert two.st_ino == three.st_ino
+    assert editor_client.get('/api/dedup/report').get_json()['bytes_saved'] == len(content)
+
+    editor_client.post('/', data={'delete_item': 'two.mp3'})
+    editor_client.post('/', data={'delete_item': 'three.mp3'})
+    report = editor_client.get('/api/dedup/report').get_json()
+    assert report['files'] == 0 and report['stored_bytes'] == 0
+
+def test_chunked_upload_is_deduplicated(editor_client, monkeypatch):
+    from services import dedup
+    monkeypatch.setattr(dedup, 'HASH_BLOCK_SIZE', 512)
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_SIZE', 1024)
+    content = AUDIO_BYTES * 40
+    form_upload(editor_client, '', 'form.wav', content)
+
+    upload_id = start_chunked_upload(editor_client, 'chunked.wav', len(content))
+    for offset in range(0, len(content), 1024):
+        rv = editor_client.put(f'/api/uploads/{upload_id}?offset={offset}', data=content[offset:offset + 1024])
+        assert rv.status_code in (200, 201)
+    form = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'form.wav'))
+    chunked = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'chunked.wav'))
+    assert form.st_ino == chunked.st_ino
+
+def test_interrupted_chunk_is_discarded(editor_client, monkeypatch):
+    from services import dedup, uploads
+    from werkzeug.exceptions import ClientDisconnected
+    monkeypatch.setattr(dedup, 'HASH_BLOCK_SIZE', 512)
+    monkeypatch.setattr(uploads, 'READ_SIZE', 300)
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_SIZE', 1024)
+    content = AUDIO_BYTES * 4
+
+    class DroppedStream:
+        # Connexion coupée après 600 octets du morceau
+        def __init__(self, data):
+            self.data = io.BytesIO(data[:600])
+        def read(self, size):
+            data = self.data.read(size)
+            if not data:
+                raise ClientDisconnected()
+            return data
+
+    state = uploads.start_upload(Config.UPLOAD_FOLDER, '', 'chunked.wav', len(content))
+    uploads.write_chunk(Config.UPLOAD_FOLDER, state, 0, 1024, io.BytesIO(content[:1024]))
+    with pytest.raises(ClientDisconnected):
+        uploads.write_chunk(Config.UPLOAD_FOLDER, state, 1024, 1024, DroppedStream(content[1024:2048]))
+    # La reprise se fait au début du morceau interrompu
+    assert uploads.upload_offset(Config.UPLOAD_FOLDER, state) == 1024
+    for offset in range(1024, len(content), 1024):
+        uploads.write_chunk(Config.UPLOAD_FOLDER, state, offset, 1024, io.BytesIO(content[offset:offset + 1024]))
+    with open(os.path.join(Config.UPLOAD_FOLDER, 'chunked.wav'), 'rb') as f:
+        assert f.read() == content
+    # Empreinte correcte : un envoi identique est dédupliqué
+    form_upload(editor_client, '', 'form.wav', content)
+    form = os.stat(os.path.join(Config.UPLOAD_FOLDER, 'form.wav'))
+    assert form.st_ino == os.stat(os.path.join(Config.UPLOAD_FOLDER, 'chunked.wav')).st_ino
+
+# Tests des mesures (/metrics)
+def test_metrics_endpoint(editor_client, isolated_app, monkeypatch):
+    from services.metrics import streams_in_flight, response_bytes
+    write_upload('song.mp3', AUDIO_BYTES)
+    editor_client.get('/')
+    in_flight = streams_in_flight._values.get(('main.uploaded_file',), 0)
+    sent = response_bytes._values.get(('main.uploaded_file',), 0)
+    response = editor_client.get('/uploads/song.mp3')
+    assert response.get_data() == AUDIO_BYTES
+    response.close()
+    assert streams_in_flight._values[('main.uploaded_file',)] == in_flight
+    assert response_bytes._values[('main.uploaded_file',)] == sent + len(AUDIO_BYTES)
+
+    body = editor_client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE hush_request_duration_seconds histogram' in body
+    assert 'hush_request_duration_seconds_bucket{endpoint="main.index",method="GET",le="+Inf"}' in body
+    assert 'hush_requests_total{endpoint="main.uploaded_file",method="GET",status="200"}' in body
+    assert 'hush_operation_duration_seconds_count{operation="get_directory_listing"}' in body
+    assert 'hush_template_render_seconds_count{template="index.html"}' in body
+    assert 'hush_streams_in_flight{endpoint="main.uploaded_file"}' in body
+
+    # Accès : session éditeur ou jeton du collecteur
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', 'scrape-token')
+    with isolated_app.test_client() as anonymous:
+        assert anonymous.get('/metrics').status_code == 403
+        assert anonymous.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+
+def test_metrics_counts_streams_in_flight(isolated_app):
+    from services.metrics import _CountingStream, streams_in_flight, response_bytes
+    stream = _CountingStream(iter([b'ab', b'cde']), 'test.stream')
+    assert streams_in_flight._values[('test.stream',)] == 1
+    assert b''.join(stream) == b'abcde'
+    stream.close()
+    stream.close()
+    assert streams_in_flight._values[('test.stream',)] == 0
+    assert response_bytes._values[('test.stream',)] == 5
+
+def test_sampling_profiler(editor_client):
+    response = editor_client.post('/metrics/profiler', data={'action': 'start', 'interval': '0.001'})
+    assert response.get_json()['running']
+    deadline = time.time() + 2
+    while time.time() < deadline and not editor_client.get('/metrics/profiler').get_data():
+        time.sleep(0.01)
+    assert editor_client.post('/metrics/profiler', data={'action': 'stop'}).get_json()['running'] is False
+    lines = editor_client.get('/metrics/profiler').get_data(as_text=True).splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+# Tests de la file de tâches (suppressions récursives, déplacements)
+def create_share(client, item_path):
+    rv = client.post(f'/create-share/{item_path}', data={'link_name': 'Partage'})
+    return extract_share_token(rv.data)
+
+def test_recursive_delete_job(editor_client):
+    from services.jobs import get_job_queue
+    for i in range(5):
+        write_upload(f'Album/CD{i % 2}/track{i}.mp3')
+    token = create_share(editor_client, 'Album/CD0/track0.mp3')
+
+    rv = editor_client.post('/', data={'delete_item': 'Album', 'recursive': '1'})
+    assert rv.status_code == 302
+    job_id = rv.headers['Location'].split('job=')[1]
+    # Le dossier disparaît de la liste dès le début de la tâche
+    assert editor_client.get(f'/api/jobs/{job_id}').get_json()['status'] == 'queued'
+
+    get_job_queue().run_pending()
+    job = editor_client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'done' and job['progress'] == 1.0
+    assert job['done'] == job['total'] == 8  # dossier, 2 sous-dossiers, 5 fichiers
+    assert os.listdir(Config.UPLOAD_FOLDER) == []
+    assert editor_client.get(f'/share/{token}').status_code == 404
+
+def test_multi_delete_job(editor_client):
+    from services.jobs import get_job_queue
+    write_upload('Keep/a.mp3')
+    write_upload('One/a.mp3')
+    write_upload('two.mp3')
+    rv = editor_client.post('/api/jobs/delete', json={'path': '', 'items': ['One', 'two.mp3']})
+    assert rv.status_code == 202
+    assert editor_client.post('/api/jobs/delete', json={'path': '', 'items': ['missing']}).status_code == 404
+    assert editor_client.post('/api/jobs/delete', json={'path': '', 'items': ['../x']}).status_code == 400
+
+    get_job_queue().run_pending()
+    assert editor_client.get(rv.get_json()['status_url']).get_json()['status'] == 'done'
+    assert os.listdir(Config.UPLOAD_FOLDER) == ['Keep']
+    assert b'One' not in editor_client.get('/').data
+
+def test_multi_delete_job_removes_links_once(editor_client):
+    from services.jobs import get_job_queue
+    from services.link_store import get_link_store
+    write_upload('One/a.mp3')
+    write_upload('two.mp3')
+    write_upload('keep.mp3')
+    tokens = [create_share(editor_client, path) for path in ('One', 'One/a.mp3', 'two.mp3', 'keep.mp3')]
+    version = get_link_store().version()
+    editor_client.post('/api/jobs/delete', json={'path': '', 'items': ['One', 'two.mp3']})
+    get_job_queue().run_pending()
+    # Une seule écriture du store (une seule version) pour les deux éléments
+    assert get_link_store().version() == version + 1
+    assert [token for token, _ in get_link_store().all()] == tokens[3:]
+
+def test_move_job_rewrites_share_links(editor_client):
+    from services.jobs import get_job_queue
+    from services.link_store import get_link_store
+    write_upload('Old/Disc/song.mp3')
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'Archive'))
+    folder_token = create_share(editor_client, 'Old')
+    file_token = create_share(editor_client, 'Old/Disc/song.mp3')
+    editor_client.get('/Old/Disc')  # listing mis en cache
+    assert editor_client.get('/api/search?q=song').get_json()['results']  # index construit
+
+    rv = editor_client.post('/api/jobs/move', json={'source': 'Old', 'destination': 'Archive/New'})
+    assert rv.status_code == 202
+    assert editor_client.post('/api/jobs/move', json={'source': 'Old', 'destination': 'Old/Sub'}).status_code == 400
+    assert editor_client.post('/api/jobs/move', json={'source': 'Old', 'destination': 'Archive'}).status_code == 409
+    get_job_queue().run_pending()
+
+    assert os.path.isfile(os.path.join(Config.UPLOAD_FOLDER, 'Archive', 'New', 'Disc', 'song.mp3'))
+    store = get_link_store()
+    assert store.get(folder_token)['item_name'] == 'Archive/New'
+    assert store.get(file_token)['item_name'] == 'Archive/New/Disc/song.mp3'
+    assert editor_client.get(f'/share/{file_token}').status_code == 200
+    assert b'song.mp3' in editor_client.get('/Archive/New/Disc').data
+    results = editor_client.get('/api/search?q=song').get_json()['results']
+    assert [r['path'] for r in results] == ['Archive/New/Disc/song.mp3']
+
+def test_stale_job_is_resumed(isolated_app, monkeypatch):
+    from services.jobs import get_job_queue
+    write_upload('Big/a.mp3')
+    queue = get_job_queue()
+    job_id = queue.submit('delete', {'paths': ['Big']})
+    # Tâche réservée par un processus arrêté depuis
+    assert queue._claim().id == job_id
+    assert queue.run_one() is False
+    monkeypatch.setattr(Config, 'JOB_STALE_AFTER', -1)
+    queue.run_pending()
+    assert queue.status(job_id)['status'] == 'done'
+    assert not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, 'Big'))
+
+def test_delete_job_heartbeat_while_counting(isolated_app, monkeypatch):
+    from services import jobs
+    for name in ('A/1/a.mp3', 'A/2/b.mp3', 'A/3/c.mp3'):
+        write_upload(name)
+    monkeypatch.setattr(jobs, 'PROGRESS_INTERVAL', 0)
+    calls = []
+    real_save = jobs.Job.save_progress
+    real_set_total = jobs.Job.set_total
+    monkeypatch.setattr(jobs.Job, 'save_progress', lambda job, force=False: calls.append('save') or real_save(job, force))
+    monkeypatch.setattr(jobs.Job, 'set_total', lambda job, total: calls.append('total') or real_set_total(job, total))
+    queue = jobs.get_job_queue()
+    job_id = queue.submit('delete', {'paths': ['A']})
+    queue.run_pending()
+    assert queue.status(job_id)['status'] == 'done'
+    # Un battement par dossier parcouru avant de connaître le total
+    assert calls[:calls.index('total')] == ['save'] * 4
+
+def test_job_workers_run_in_background(isolated_app):
+    from services.jobs import get_job_queue
+    write_upload('Folder/a.mp3')
+    queue = get_job_queue()
+    queue.start()
+    job_id = queue.submit('move', {'source': 'Folder', 'destination': 'Renamed'})
+    deadline = time.time() + 5
+    while time.time() < deadline and queue.status(job_id)['status'] != 'done':
+        time.sleep(0.01)
+    assert queue.status(job_id)['status'] == 'done'
+    assert os.path.isfile(os.path.join(Config.UPLOAD_FOLDER, 'Renamed', 'a.mp3'))
+
+# Tests du cache HTTP des pages de dossiers
+def settle(relative_dir=''):
+    from services.catalog import get_catalog
+    # Métadonnées déjà lues, et dossier daté dans le passé : sa lecture n'est
+    # plus « récente » (dir_index)
+    path = os.path.join(Config.UPLOAD_FOLDER, relative_dir)
+    for name in os.listdir(path):
+        if os.path.isfile(os.path.join(path, name)):
+            get_catalog().refresh(f'{relative_dir}/{name}' if relative_dir else name)
+    past = time.time() - 10
+    os.utime(path, (past, past))
+
+def test_listing_etag_and_304(editor_client, isolated_app):
+    write_upload('Album/one.mp3')
+    settle('Album')
+    first = editor_client.get('/Album')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/') and first.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = editor_client.get('/Album', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+
+    # Un autre rôle n'a pas la même page
+    with isolated_app.test_client() as viewer:
+        viewer.post('/', data={'password': 'view-secret'})
+        assert viewer.get('/Album', headers={'If-None-Match': etag}).status_code == 200
+
+    # Un nouveau lien change le panneau de l'éditeur
+    create_share(editor_client, 'Album/one.mp3')
+    assert editor_client.get('/Album', headers={'If-None-Match': etag}).status_code == 200
+
+    # Un nouveau fichier change le dossier
+    etag = editor_client.get('/Album').headers['ETag']
+    write_upload('Album/two.mp3')
+    settle('Album')
+    fresh = editor_client.get('/Album', headers={'If-None-Match': etag})
+    assert fresh.status_code == 200 and b'two.mp3' in fresh.data
+
+def test_listing_etag_ignores_other_folders(editor_client):
+    from services.catalog import get_catalog
+    from services.usage import get_usage_index
+    write_upload('Album/one.flac', make_flac())
+    write_upload('Other/two.flac', make_flac())
+    settle('Album')
+    etag = editor_client.get('/Album').headers['ETag']
+
+    # Métadonnées lues et envoi ailleurs : le dossier n'a pas changé
+    get_catalog().refresh('Other/two.flac')
+    get_usage_index().add_file('Other/three.mp3', 100)
+    assert editor_client.get('/Album', headers={'If-None-Match': etag}).status_code == 304
+
+    # Taille d'un sous-dossier affiché
+    get_usage_index().add_file('Album/CD1/four.mp3', 100)
+    assert editor_client.get('/Album', headers={'If-None-Match': etag}).status_code == 200
+
+def test_recently_modified_listing_has_no_etag(editor_client):
+    write_upload('Album/one.mp3')
+    assert 'ETag' not in editor_client.get('/Album').headers
+
+def test_folder_contents_fragment_cache(editor_client, monkeypatch):
+    from routes import main
+    write_upload('Album/one.mp3')
+    settle('Album')
+    calls = []
+    original = main.get_track_info
+    monkeypatch.setattr(main, 'get_track_info', lambda *args: calls.append(args) or original(*args))
+    first = editor_client.get('/Album').data
+    second = editor_client.get('/Album').data
+    assert first == second and b'one.mp3' in second
+    assert len(calls) == 1
+
+def test_shared_folder_etag(isolated_app, editor_client):
+    write_upload('Shared/song.mp3')
+    settle('Shared')
+    token = create_share(editor_client, 'Shared')
+    with isolated_app.test_client() as anonymous:
+        first = anonymous.get(f'/share/{token}')
+        assert b'song.mp3' in first.data
+        etag = first.headers['ETag']
+        assert anonymous.get(f'/share/{token}', headers={'If-None-Match': etag}).status_code == 304
+        write_upload('Shared/other.mp3')
+        settle('Shared')
+        assert anonymous.get(f'/share/{token}', headers={'If-None-Match': etag}).status_code == 200
+
+# Tests du partage de la bande passante (horloge simulée)
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def fake_bandwidth(monkeypatch):
+    from routes import main
+    from services.bandwidth import BandwidthScheduler
+    clock = FakeClock()
+    scheduler = BandwidthScheduler(clock=clock, sleep=clock.sleep)
+    monkeypatch.setattr(main, 'bandwidth_scheduler', scheduler)
+    return scheduler, clock
+
+def chunks(count, size=10000):
+    return [b'x' * size for _ in range(count)]
+
+def test_global_limit_rate(fake_bandwidth, monkeypatch):
+    scheduler, clock = fake_bandwidth
+    monkeypatch.setattr(Config, 'BANDWIDTH_GLOBAL_LIMIT', 100000)
+    stream = scheduler.wrap(chunks(50), scheduler.acquire('session'))
+    start = clock()
+    assert sum(len(data) for data in stream) == 500000
+    # Une seconde de réserve, puis 100 000 octets/s
+    assert clock() - start == pytest.approx(4.0, abs=0.01)
+
+def test_share_limit_is_shared_fairly(fake_bandwidth, monkeypatch):
+    scheduler, clock = fake_bandwidth
+    monkeypatch.setattr(Config, 'BANDWIDTH_SHARE_LIMIT', 100000)
+    monkeypatch.setattr(Config, 'BANDWIDTH_BURST_SECONDS', 0.1)
+    first = iter(scheduler.wrap(chunks(100), scheduler.acquire('a', 'token'), 'token'))
+    second = iter(scheduler.wrap(chunks(100), scheduler.acquire('b', 'token'), 'token'))
+    editor = iter(scheduler.wrap(chunks(100), scheduler.acquire('editor')))
+    start = clock()
+    sent = {'first': 0, 'second': 0}
+    while clock() - start < 10:
+        sent['first'] += len(next(first))
+        sent['second'] += len(next(second))
+    # Les deux flux du lien se partagent 100 000 octets/s...
+    elapsed = clock() - start
+    assert (sent['first'] + sent['second']) / elapsed == pytest.approx(100000, rel=0.05)
+    assert sent['first'] == pytest.approx(sent['second'], rel=0.05)
+    # ...sans ralentir les autres sessions
+    before = clock()
+    assert sum(len(next(editor)) for _ in range(100)) == 1000000
+    assert clock() == before
+
+def test_session_limit_rate(fake_bandwidth, monkeypatch):
+    scheduler, clock = fake_bandwidth
+    monkeypatch.setattr(Config, 'BANDWIDTH_SESSION_LIMIT', 50000)
+    monkeypatch.setattr(Config, 'BANDWIDTH_BURST_SECONDS', 0)
+    slow = scheduler.wrap(chunks(10), scheduler.acquire('listener'))
+    start = clock()
+    list(slow)
+    assert clock() - start == pytest.approx(2.0, abs=0.01)
+    other = scheduler.wrap(chunks(10), scheduler.acquire('other'))
+    start = clock()
+    list(other)
+    assert clock() - start == pytest.approx(2.0, abs=0.01)
+
+def test_shared_file_stream_cap_and_rate(isolated_app, editor_client, fake_bandwidth, monkeypatch):
+    scheduler, clock = fake_bandwidth
+    write_upload('Shared/song.flac', b'f' * 300000)
+    token = create_share(editor_client, 'Shared')
+    monkeypatch.setattr(Config, 'SHARE_MAX_STREAMS', 1)
+    monkeypatch.setattr(Config, 'BANDWIDTH_SHARE_LIMIT', 100000)
+    with isolated_app.test_client() as listener, isolated_app.test_client() as other:
+        page = listener.get(f'/share/{token}').get_data(as_text=True)
+        assert f'/share/{token}/file/song.flac' in page
+        response = listener.get(f'/share/{token}/file/song.flac')
+        assert response.status_code == 200
+        # Un seul flux à la fois sur ce lien
+        assert other.get(f'/share/{token}/file/song.flac').status_code == 429
+        start = clock()
+        assert len(response.get_data()) == 300000
+        response.close()
+        assert clock() - start == pytest.approx(2.0, abs=0.05)
+        assert scheduler.active_streams(token) == 0
+        partial = other.get(f'/share/{token}/file/song.flac', headers={'Range': 'bytes=0-99'})
+        assert partial.status_code == 206
+        partial.close()
+        assert other.get(f'/share/{token}/file/../../secret.flac').status_code == 404
+    # Les lectures de l'éditeur ne sont pas bornées par le lien
+    start = clock()
+    assert len(editor_client.get('/uploads/Shared/song.flac').get_data()) == 300000
+    assert clock() == start
+
+def test_share_recipient_cannot_bypass_share_routes(isolated_app, editor_client):
+    from services.waveform import get_waveform_store
+    write_upload('Shared/track.wav', make_pcm_wav([0, 100, -100, 0] * 500))
+    token = create_share(editor_client, 'Shared')
+    get_waveform_store().generate(os.path.join(Config.UPLOAD_FOLDER, 'Shared', 'track.wav'), 'Shared/track.wav')
+    with isolated_app.test_client() as listener:
+        page = listener.get(f'/share/{token}').get_data(as_text=True)
+        # La page ne révèle pas le chemin du fichier dans la bibliothèque
+        assert 'Shared/track.wav' not in page
+        assert f'/share/{token}/peaks/track.wav' in page
+        assert listener.get(f'/share/{token}/peaks/track.wav').status_code == 200
+        assert listener.get(f'/share/{token}/peaks/../other.wav').status_code == 404
+        assert listener.get('/uploads/Shared/track.wav').status_code == 403
+        assert listener.get('/peaks/Shared/track.wav').status_code == 403
+
+# Tests des statistiques des liens partagés
+def test_share_analytics_batches_and_panel(isolated_app, editor_client):
+    from services.analytics import get_share_analytics
+    write_upload('Live/intro.flac', b'i' * 5000)
+    write_upload('Live/encore.flac', b'e' * 3000)
+    token = create_share(editor_client, 'Live')
+    analytics = get_share_analytics()
+    with isolated_app.test_client() as listener:
+        listener.get(f'/share/{token}')
+        for url, headers in [(f'/share/{token}/file/intro.flac', {}),
+                             (f'/share/{token}/file/intro.flac', {'Range': 'bytes=4000-'}),
+                             (f'/share/{token}/file/encore.flac', {}),
+                             (f'/share/{token}/zip', {})]:
+            response = listener.get(url, headers=headers)
+            response.get_data()
+            response.close()
+    # Rien n'est écrit avant le lot
+    assert analytics.stats() == {}
+    assert analytics.flush() == 3  # le lien (visites, ZIP) et ses deux morceaux
+    stats = analytics.stats()[token]
+    assert (stats['views'], stats['plays'], stats['downloads']) == (1, 2, 1)
+    assert stats['bytes_sent'] > 5000 + 1000 + 3000
+    assert stats['tracks'][0][0] in ('encore.flac', 'intro.flac')
+
+    page = editor_client.get('/').get_data(as_text=True)
+    assert '👁️ 1' in page and '▶️ 2' in page and 'intro.flac (1)' in page
+
+def test_share_analytics_flush_threshold_and_workers(isolated_app, monkeypatch):
+    from services.analytics import ShareAnalytics
+    monkeypatch.setattr(Config, 'ANALYTICS_FLUSH_EVENTS', 3)
+    db_path = os.path.join(Config.DATA_FOLDER, 'analytics.db')
+    # Deux workers qui écrivent dans la même base
+    first, second = ShareAnalytics(db_path), ShareAnalytics(db_path)
+    first.record('tok', 'a.mp3', plays=1)
+    second.record('tok', 'a.mp3', plays=1, bytes_sent=10)
+    assert first.stats() == {}
+    first.record('tok', views=1)
+    second.record('tok', views=1)
+    first.record('tok', 'a.mp3', bytes_sent=5)  # troisième événement : écriture
+    assert first.stats()['tok']['plays'] == 1
+    second.flush()
+    stats = first.stats()['tok']
+    assert (stats['views'], stats['plays'], stats['bytes_sent']) == (2, 2, 15)
+
+def test_share_analytics_forgotten_with_expired_links(isolated_app):
+    from services.analytics import get_share_analytics
+    from services.link_store import get_link_store
+    from services.expiry import ExpiryScheduler
+    analytics = get_share_analytics()
+    analytics.record('kept', plays=1)
+    analytics.record('gone', 'a.mp3', plays=1)
+    analytics.flush()
+    # Compteurs en attente d'un lien supprimé : jamais écrits
+    analytics.record('gone', 'a.mp3', plays=1)
+    analytics.record('deleted', views=1)
+    analytics.forget(['deleted'])
+    analytics.flush()
+    assert set(analytics.stats()) == {'kept', 'gone'}
+
+    now = 1_000_000.0
+    _add_link(get_link_store(), 'gone', now - 1)
+    _add_link(get_link_store(), 'kept', now + 30)
+    ExpiryScheduler(clock=lambda: now).run_once()
+    assert set(analytics.stats()) == {'kept'}
+
+def test_share_analytics_flush_after_forget(isolated_app, monkeypatch):
+    from services.analytics import ShareAnalytics, get_share_analytics
+    analytics = get_share_analytics()
+    other = ShareAnalytics(analytics.db.db_path)
+    analytics.record('tok', plays=1)
+    other.record('tok', 'a.mp3', plays=1)
+
+    # Lien supprimé entre l'échange des compteurs et leur écriture
+    real_transaction = analytics.db.transaction
+    def transaction():
+        monkeypatch.setattr(analytics.db, 'transaction', real_transaction)
+        analytics.forget(['tok'])
+        return real_transaction()
+    monkeypatch.setattr(analytics.db, 'transaction', transaction)
+    analytics.flush()
+    assert analytics.stats() == {}
+    # Compteurs restés en mémoire dans un autre worker
+    other.flush()
+    assert analytics.stats() == {}
+
+def test_usage_scan_and_incremental_updates(editor_client):
+    from services.jobs import get_job_queue
+    from services.usage import get_usage_index
+    write_upload('Album/CD1/a.mp3', b'x' * 100)
+    write_upload('Album/b.mp3', b'x' * 50)
+    write_upload('root.mp3', b'x' * 10)
+    usage = get_usage_index()
+    assert usage.scan() == [160, 3]
+    assert usage.get('Album') == (150, 2)
+    assert usage.children('') == {'Album': (150, 2)}
+
+    form_upload(editor_client, 'Album/CD1', 'c.mp3', b'y' * 40)
+    assert usage.get('Album/CD1') == (140, 2)
+    assert usage.get('') == (200, 4)
+    editor_client.post('/Album', data={'delete_item': 'b.mp3'})
+    assert usage.get('Album') == (140, 2)
+
+    editor_client.post('/api/jobs/move', json={'source': 'Album/CD1', 'destination': 'Disc'})
+    get_job_queue().run_pending()
+    assert usage.get('Album') == (0, 0)
+    assert usage.get('Disc') == (140, 2)
+    editor_client.post('/', data={'delete_item': 'Disc', 'recursive': '1'})
+    get_job_queue().run_pending()
+    assert usage.get('') == (10, 1)
+    assert usage.children('') == {'Album': (0, 0)}
+
+def test_upload_quota_rejected_before_writing(editor_client, monkeypatch):
+    from services.usage import get_usage_index
+    write_upload('Podcasts/a.mp3', b'x' * 1000)
+    get_usage_index().scan()
+    monkeypatch.setattr(Config, 'FOLDER_QUOTAS', {'Podcasts': 1500})
+
+    rv = editor_client.post('/Podcasts', data={'file': (io.BytesIO(b'y' * 1000), 'b.mp3')},
+                            content_type='multipart/form-data')
+    assert rv.status_code == 507
+    assert not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, 'Podcasts', 'b.mp3'))
+    rv = editor_client.post('/api/uploads', json={'path': 'Podcasts', 'filename': 'b.mp3', 'size': 1000})
+    assert rv.status_code == 507
+    assert 'Quota' in rv.get_json()['error']
+    # Ailleurs, seul le quota global s'applique
+    form_upload(editor_client, '', 'c.mp3', b'y' * 1000)
+    monkeypatch.setattr(Config, 'QUOTA_TOTAL_BYTES', 2500)
+    rv = editor_client.post('/api/uploads', json={'filename': 'd.mp3', 'size': 1000})
+    assert rv.status_code == 507
+    assert editor_client.post('/api/uploads', json={'filename': 'd.mp3', 'size': 400}).status_code == 201
+
+def test_concurrent_uploads_reserve_quota(editor_client, monkeypatch):
+    from services.usage import get_usage_index
+    os.makedirs(os.path.join(Config.UPLOAD_FOLDER, 'Podcasts'))
+    monkeypatch.setattr(Config, 'FOLDER_QUOTAS', {'Podcasts': 1500})
+    # Deux envois démarrés en même temps : le second compte la place du premier
+    first = start_chunked_upload(editor_client, 'a.mp3', 1000, 'Podcasts')
+    rv = editor_client.post('/api/uploads', json={'path': 'Podcasts', 'filename': 'b.mp3', 'size': 1000})
+    assert rv.status_code == 507
+    assert os.listdir(os.path.join(Config.UPLOAD_FOLDER, 'Podcasts')) == ['.' + first + '.partial']
+
+    # Annulé : la place est libérée
+    assert editor_client.delete(f'/api/uploads/{first}').status_code == 204
+    second = start_chunked_upload(editor_client, 'b.mp3', 1000, 'Podcasts')
+    # Terminé : la réservation devient de l'espace occupé
+    assert editor_client.put(f'/api/uploads/{second}?offset=0', data=b'x' * 1000).get_json()['complete']
+    assert get_usage_index().get('Podcasts') == (1000, 1)
+    rv = editor_client.post('/api/uploads', json={'path': 'Podcasts', 'filename': 'c.mp3', 'size': 600})
+    assert rv.status_code == 507
+
+    # Envoi abandonné : sa réservation est ignorée après UPLOAD_RESERVATION_TTL
+    monkeypatch.setattr(Config, 'UPLOAD_RESERVATION_TTL', -1)
+    start_chunked_upload(editor_client, 'c.mp3', 500, 'Podcasts')
+    start_chunked_upload(editor_client, 'd.mp3', 500, 'Podcasts')
+
+def test_form_upload_requires_content_length(editor_client):
+    body = (b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.mp3"\r\n\r\n'
+            + AUDIO_BYTES + b'\r\n--x--\r\n')
+    rv = editor_client.post('/', input_stream=io.BytesIO(body), content_type='multipart/form-data; boundary=x',
+                            headers={'Transfer-Encoding': 'chunked'})
+    assert rv.status_code == 411
+    assert not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, 'a.mp3'))
+
+def test_listing_shows_folder_sizes(editor_client):
+    from services.usage import get_usage_index
+    write_upload('Album/a.mp3', b'x' * 2048)
+    write_upload('Album/b.mp3', b'x' * 2048)
+    get_usage_index().scan()
+    html = editor_client.get('/').data.decode()
+    assert 'data-folder-size="4096"' in html
+    assert '4.0 Ko · 2 fichiers' in html
+
+def test_assets_build_purges_and_hashes(tmp_path):
+    import gzip
+    from services import assets
+    source = tmp_path / 'app.css'
+    source.write_text("""/* commentaire de l'auteur */
+:root { --x: 1px; }
+.btn , .unused-a { color : red ; }
+.btn:hover { content: "a  b"; }
+.unused-b .btn { color: blue; }
+.hover\\:bg-base-300:hover { color: green; }
+@media (min-width: 640px) { .unused-c { top: 0; } .card > p { margin: 0; } }
+@keyframes spin { to { rotate: 1turn; } }
+""")
+    template = tmp_path / 'page.html'
+    template.write_text('<div class="card hover:bg-base-300">{% if x %}btn{% endif %}</div>')
+    output = tmp_path / 'dist'
+
+    manifest = assets.build(str(output), {'app.css': str(source)}, [str(template)])
+    name = manifest['assets']['app.css']
+    css = (output / name).read_text()
+    assert css == (':root{--x:1px}.btn{color:red}.btn:hover{content:"a  b"}'
+                   '.hover\\:bg-base-300:hover{color:green}@media (min-width:640px){.card>p{margin:0}}'
+                   '@keyframes spin{to{rotate:1turn}}')
+    assert name == f'app.{hashlib.sha256(css.encode()).hexdigest()[:12]}.css'
+    assert gzip.decompress((output / (name + '.gz')).read_bytes()).decode() == css
+    assert json.loads((output / 'manifest.json').read_text()) == manifest
+
+def test_assets_served_precompressed_and_immutable(isolated_app):
+    client = isolated_app.test_client()
+    html = client.get('/').data.decode()
+    assert 'cdn.jsdelivr.net' not in html and 'tailwindcss' not in html
+    href = re.search(r'href="(/assets/app\.[0-9a-f]{12}\.css)"', html).group(1)
+    path = os.path.join(Config.ASSETS_FOLDER, href.rsplit('/', 1)[1])
+    # Variante brotli (module optionnel) simulée
+    with open(path + '.br', 'wb') as f:
+        f.write(b'brotli')
+
+    rv = client.get(href)
+    assert rv.status_code == 200 and rv.headers.get('Content-Encoding') is None
+    assert rv.mimetype == 'text/css'
+    assert '.card{' in rv.get_data(as_text=True) and '.btn-warning' not in rv.get_data(as_text=True)
+    assert 'immutable' in rv.headers['Cache-Control'] and 'max-age=31536000' in rv.headers['Cache-Control']
+    assert 'Accept-Encoding' in rv.headers['Vary']
+    rv = client.get(href, headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    rv = client.get(href, headers={'Accept-Encoding': 'gzip, br'})
+    assert rv.headers['Content-Encoding'] == 'br' and rv.data == b'brotli'
+    assert client.get(href + '.gz').status_code == 404
+    assert client.get('/assets/manifest.json').status_code == 404
+
+def test_assets_rebuilt_when_sources_change(isolated_app, monkeypatch, tmp_path):
+    from services import assets
+    source = tmp_path / 'app.css'
+    source.write_text('.card { color: red; }')
+    monkeypatch.setattr(assets, 'SOURCES', {'app.css': str(source)})
+    first = assets.ensure_built()
+    assert assets.ensure_built() == first
+    source.write_text('.card { color: blue; }')
+    second = assets.ensure_built()
+    assert second['assets'] != first['assets']
+    # L'ancienne version reste servie aux pages déjà en cache
+    assert os.path.isfile(os.path.join(Config.ASSETS_FOLDER, first['assets']['app.css']))